@@ -0,0 +1,49 @@
+"""
+Executes many I/O bound operations (simulated with sleep) one after the other, with async_execute, and from a
+coroutine operation that yields all of them at once.
+
+Usage:
+    python benchmarks/bench_async.py [n]
+"""
+from __future__ import print_function
+
+import sys
+import time
+from timeit import default_timer
+
+from fito import as_operation
+from fito.operation_runner import OperationRunner
+
+
+@as_operation()
+def read(i):
+    time.sleep(0.05)
+    return i
+
+
+@as_operation()
+def read_all(n):
+    values = yield [read(i) for i in xrange(n)]
+    yield sum(values)
+
+
+def measure(name, func):
+    start = default_timer()
+    func()
+    elapsed = default_timer() - start
+    print('{:<30}{:>12.1f} ms'.format(name, elapsed * 1000))
+
+
+def main(n=32):
+    runner = OperationRunner()
+    operations = [read(i) for i in xrange(n)]
+
+    measure('execute', lambda: [runner.execute(op) for op in operations])
+    measure('async_execute', lambda: [e.get() for e in [runner.async_execute(op) for op in operations]])
+    measure('coroutine', lambda: runner.execute(read_all(n)))
+
+
+if __name__ == '__main__':
+    # Re import this file as a module, otherwise operations would live in __main__
+    import bench_async
+    bench_async.main(*map(int, sys.argv[1:]))
@@ -0,0 +1,77 @@
+"""
+Compares loading the keys of a store one by one with Spec.dict2spec against Spec.dicts2specs (the way data stores
+call it, trusting the keys they wrote).
+
+The keys mimic a hyper parameter sweep: every spec has its own parameters, but the input and model subspecs are
+shared by many of them.
+
+Usage:
+    python benchmarks/bench_bulk_decode.py [n] [processes]
+"""
+from __future__ import print_function
+
+import sys
+from multiprocessing import Pool
+from timeit import default_timer
+
+from fito import Spec, SpecField, PrimitiveField
+from fito.specs.fields import NumericField
+
+
+class Input(Spec):
+    path = PrimitiveField(0)
+    columns = PrimitiveField(default=None)
+
+
+class Model(Spec):
+    name = PrimitiveField(0)
+    alpha = NumericField(default=1.0)
+    fit_intercept = PrimitiveField(default=True)
+
+
+class Experiment(Spec):
+    input = SpecField(base_type=Input)
+    model = SpecField(base_type=Model)
+    seed = NumericField(0)
+    fold = NumericField(1, default=0)
+
+
+def build_dicts(n):
+    inputs = [Input('data_{}.csv'.format(i), columns=['a', 'b', 'c']) for i in xrange(5)]
+    models = [Model('model_{}'.format(i), alpha=i / 10.) for i in xrange(20)]
+    return [
+        Experiment(i, i % 10, input=inputs[i % len(inputs)], model=models[i % len(models)]).to_dict()
+        for i in xrange(n)
+    ]
+
+
+def measure(name, func, n):
+    start = default_timer()
+    res = func()
+    elapsed = default_timer() - start
+    assert len(res) == n
+    print('{:<30}{:>12.0f} specs/s'.format(name, n / elapsed))
+    return res
+
+
+def main(n=20000, processes=4):
+    dicts = build_dicts(n)
+
+    expected = measure('dict2spec', lambda: [Spec.dict2spec(d) for d in dicts], n)
+    res = measure('dicts2specs', lambda: list(Spec.dicts2specs(dicts)), n)
+    assert res == expected
+    res = measure('dicts2specs (trusted)', lambda: list(Spec.dicts2specs(dicts, trusted=True)), n)
+    assert res == expected
+
+    pool = Pool(processes)
+    try:
+        res = measure('dicts2specs ({} processes)'.format(processes), lambda: list(Spec.dicts2specs(dicts, pool=pool)), n)
+        assert res == expected
+    finally:
+        pool.terminate()
+
+
+if __name__ == '__main__':
+    # Re import this file as a module, otherwise specs would live in __main__ and could not be loaded back
+    import bench_bulk_decode
+    bench_bulk_decode.main(*map(int, sys.argv[1:]))
@@ -0,0 +1,60 @@
+"""
+Replays a workload of results of very different sizes (a few small hot ones that are read often, and scans of big
+results that are read once) against the caches: bounded by number of entries like the old FifoCache, and bounded by
+bytes with each policy. Reports the hit rate, the estimated bytes held at the end, and the time per access.
+
+Usage:
+    python benchmarks/bench_cache.py [n_accesses] [budget_mb]
+"""
+from __future__ import print_function
+
+import sys
+from random import Random
+from timeit import default_timer
+
+from fito.cache import FIFOCache, LRUCache, TwoQueueCache, estimate_size
+from fito.operation_runner import FifoCache
+
+
+def get_workload(n, rnd):
+    hot = range(20)
+    res = []
+    next_cold = 1000
+    while len(res) < n:
+        if rnd.random() < 0.98:
+            res.append(rnd.choice(hot))
+        else:
+            # A scan
+            res.extend(xrange(next_cold, next_cold + 50))
+            next_cold += 50
+    return res[:n]
+
+
+def get_value(key):
+    # The hot results are small, the scanned ones are big
+    return [float(key) + i for i in xrange(500 if key < 1000 else 5000)]
+
+
+def replay(name, cache, workload):
+    start = default_timer()
+    for key in workload:
+        if cache.get(key) is None:
+            cache.set(key, get_value(key))
+    elapsed = default_timer() - start
+
+    held = sum(estimate_size(get_value(key)) for key in cache.values)
+    print('{:<20}{:>10.1%} hits{:>10.1f} MB{:>10.1f} us/access'.format(
+        name, cache.hits / float(len(workload)), held / 1e6, elapsed / len(workload) * 1e6
+    ))
+
+
+def main(n=20000, budget_mb=4):
+    workload = get_workload(n, Random(42))
+
+    replay('FifoCache(500)', FifoCache(500), workload)
+    for cls in LRUCache, FIFOCache, TwoQueueCache:
+        replay('{}({} MB)'.format(cls.__name__, budget_mb), cls(max_bytes=budget_mb * 10 ** 6), workload)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
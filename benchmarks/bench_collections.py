@@ -0,0 +1,57 @@
+"""
+Measures the serialization of specs with large collection fields, which goes through recursive_map: a SpecCollection
+with thousands of specs, and args / kwargs holding large nested lists and tuples of specs and numbers.
+
+Usage:
+    python benchmarks/bench_collections.py [n]
+"""
+from __future__ import print_function
+
+import sys
+from timeit import default_timer
+
+from fito import Spec, PrimitiveField
+from fito.specs.fields import SpecCollection, ArgsField, KwargsField
+from fito.specs.utils import recursive_map
+
+
+class Point(Spec):
+    x = PrimitiveField(0)
+    y = PrimitiveField(1)
+
+
+class Cloud(Spec):
+    points = SpecCollection(0)
+
+
+class Table(Spec):
+    rows = ArgsField()
+    columns = KwargsField()
+
+
+def measure(name, func, n):
+    start = default_timer()
+    for _ in xrange(n):
+        func()
+    elapsed = default_timer() - start
+    print('{:<35}{:>12.1f} ops/s'.format(name, n / elapsed))
+
+
+def main(n=20):
+    cloud = Cloud([Point(i, i) for i in xrange(5000)])
+    # Nested lists with a few specs, most of the values are numbers
+    table = Table(
+        *[[float(i * j) for j in xrange(100)] + [Point(i, 0)] for i in xrange(300)],
+        **{'c{}'.format(i): [[j, j + 1] for j in xrange(300)] for i in xrange(10)}
+    )
+    large_tuple = tuple(xrange(20000))
+
+    measure('to_dict, 5000 specs', cloud.to_dict, n)
+    measure('to_dict, nested lists', table.to_dict, n)
+    measure('recursive_map, 20000 tuple', lambda: recursive_map(large_tuple, lambda x: x), n)
+
+
+if __name__ == '__main__':
+    # Re import this file as a module, otherwise specs would live in __main__ and could not be loaded back
+    import bench_collections
+    bench_collections.main(*map(int, sys.argv[1:]))
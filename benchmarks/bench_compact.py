@@ -0,0 +1,101 @@
+"""
+Measures the memory taken by each instance of regular and compact specs, using the field shapes of the models in
+fito/model/scikit_learn.py (which are defined again here, so sklearn is not needed).
+
+The values of the fields are shared between instances (small ints, interned strings, etc), so only the instance, its
+`__dict__` and its caches are accounted. Both the fresh instances and the ones whose key and digest were computed
+(e.g. after going through a data store) are measured.
+
+Usage:
+    python benchmarks/bench_compact.py
+"""
+from __future__ import print_function
+
+import sys
+
+from fito import PrimitiveField
+from fito.operations.operation import Operation
+
+
+class LinearRegression(Operation):
+    fit_intercept = PrimitiveField(default=True)
+    normalize = PrimitiveField(default=False)
+    copy_X = PrimitiveField(default=True)
+    n_jobs = PrimitiveField(default=1)
+
+
+class LogisticRegression(Operation):
+    penalty = PrimitiveField(default='l2')
+    dual = PrimitiveField(default=False)
+    tol = PrimitiveField(default=1e-4)
+    C = PrimitiveField(default=1.0)
+    fit_intercept = PrimitiveField(default=True)
+    intercept_scaling = PrimitiveField(default=1)
+    class_weight = PrimitiveField(default=None)
+    random_state = PrimitiveField(default=None)
+    solver = PrimitiveField(default='liblinear')
+    max_iter = PrimitiveField(default=100)
+    multi_class = PrimitiveField(default='ovr')
+    verbose = PrimitiveField(default=0)
+    warm_start = PrimitiveField(default=False)
+    n_jobs = PrimitiveField(default=1)
+
+
+class GradientBoostingClassifier(Operation):
+    loss = PrimitiveField(default='deviance')
+    learning_rate = PrimitiveField(default=0.1)
+    n_estimators = PrimitiveField(default=100)
+    subsample = PrimitiveField(default=1.0)
+    min_samples_split = PrimitiveField(default=2)
+    min_samples_leaf = PrimitiveField(default=1)
+    min_weight_fraction_leaf = PrimitiveField(default=0.)
+    max_depth = PrimitiveField(default=3)
+    init = PrimitiveField(default=None)
+    random_state = PrimitiveField(default=None)
+    max_features = PrimitiveField(default=None)
+    verbose = PrimitiveField(default=0)
+    max_leaf_nodes = PrimitiveField(default=None)
+    warm_start = PrimitiveField(default=False)
+    presort = PrimitiveField(default='auto')
+
+
+def instance_size(spec):
+    if type(spec).compact:
+        # The key is not memoized
+        res = sys.getsizeof(spec)
+        caches = [getattr(spec, '_digest', None)]
+    else:
+        res = sys.getsizeof(spec) + sys.getsizeof(spec.__dict__)
+        caches = [spec.__dict__.get('_key'), spec.__dict__.get('_digest')]
+
+    return res + sum(sys.getsizeof(e) for e in caches if e is not None)
+
+
+def main():
+    print('{:<30}{:>8}{:>10}{:>10}{:>12}{:>10}{:>10}'.format(
+        'class', 'fields', 'regular', 'compact', 'saved', 'regular*', 'compact*'
+    ))
+
+    for cls in LinearRegression, LogisticRegression, GradientBoostingClassifier:
+        compact_cls = type(cls.__name__, (cls,), {'compact': True, '__module__': __name__})
+
+        sizes = []
+        for klass in cls, compact_cls:
+            spec = klass()
+            fresh = instance_size(spec)
+            spec.key, spec.digest
+            sizes.append((fresh, instance_size(spec)))
+
+        (regular, regular_cached), (compact, compact_cached) = sizes
+        print('{:<30}{:>8}{:>10}{:>10}{:>11.0f}%{:>10}{:>10}'.format(
+            cls.__name__, len(cls._field_table.fields), regular, compact, 100. * (regular - compact) / regular,
+            regular_cached, compact_cached
+        ))
+
+    print('* after computing the key and the digest (sizes in bytes)')
+
+
+if __name__ == '__main__':
+    # Re import this file as a module, otherwise specs would live in __main__
+    import bench_compact
+    bench_compact.main()
@@ -0,0 +1,69 @@
+"""
+Compares the generic Spec code paths against the generated ones (`compiled = True`) on the spec shapes used by
+tests/test_spec.py
+
+Usage:
+    python benchmarks/bench_compiled.py [n]
+"""
+from __future__ import print_function
+
+import os
+import sys
+from timeit import default_timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests'))
+
+from fito import Spec
+from test_spec import SpecA, SpecB, SpecC, SpecD, SpecWithDefault, compiled_classes
+
+
+def cases(classes):
+    a, b, c, d, w = [classes[e] for e in (SpecA, SpecB, SpecC, SpecD, SpecWithDefault)]
+    return [
+        ('SpecA(0)', lambda: a(0)),
+        ('SpecA(1, field2=2)', lambda: a(1, field2=2)),
+        ('SpecB(spec_a=SpecA(0))', lambda: b(spec_a=a(0))),
+        ('SpecC([SpecA(0)] * 4)', lambda: c([a(0)] * 4)),
+        ('SpecD(4, a=1)', lambda: d(4, a=1)),
+        ('SpecWithDefault()', lambda: w()),
+    ]
+
+
+def timeit(func, n):
+    start = default_timer()
+    for _ in xrange(n):
+        func()
+    return n / (default_timer() - start)
+
+
+def main(n=20000):
+    identity = {cls: cls for cls in compiled_classes}
+
+    print('{:<28}{:>14}{:>14}{:>10}'.format('construction', 'generic/s', 'compiled/s', 'speedup'))
+    for (name, generic), (_, compiled) in zip(cases(identity), cases(compiled_classes)):
+        generic_ops = timeit(generic, n)
+        compiled_ops = timeit(compiled, n)
+        print('{:<28}{:>14.0f}{:>14.0f}{:>9.1f}x'.format(name, generic_ops, compiled_ops, compiled_ops / generic_ops))
+
+    print()
+    print('{:<28}{:>14}{:>14}{:>10}'.format('to_dict / _from_dict', 'generic/s', 'compiled/s', 'speedup'))
+    for (name, generic), (_, compiled) in zip(cases(identity), cases(compiled_classes)):
+        generic_spec = generic()
+        compiled_spec = compiled()
+        generic_dict = generic_spec.to_dict()
+        compiled_dict = compiled_spec.to_dict()
+
+        for what, generic_func, compiled_func in [
+            ('to_dict', generic_spec.to_dict, compiled_spec.to_dict),
+            ('_from_dict', lambda: type(generic_spec)._from_dict(generic_dict),
+             lambda: type(compiled_spec)._from_dict(compiled_dict)),
+        ]:
+            generic_ops = timeit(generic_func, n)
+            compiled_ops = timeit(compiled_func, n)
+            print('{:<28}{:>14.0f}{:>14.0f}{:>9.1f}x'.format(
+                '{} {}'.format(name.split('(')[0], what), generic_ops, compiled_ops, compiled_ops / generic_ops
+            ))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
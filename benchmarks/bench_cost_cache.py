@@ -0,0 +1,59 @@
+"""
+Executes a random mix of slow operations with small results and fast operations with big results through runners
+whose execute caches have the same byte budget: LRU against GreedyDual-Size, which weighs the apply times recorded by
+the runner. Reports the total time and how many applies were needed.
+
+Usage:
+    python benchmarks/bench_cost_cache.py [n_executions] [budget_mb]
+"""
+from __future__ import print_function
+
+import sys
+import time
+from random import Random
+from timeit import default_timer
+
+from fito import Operation
+from fito.operation_runner import OperationRunner
+from fito.planner import execution_stats
+from fito.specs.fields import NumericField
+
+
+class Slow(Operation):
+    i = NumericField(0)
+
+    def apply(self, runner):
+        time.sleep(0.01)
+        return [float(self.i + j) for j in xrange(100)]
+
+
+class Fast(Operation):
+    i = NumericField(0)
+
+    def apply(self, runner):
+        return [float(self.i + j) for j in xrange(20000)]
+
+
+def measure(policy, workload, budget_mb):
+    execution_stats.clear()
+    runner = OperationRunner(execute_cache_bytes=budget_mb * 10 ** 6, execute_cache_policy=policy)
+    start = default_timer()
+    for op in workload:
+        runner.execute(op)
+    elapsed = default_timer() - start
+    print('{:<10}{:>12.1f} ms{:>8} applies'.format(policy, elapsed * 1000, runner.execute_cache.misses))
+
+
+def main(n=1000, budget_mb=10):
+    rnd = Random(42)
+    operations = [Slow(i) for i in xrange(50)] + [Fast(i) for i in xrange(200)]
+    workload = [rnd.choice(operations) for _ in xrange(n)]
+
+    for policy in 'lru', 'gds':
+        measure(policy, workload, budget_mb)
+
+
+if __name__ == '__main__':
+    # Re import this file as a module, otherwise operations would live in __main__
+    import bench_cost_cache
+    bench_cost_cache.main(*map(int, sys.argv[1:]))
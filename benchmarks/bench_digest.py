@@ -0,0 +1,52 @@
+"""
+Compares the cost of hashing every spec of an operation chain using the json key against the digest.
+
+Every level of the chain is hashed (like the operation runner does when it checks the caches of each dependency),
+the key serializes the whole subtree for each level, while the digest reuses the cached digests of the subspecs.
+
+Usage:
+    python benchmarks/bench_digest.py [depth ...]
+"""
+from __future__ import print_function
+
+import sys
+from timeit import default_timer
+
+from fito import PrimitiveField, Spec, SpecField
+from fito.specs.fields import NumericField
+
+
+class Step(Spec):
+    previous = SpecField(default=None)
+    value = NumericField(0)
+    name = PrimitiveField(default='step')
+
+
+def chain(depth):
+    res = [Step(0)]
+    for i in xrange(1, depth):
+        res.append(Step(i, previous=res[-1]))
+    return res
+
+
+def hash_all(specs, attr):
+    start = default_timer()
+    for spec in specs:
+        getattr(spec, attr)
+    return default_timer() - start
+
+
+def main(*depths):
+    depths = depths or (10, 100, 500)
+
+    print('{:<10}{:>12}{:>12}{:>10}'.format('depth', 'key (s)', 'digest (s)', 'speedup'))
+    for depth in depths:
+        key_time = hash_all(chain(depth), 'key')
+        digest_time = hash_all(chain(depth), 'digest')
+        print('{:<10}{:>12.4f}{:>12.4f}{:>9.1f}x'.format(depth, key_time, digest_time, key_time / digest_time))
+
+
+if __name__ == '__main__':
+    # Re import this file as a module, otherwise specs would live in __main__
+    import bench_digest
+    bench_digest.main(*map(int, sys.argv[1:]))
@@ -0,0 +1,59 @@
+"""
+Runs a sweep where half of the experiments are cached in a FileDataStore whose similarity index is enabled: calling
+execute in a loop against execute_many, serially and in parallel.
+
+Usage:
+    python benchmarks/bench_execute_many.py [n] [cached_fraction]
+"""
+from __future__ import print_function
+
+import sys
+import tempfile
+from shutil import rmtree
+from timeit import default_timer
+
+from fito import Operation
+from fito.data_store.file import FileDataStore
+from fito.operation_runner import OperationRunner
+from fito.specs.fields import NumericField
+
+
+class Experiment(Operation):
+    some_parameter = NumericField(0)
+
+    def apply(self, runner):
+        return sum(i % 7 for i in xrange(2000)) + self.some_parameter
+
+
+def measure(name, n, cached_fraction, run):
+    path = tempfile.mktemp()
+    try:
+        ds = FileDataStore(path)
+        experiments = [Experiment(p, out_data_store=ds) for p in xrange(n)]
+        for experiment in experiments[:int(n * cached_fraction)]:
+            ds[experiment] = experiment.apply(None)
+        # Build the similarity index, so that saves append to its journal
+        ds.find_similar(experiments[0])
+
+        runner = OperationRunner()
+        start = default_timer()
+        results = run(runner, experiments)
+        elapsed = default_timer() - start
+        assert results == [experiment.apply(None) for experiment in experiments]
+        print('{:<30}{:>12.1f} ms'.format(name, elapsed * 1000))
+    finally:
+        rmtree(path)
+
+
+def main(n=500, cached_fraction=0.5):
+    measure('execute, one by one', n, cached_fraction, lambda runner, ops: [runner.execute(op) for op in ops])
+    measure('execute_many', n, cached_fraction, lambda runner, ops: list(runner.execute_many(ops)))
+    measure(
+        'execute_many, parallel', n, cached_fraction, lambda runner, ops: list(runner.execute_many(ops, parallel=True))
+    )
+
+
+if __name__ == '__main__':
+    # Re import this file as a module, otherwise operations would live in __main__ and could not be loaded back
+    import bench_execute_many
+    bench_execute_many.main(*map(int, sys.argv[1:2]) + map(float, sys.argv[2:]))
@@ -0,0 +1,54 @@
+"""
+Measures the time of `import fito` on fresh interpreters, and fails when its median goes over a budget.
+
+Short lived processes (command line tools, workers) pay it on every start, so the optional backends (mongo, yaml, the
+interactive rehash UI) must be imported when they are used, not by `import fito`.
+
+Usage:
+    python benchmarks/bench_import.py [budget_ms] [runs]
+"""
+from __future__ import print_function
+
+import json
+import os
+import subprocess
+import sys
+
+# Modules that `import fito` must not import
+heavy_modules = ['bson', 'pymongo', 'gridfs', 'yaml', 'cmd2', 'pandas', 'numpy']
+
+script = """
+import json, sys, time
+start = time.time()
+import fito
+elapsed = time.time() - start
+print(json.dumps({{'elapsed': elapsed, 'heavy': sorted(m for m in {} if sys.modules.get(m) is not None)}}))
+""".format(heavy_modules)
+
+
+def measure():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([root, os.environ.get('PYTHONPATH', '')]))
+    output = subprocess.check_output([sys.executable, '-c', script], env=env)
+    return json.loads(output.splitlines()[-1])
+
+
+def main(budget_ms=60, runs=15):
+    results = [measure() for _ in xrange(runs)]
+    times = sorted(r['elapsed'] * 1000 for r in results)
+    median = times[len(times) // 2]
+
+    print('{:<30}{:>12.1f} ms'.format('import fito (median)', median))
+    print('{:<30}{:>12.1f} ms'.format('import fito (min)', times[0]))
+    print('{:<30}{:>12.1f} ms'.format('budget', budget_ms))
+
+    heavy = results[0]['heavy']
+    if heavy: print('Heavy modules imported by fito: {}'.format(', '.join(heavy)))
+
+    if median > budget_ms or heavy:
+        print('Over budget')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
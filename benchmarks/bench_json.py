@@ -0,0 +1,51 @@
+"""
+Measures the json work that fito does for the keys of the specs of benchmarks/bench_specs.py (key generation, key
+parsing and the canonical encoding behind the digest), plus a json.dumps / json.loads workload that has nothing to do
+with fito, to check that importing fito doesn't slow down the rest of the process.
+
+Usage:
+    python benchmarks/bench_json.py [n]
+"""
+from __future__ import print_function
+
+import json
+import sys
+from datetime import datetime
+from timeit import default_timer
+
+from fito import Spec
+from fito.specs.base import _digest
+
+
+def measure(name, func, items):
+    start = default_timer()
+    for item in items:
+        func(item)
+    elapsed = default_timer() - start
+    print('{:<30}{:>12.0f} ops/s'.format(name, len(items) / elapsed))
+
+
+def main(n=5000):
+    import bench_specs
+    spec_dicts = [bench_specs.build(i).to_dict() for i in xrange(n)]
+    for i, spec_dict in enumerate(spec_dicts):
+        if i % 2 == 0: spec_dict['d'] = datetime(2017, 1, 1, i % 24)
+    keys = [Spec._dict2key(d) for d in spec_dicts]
+
+    measure('key generation', Spec._dict2key, spec_dicts)
+    measure('key parsing', Spec.key2dict, keys)
+    measure('canonical digest', _digest, spec_dicts)
+
+    # Plain documents, like the ones any other library of the process would handle
+    docs = [{'id': i, 'name': 'user {}'.format(i), 'tags': ['a', 'b', 'c'], 'scores': [i * 0.5, i * 1.5],
+             'active': i % 2 == 0, 'address': {'street': 'main', 'number': i}} for i in xrange(n)]
+    strings = [json.dumps(doc) for doc in docs]
+
+    measure('unrelated json.dumps', json.dumps, docs)
+    measure('unrelated json.loads', json.loads, strings)
+
+
+if __name__ == '__main__':
+    # Re import this file as a module, otherwise specs would live in __main__ and could not be loaded back
+    import bench_json
+    bench_json.main(*map(int, sys.argv[1:]))
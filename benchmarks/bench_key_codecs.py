@@ -0,0 +1,47 @@
+"""
+Compares the key codecs on the specs of benchmarks/bench_specs.py: encode, decode and mmh3 hash throughput, the cost
+of the repeated get_key calls of a data store lookup, and the size of the keys.
+
+Usage:
+    python benchmarks/bench_key_codecs.py [n]
+"""
+from __future__ import print_function
+
+import sys
+from timeit import default_timer
+
+import mmh3
+
+from fito.specs.key_codec import JSONKeyCodec, BinaryKeyCodec
+
+
+def measure(name, func, items):
+    start = default_timer()
+    for item in items:
+        func(item)
+    elapsed = default_timer() - start
+    print('{:<30}{:>12.0f} ops/s'.format(name, len(items) / elapsed))
+
+
+def main(n=5000):
+    import bench_specs
+    specs = [bench_specs.build(i) for i in xrange(n)]
+    spec_dicts = [spec.to_dict() for spec in specs]
+
+    for codec in JSONKeyCodec(), BinaryKeyCodec():
+        name = type(codec).__name__
+        keys = [codec.encode(d) for d in spec_dicts]
+
+        measure('{} encode'.format(name), codec.encode, spec_dicts)
+        measure('{} decode'.format(name), codec.decode, keys)
+        measure('{} hash'.format(name), mmh3.hash, keys)
+
+        # Data stores ask for the key of a spec several times on each lookup
+        measure('{} get_key x3'.format(name), lambda spec: [codec.get_key(spec) for _ in xrange(3)], specs)
+        print('{:<30}{:>12.0f} bytes'.format('{} key size'.format(name), sum(map(len, keys)) / float(n)))
+
+
+if __name__ == '__main__':
+    # Re import this file as a module, otherwise specs would live in __main__ and could not be loaded back
+    import bench_key_codecs
+    bench_key_codecs.main(*map(int, sys.argv[1:]))
@@ -0,0 +1,61 @@
+"""
+Executes a model fed by several independent feature loaders, which block on I/O (simulated with sleep), with the
+serial OperationRunner and with the ThreadPoolRunner.
+
+Usage:
+    python benchmarks/bench_parallel.py [n_features] [n_threads]
+"""
+from __future__ import print_function
+
+import sys
+import time
+from timeit import default_timer
+
+from fito import as_operation
+from fito.operation_runner import OperationRunner
+from fito.operations.operation import Operation, OperationField
+from fito.parallel import ThreadPoolRunner
+from fito.specs.fields import SpecCollection
+
+
+@as_operation()
+def load_feature(i):
+    time.sleep(0.05)
+    return i
+
+
+class Train(Operation):
+    features = SpecCollection(0)
+
+    def apply(self, runner):
+        return sum(runner.execute(feature) for feature in self.features)
+
+
+@as_operation(model=OperationField, feature=OperationField)
+def evaluate(model, feature):
+    return model * feature
+
+
+def measure(name, runner, operation):
+    start = default_timer()
+    runner.execute(operation)
+    elapsed = default_timer() - start
+    print('{:<30}{:>12.1f} ms'.format(name, elapsed * 1000))
+
+
+def main(n_features=16, n_threads=8):
+    features = [load_feature(i) for i in xrange(n_features)]
+    # Two levels: the model needs every feature, the evaluation needs the model and a feature of its own
+    operation = evaluate(Train(features), load_feature(n_features))
+
+    measure('OperationRunner', OperationRunner(), operation)
+
+    runner = ThreadPoolRunner(n_threads=n_threads)
+    measure('ThreadPoolRunner ({} threads)'.format(n_threads), runner, operation)
+    runner.close()
+
+
+if __name__ == '__main__':
+    # Re import this file as a module, otherwise operations would live in __main__
+    import bench_parallel
+    bench_parallel.main(*map(int, sys.argv[1:]))
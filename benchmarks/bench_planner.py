@@ -0,0 +1,66 @@
+"""
+Finds out which experiments of a sweep are already cached in a FileDataStore with large results: loading them one at
+a time, checking `experiment in data_store` one at a time, and OperationRunner.plan.
+
+Usage:
+    python benchmarks/bench_planner.py [n] [cached_fraction]
+"""
+from __future__ import print_function
+
+import sys
+import tempfile
+from shutil import rmtree
+from timeit import default_timer
+
+from fito import Operation
+from fito.data_store.file import FileDataStore
+from fito.operation_runner import OperationRunner
+from fito.specs.fields import NumericField, SpecCollection
+
+
+class Experiment(Operation):
+    some_parameter = NumericField(0)
+
+    def apply(self, runner):
+        return [float(self.some_parameter)] * 5000
+
+
+class Sweep(Operation):
+    experiments = SpecCollection(0)
+
+    def apply(self, runner):
+        return [runner.execute(experiment) for experiment in self.experiments]
+
+
+def measure(name, func):
+    start = default_timer()
+    res = func()
+    elapsed = default_timer() - start
+    print('{:<30}{:>12.1f} ms'.format(name, elapsed * 1000))
+    return res
+
+
+def main(n=500, cached_fraction=0.9):
+    path = tempfile.mktemp()
+    try:
+        ds = FileDataStore(path)
+        experiments = [Experiment(p, out_data_store=ds) for p in xrange(n)]
+        for experiment in experiments[:int(n * cached_fraction)]:
+            ds[experiment] = experiment.apply(None)
+
+        sweep = Sweep(experiments)
+        # Digests are computed once per spec, whatever reads them first; leave them out of the measures
+        hash(sweep)
+        runner = OperationRunner()
+        loaded = measure('get_or_none, one by one', lambda: [ds.get_or_none(exp) is not None for exp in experiments])
+        one_by_one = measure('in data store, one by one', lambda: [exp in ds for exp in experiments])
+        plan = measure('plan', lambda: runner.plan(sweep))
+        assert loaded == one_by_one == [plan[exp].is_hit for exp in experiments]
+    finally:
+        rmtree(path)
+
+
+if __name__ == '__main__':
+    # Re import this file as a module, otherwise operations would live in __main__ and could not be loaded back
+    import bench_planner
+    bench_planner.main(*map(int, sys.argv[1:2]) + map(float, sys.argv[2:]))
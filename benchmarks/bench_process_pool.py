@@ -0,0 +1,68 @@
+"""
+CPU bound sweep over experiments, in the style of examples/interactive_rehash: every experiment burns some CPU and
+is cached on a FileDataStore. Compares the serial OperationRunner, the ThreadPoolRunner (bound by the GIL) and the
+ProcessPoolRunner with an increasing number of processes. Speedups are bounded by the cores of the machine.
+
+Usage:
+    python benchmarks/bench_process_pool.py [n_experiments] [max_processes]
+"""
+from __future__ import print_function
+
+import sys
+import tempfile
+from shutil import rmtree
+from timeit import default_timer
+
+from fito import Operation
+from fito.data_store.file import FileDataStore
+from fito.operation_runner import OperationRunner
+from fito.parallel import ThreadPoolRunner, ProcessPoolRunner
+from fito.specs.fields import NumericField, SpecCollection
+
+
+class Experiment(Operation):
+    some_parameter = NumericField(0)
+
+    def apply(self, runner):
+        res = 0
+        for i in xrange(300000):
+            res += (i * self.some_parameter) % 7
+        return res
+
+
+class Sweep(Operation):
+    experiments = SpecCollection(0)
+
+    def apply(self, runner):
+        return [runner.execute(experiment) for experiment in self.experiments]
+
+
+def measure(name, runner, n):
+    path = tempfile.mktemp()
+    try:
+        ds = FileDataStore(path)
+        sweep = Sweep([Experiment(p, out_data_store=ds) for p in xrange(n)])
+
+        start = default_timer()
+        runner.execute(sweep)
+        elapsed = default_timer() - start
+        print('{:<30}{:>12.1f} ms'.format(name, elapsed * 1000))
+    finally:
+        if hasattr(runner, 'close'): runner.close()
+        rmtree(path)
+
+
+def main(n=32, max_processes=8):
+    measure('OperationRunner', OperationRunner(), n)
+    measure('ThreadPoolRunner', ThreadPoolRunner(), n)
+
+    n_processes = 1
+    while n_processes <= max_processes:
+        measure('ProcessPoolRunner ({})'.format(n_processes), ProcessPoolRunner(n_processes=n_processes), n)
+        n_processes *= 2
+
+
+if __name__ == '__main__':
+    # Re import this file as a module, otherwise operations would live in __main__ and could not be loaded back
+    import bench_process_pool
+    bench_process_pool.main(*map(int, sys.argv[1:]))
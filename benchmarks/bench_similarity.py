@@ -0,0 +1,64 @@
+"""
+Compares find_similar on a store with many entries: the full scan that it used to do (matching_fields and dict2spec
+on every key) against the exact and the approximate similarity indices.
+
+Usage:
+    python benchmarks/bench_similarity.py [n] [queries]
+"""
+from __future__ import print_function
+
+import sys
+from timeit import default_timer
+
+from fito import Spec
+from fito.data_store.dict_ds import DictDataStore
+from fito.specs.utils import matching_fields
+
+
+def scan_similar(ds, spec):
+    res = []
+    spec_dict = spec.to_dict()
+    for _, other_spec_dict in ds.iterkeys(raw=True):
+        similarity = matching_fields(spec_dict, other_spec_dict)
+        if similarity > 0:
+            res.append((Spec.dict2spec(other_spec_dict, trusted=True), similarity))
+    res.sort(key=lambda x: -x[1])
+    return res
+
+
+def measure(name, func, items):
+    start = default_timer()
+    for item in items:
+        func(item)
+    elapsed = default_timer() - start
+    print('{:<30}{:>12.1f} ms/op'.format(name, elapsed * 1000 / len(items)))
+
+
+def main(n=20000, queries=20):
+    import bench_specs
+    specs = [bench_specs.build(i) for i in xrange(n)]
+    # Specs that are not in the stores, but are similar to the ones that are
+    query_specs = [bench_specs.build(i).replace(f05='z') for i in xrange(0, n, n // queries)]
+
+    exact = DictDataStore()
+    approximate = DictDataStore(approximate_similarity=True)
+    for ds in exact, approximate:
+        for spec in specs:
+            ds[spec] = 1
+
+    measure('full scan', lambda spec: scan_similar(exact, spec), query_specs[:2])
+    measure('exact index build', lambda ds: ds.get_similarity_index(), [exact])
+    measure('exact index, top 10', lambda spec: exact.find_similar(spec, n=10), query_specs)
+    measure('approximate index build', lambda ds: ds.get_similarity_index(), [approximate])
+    measure('approximate index, top 10', lambda spec: approximate.find_similar(spec, n=10), query_specs)
+
+    recall = sum(
+        approximate.find_similar(spec, n=1)[0][1] == exact.find_similar(spec, n=1)[0][1] for spec in query_specs
+    )
+    print('{:<30}{:>12.2f}'.format('approximate top 1 recall', recall / float(len(query_specs))))
+
+
+if __name__ == '__main__':
+    # Re import this file as a module, otherwise specs would live in __main__ and could not be loaded back
+    import bench_similarity
+    bench_similarity.main(*map(int, sys.argv[1:]))
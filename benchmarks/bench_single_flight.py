@@ -0,0 +1,62 @@
+"""
+Several threads, and then several processes sharing a FileDataStore, execute the same expensive operation at the same
+moment. Reports how many times it was applied and the total time.
+
+Usage:
+    python benchmarks/bench_single_flight.py [n_callers]
+"""
+from __future__ import print_function
+
+import sys
+import tempfile
+import threading
+from multiprocessing import Process, Value
+from shutil import rmtree
+from timeit import default_timer
+
+from fito import Operation
+from fito.data_store.file import FileDataStore
+from fito.specs.fields import NumericField
+
+applied = Value('i', 0)
+
+
+class Expensive(Operation):
+    some_parameter = NumericField(0)
+
+    def apply(self, runner):
+        with applied.get_lock():
+            applied.value += 1
+
+        res = 0
+        for i in xrange(2000000):
+            res += i % 7
+        return res
+
+
+def measure(name, workers):
+    applied.value = 0
+    start = default_timer()
+    for worker in workers: worker.start()
+    for worker in workers: worker.join()
+    elapsed = default_timer() - start
+    print('{:<20}{:>12.1f} ms{:>8} applies'.format(name, elapsed * 1000, applied.value))
+
+
+def main(n=8):
+    measure('threads', [threading.Thread(target=Expensive(0).execute) for _ in xrange(n)])
+
+    path = tempfile.mktemp()
+    try:
+        ds = FileDataStore(path)
+        ds.lease_poll_interval = 0.01
+        op = Expensive(1, out_data_store=ds)
+        measure('processes', [Process(target=op.execute) for _ in xrange(n)])
+    finally:
+        rmtree(path)
+
+
+if __name__ == '__main__':
+    # Re import this file as a module, otherwise operations would live in __main__
+    import bench_single_flight
+    bench_single_flight.main(*map(int, sys.argv[1:]))
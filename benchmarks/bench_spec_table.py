@@ -0,0 +1,68 @@
+"""
+Finds the fields that vary across a sweep stored in a data store, and groups the results by one of them: comparing
+every spec against the first one with Spec.diff, against a SpecTable built from the raw keys of the store.
+
+Usage:
+    python benchmarks/bench_spec_table.py [n]
+"""
+from __future__ import print_function
+
+import sys
+import tempfile
+from collections import defaultdict
+from shutil import rmtree
+from timeit import default_timer
+
+from fito.data_store.file import FileDataStore
+from fito.specs.table import SpecTable
+
+
+def diff_varying_fields(ds):
+    varying = set()
+    first = None
+    groups = defaultdict(list)
+    for spec in ds.iterkeys():
+        if first is None:
+            first = spec
+            continue
+
+        diff = spec.diff(first)
+        for subdiff in getattr(diff, 'subdiffs', [diff]):
+            prefix = subdiff.field + '.' if subdiff.field else ''
+            varying.update(prefix + k for k in subdiff.changed_fields)
+        groups[spec.f00].append(ds[spec])
+    return varying, groups
+
+
+def table_varying_fields(ds):
+    table = SpecTable.from_data_store(ds, results='result')
+    scores = table.column('result')
+    groups = {values: [scores[i] for i in rows] for values, rows in table.group_by('f00').iteritems()}
+    return set(table.varying_fields()), groups
+
+
+def measure(name, func, ds):
+    start = default_timer()
+    func(ds)
+    elapsed = default_timer() - start
+    print('{:<30}{:>12.1f} ms'.format(name, elapsed * 1000))
+
+
+def main(n=5000):
+    import bench_specs
+    path = tempfile.mktemp()
+    try:
+        ds = FileDataStore(path)
+        for i in xrange(n):
+            ds[bench_specs.build(i)] = i
+
+        measure('Spec.diff against the first', diff_varying_fields, ds)
+        measure('SpecTable', table_varying_fields, ds)
+    finally:
+        rmtree(path)
+
+
+if __name__ == '__main__':
+    # Re import this file as a module, otherwise specs would live in __main__ and could not be loaded back
+    import bench_spec_table
+    bench_spec_table.main(*map(int, sys.argv[1:]))
@@ -0,0 +1,84 @@
+"""
+Micro-benchmark for Spec construction and serialization throughput.
+
+Builds nested specs with more than 20 fields and reports how many of them can be constructed, serialized with
+to_dict and loaded back with dict2spec per second.
+
+Usage:
+    python benchmarks/bench_specs.py [n]
+"""
+from __future__ import print_function
+
+import sys
+from timeit import default_timer
+
+from fito import Spec, SpecField, PrimitiveField
+from fito.specs.fields import NumericField, SpecCollection
+
+
+class Leaf(Spec):
+    a = NumericField(0)
+    b = NumericField(1, default=1)
+    c = PrimitiveField(2, default='c')
+    d = PrimitiveField(default=None)
+    e = PrimitiveField(default=False, serialize=False)
+
+
+class Wide(Spec):
+    f00 = NumericField(0)
+    f01 = NumericField(1)
+    f02 = NumericField(2)
+    f03 = NumericField(3)
+    f04 = NumericField(4)
+    f05 = PrimitiveField(default='a')
+    f06 = PrimitiveField(default='b')
+    f07 = PrimitiveField(default='c')
+    f08 = PrimitiveField(default='d')
+    f09 = PrimitiveField(default='e')
+    f10 = NumericField(default=10)
+    f11 = NumericField(default=11)
+    f12 = NumericField(default=12)
+    f13 = NumericField(default=13)
+    f14 = NumericField(default=14)
+    f15 = PrimitiveField(default=None)
+    f16 = PrimitiveField(default=None)
+    f17 = PrimitiveField(default=None)
+    f18 = PrimitiveField(default=None, serialize=False)
+    f19 = PrimitiveField(default=None, serialize=False)
+    left = SpecField(base_type=Leaf)
+    right = SpecField(base_type=Leaf)
+    leaves = SpecCollection(default=[])
+
+
+def build(i):
+    return Wide(
+        i, i + 1, i + 2, i + 3, i + 4,
+        f10=i,
+        left=Leaf(i),
+        right=Leaf(i, 2, 'x'),
+        leaves=[Leaf(j) for j in xrange(3)]
+    )
+
+
+def measure(name, func, n):
+    start = default_timer()
+    for i in xrange(n):
+        func(i)
+    elapsed = default_timer() - start
+    print('{:<25}{:>12.0f} ops/s'.format(name, n / elapsed))
+
+
+def main(n=2000):
+    spec = build(0)
+    spec_dict = spec.to_dict()
+
+    measure('construction', build, n)
+    measure('to_dict', lambda i: spec.to_dict(), n)
+    measure('to_dict(include_all)', lambda i: spec.to_dict(include_all=True), n)
+    measure('dict2spec', lambda i: Spec.dict2spec(spec_dict), n)
+
+
+if __name__ == '__main__':
+    # Re import this file as a module, otherwise specs would live in __main__ and could not be loaded back
+    import bench_specs
+    bench_specs.main(*map(int, sys.argv[1:]))
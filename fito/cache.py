@@ -0,0 +1,425 @@
+"""
+Memory caches for the results of the operations, used by :py:attr:`fito.operation_runner.OperationRunner.execute_cache`
+and :py:attr:`fito.data_store.base.BaseDataStore.get_cache`.
+
+The caches are bounded by number of entries, by estimated bytes or both, and count their hits, misses and evictions.
+The policy that picks what to evict is given by the class: :py:class:`LRUCache`, :py:class:`FIFOCache`,
+:py:class:`TwoQueueCache` or :py:class:`GreedyDualSizeCache`, which weighs the time the results took to compute.
+
+Sizes are estimated with :py:func:`estimate_size`, which knows about numpy arrays and pandas objects, and can be
+extended for other types with :py:func:`register_size_estimator`.
+"""
+import heapq
+import sys
+import threading
+from collections import OrderedDict
+from itertools import count, islice
+
+from fito.planner import execution_stats
+from fito.specs.base import Spec, dict_digest
+
+# Items of a container that are looked at to estimate its size
+_sample_size = 100
+
+# Containers deeper than this are estimated shallowly
+_max_depth = 4
+
+# (type, function) pairs, see register_size_estimator
+_size_estimators = []
+
+# Types whose size is given by sys.getsizeof
+_atom_types = {int, long, float, bool, str, unicode, type(None)}
+
+# Seconds assumed for the results whose apply time was not recorded, they are kept as if they were expensive
+unknown_cost = 1.0
+
+
+def register_size_estimator(cls, estimator):
+    """
+    Makes estimate_size use `estimator(obj)` for the instances of `cls`. The estimators registered later win
+    """
+    _size_estimators.insert(0, (cls, estimator))
+
+
+def estimate_size(obj, depth=0):
+    """
+    Estimated bytes taken by `obj`. The sizes of the containers are extrapolated from a sample of their items
+    """
+    for cls, estimator in _size_estimators:
+        if isinstance(obj, cls): return estimator(obj)
+
+    if type(obj) in _atom_types: return sys.getsizeof(obj)
+
+    # numpy and pandas are optional, if they were not imported obj can't be one of their objects
+    numpy = sys.modules.get('numpy')
+    if numpy is not None and isinstance(obj, numpy.ndarray):
+        res = sys.getsizeof(obj) if obj.base is None else obj.nbytes
+        if obj.dtype == object and obj.size > 0:
+            res += _sampled_size(obj.ravel(), obj.size, depth)
+        return res
+
+    pandas = sys.modules.get('pandas')
+    if pandas is not None and isinstance(obj, (pandas.DataFrame, pandas.Series, pandas.Index)):
+        res = obj.memory_usage(deep=True)
+        # DataFrames give a Series with the usage of each column
+        return int(res.sum()) if hasattr(res, 'sum') else int(res)
+
+    res = sys.getsizeof(obj)
+    if depth >= _max_depth: return res
+
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        res += _sampled_size(obj, len(obj), depth)
+    elif isinstance(obj, dict):
+        res += _sampled_size(obj.iterkeys(), len(obj), depth) + _sampled_size(obj.itervalues(), len(obj), depth)
+    elif hasattr(obj, '__dict__') and not isinstance(obj, type):
+        res += estimate_size(obj.__dict__, depth + 1)
+    return res
+
+
+def _sampled_size(items, n_items, depth):
+    if n_items == 0: return 0
+
+    if isinstance(items, (list, tuple)) and n_items > _sample_size:
+        # Evenly spaced, the first items are not always representative
+        sample = items[::n_items // _sample_size]
+    else:
+        sample = list(islice(items, _sample_size))
+
+    total = sum(estimate_size(e, depth + 1) for e in sample)
+    return total * n_items // len(sample)
+
+
+class Cache(object):
+    """
+    Base class of the caches. The subclasses implement the policy: which entry is evicted when the cache is full.
+
+    :param max_entries: Maximum number of entries, 0 means no bound
+    :param max_bytes: Maximum sum of the estimated sizes of the values, 0 means no bound. Values bigger than this are
+        not cached
+    :param size_estimator: Function that gives the bytes of a value, only used when max_bytes is set
+    """
+
+    # Whether the policy needs the sizes of the values even when max_bytes is not set
+    weigh_sizes = False
+
+    def __init__(self, max_entries=0, max_bytes=0, size_estimator=estimate_size, verbose=False):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size_estimator = size_estimator
+        self.verbose = verbose
+
+        # key -> (value, size)
+        self.values = {}
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+        self.lock = threading.RLock()
+
+    def _get_key(self, spec_or_dict):
+        if isinstance(spec_or_dict, Spec):
+            return spec_or_dict.digest
+        elif isinstance(spec_or_dict, dict):
+            return dict_digest(spec_or_dict)
+        else:
+            # assume it's an id
+            return spec_or_dict
+
+    def get(self, spec):
+        """
+        :return: The cached value of `spec`, None when it's not cached
+        """
+        try:
+            return self[spec]
+        except KeyError:
+            return None
+
+    def __getitem__(self, spec):
+        key = self._get_key(spec)
+        with self.lock:
+            if key not in self.values:
+                self.misses += 1
+                raise KeyError(spec)
+
+            self.hits += 1
+            if self.verbose: print "Cache hit!"
+            self._touch(key)
+            return self.values[key][0]
+
+    def __contains__(self, spec):
+        """
+        Checks whether `spec` is cached, without counting it as an access
+        """
+        return self._get_key(spec) in self.values
+
+    def __len__(self):
+        return len(self.values)
+
+    def set(self, spec, value):
+        key = self._get_key(spec)
+        size = self._get_size(spec, value) if self.max_bytes or self.weigh_sizes else 0
+
+        with self.lock:
+            if key in self.values: self._pop(key)
+            if self.max_bytes and size > self.max_bytes: return
+
+            self.values[key] = value, size
+            self.bytes += size
+            self._insert(key, size, spec)
+
+            while self._is_full():
+                victim = self._victim()
+                if self.verbose: print "Cache eviction!"
+                self.evictions += 1
+                self._pop(victim, evicted=True)
+
+    def remove(self, spec):
+        with self.lock:
+            key = self._get_key(spec)
+            if key in self.values: self._pop(key)
+
+    def clear(self):
+        with self.lock:
+            for key in self.values.keys():
+                self._pop(key)
+
+    def stats(self):
+        """
+        :return: A dict with the hits, misses, evictions, entries and bytes of the cache
+        """
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.values),
+                'bytes': self.bytes,
+            }
+
+    def _is_full(self):
+        if self.max_entries and len(self.values) > self.max_entries: return True
+        return self.max_bytes and self.bytes > self.max_bytes
+
+    def _get_size(self, spec, value):
+        if self.size_estimator is not estimate_size or not isinstance(spec, (Spec, dict)):
+            return self.size_estimator(value)
+
+        # Estimated once per result, and recorded for the rest of the caches and the stats
+        size = execution_stats.get_size(spec)
+        if size is None:
+            size = estimate_size(value)
+            execution_stats.record_size(spec, size)
+        return size
+
+    def _pop(self, key, evicted=False):
+        _, size = self.values.pop(key)
+        self.bytes -= size
+        self._discard(key, size, evicted)
+
+    def _insert(self, key, size, spec):
+        """
+        Called when a key is added
+        """
+        raise NotImplementedError()
+
+    def _touch(self, key):
+        """
+        Called on the hits of a key
+        """
+        raise NotImplementedError()
+
+    def _victim(self):
+        """
+        :return: The key to evict
+        """
+        raise NotImplementedError()
+
+    def _discard(self, key, size, evicted):
+        """
+        Called when a key is removed
+        """
+        raise NotImplementedError()
+
+
+class FIFOCache(Cache):
+    """
+    Evicts the entries in the order they were added
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(FIFOCache, self).__init__(*args, **kwargs)
+        # Keys, the first one is the next to evict
+        self.queue = OrderedDict()
+
+    def _insert(self, key, size, spec):
+        self.queue[key] = None
+
+    def _touch(self, key):
+        pass
+
+    def _victim(self):
+        return next(iter(self.queue))
+
+    def _discard(self, key, size, evicted):
+        del self.queue[key]
+
+
+class LRUCache(FIFOCache):
+    """
+    Evicts the least recently used entry
+    """
+
+    def _touch(self, key):
+        del self.queue[key]
+        self.queue[key] = None
+
+
+class TwoQueueCache(Cache):
+    """
+    The 2Q policy: new entries go into a FIFO queue, and the ones that are used again, while they are in it or soon
+    after leaving it, move to a LRU queue. A scan of many entries that are used once does not evict the ones that are
+    used often.
+
+    :param in_fraction: Part of the cache, in entries or in bytes, taken by the FIFO queue of new entries
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.in_fraction = kwargs.pop('in_fraction', 0.25)
+        super(TwoQueueCache, self).__init__(*args, **kwargs)
+        # Entries seen once, FIFO
+        self.a_in = OrderedDict()
+        self.a_in_entries = self.a_in_bytes = 0
+        # Entries seen again, LRU
+        self.a_main = OrderedDict()
+        # Keys recently evicted from a_in, without their values
+        self.a_out = OrderedDict()
+
+    def _insert(self, key, size, spec):
+        if key in self.a_out:
+            del self.a_out[key]
+            self.a_main[key] = None
+        else:
+            self.a_in[key] = None
+            self.a_in_entries += 1
+            self.a_in_bytes += size
+
+    def _touch(self, key):
+        if key in self.a_main:
+            del self.a_main[key]
+        else:
+            del self.a_in[key]
+            self.a_in_entries -= 1
+            self.a_in_bytes -= self.values[key][1]
+        self.a_main[key] = None
+
+    def _victim(self):
+        if self.a_in and (self._a_in_is_full() or not self.a_main):
+            return next(iter(self.a_in))
+        return next(iter(self.a_main))
+
+    def _a_in_is_full(self):
+        if self.max_bytes: return self.a_in_bytes > self.in_fraction * self.max_bytes
+        return self.a_in_entries > self.in_fraction * self.max_entries
+
+    def _discard(self, key, size, evicted):
+        if key in self.a_main:
+            del self.a_main[key]
+            return
+
+        del self.a_in[key]
+        self.a_in_entries -= 1
+        self.a_in_bytes -= size
+
+        if evicted:
+            # Remember it for a while, if it's added again it goes to a_main
+            self.a_out[key] = None
+            while len(self.a_out) > max(len(self.values) // 2, 1):
+                self.a_out.popitem(last=False)
+
+
+class GreedyDualSizeCache(Cache):
+    """
+    The GreedyDual-Size policy: the priority of an entry is the time its result took to compute over its size, plus an
+    inflation that grows with the evictions, so that the entries that are not used age. The entry with the lowest
+    priority is evicted: a small result that took an hour to compute outlives a big one that took a second. A new
+    entry whose priority is the lowest is evicted right away.
+
+    :param cost_function: Gives the seconds a spec took to compute, or None when it's unknown. By default the times
+        recorded by :py:data:`fito.planner.execution_stats`
+    """
+    weigh_sizes = True
+
+    def __init__(self, *args, **kwargs):
+        self.cost_function = kwargs.pop('cost_function', get_recorded_cost)
+        super(GreedyDualSizeCache, self).__init__(*args, **kwargs)
+        self.inflation = 0.0
+        # key -> cost per byte
+        self.densities = {}
+        # key -> (priority, id of its heap entry)
+        self.priorities = {}
+        # (priority, id, key) entries, the ones that are not in self.priorities are stale
+        self.heap = []
+        self.ids = count()
+
+    def _insert(self, key, size, spec):
+        self.densities[key] = cost_per_byte(self.cost_function(spec), size)
+        self._push(key)
+
+    def _touch(self, key):
+        self._push(key)
+
+    def _push(self, key):
+        entry = self.inflation + self.densities[key], next(self.ids), key
+        self.priorities[key] = entry[:2]
+        heapq.heappush(self.heap, entry)
+
+        if len(self.heap) > 2 * len(self.priorities) + 100:
+            self.heap = [priority + (key,) for key, priority in self.priorities.iteritems()]
+            heapq.heapify(self.heap)
+
+    def _victim(self):
+        while True:
+            priority, entry_id, key = self.heap[0]
+            if self.priorities.get(key) == (priority, entry_id): break
+            heapq.heappop(self.heap)
+
+        self.inflation = priority
+        return key
+
+    def _discard(self, key, size, evicted):
+        del self.densities[key]
+        del self.priorities[key]
+
+
+def get_recorded_cost(spec):
+    """
+    :return: The seconds that `spec` took to compute according to :py:data:`fito.planner.execution_stats`, None when
+        they are unknown
+    """
+    if not isinstance(spec, (Spec, dict)): return None
+    return execution_stats.get_cost(spec)
+
+
+def cost_per_byte(cost, size):
+    """
+    Priority of the GreedyDual-Size policy, without the inflation. Unknown costs are taken as `unknown_cost`
+    """
+    if cost is None: cost = unknown_cost
+    return max(cost, 1e-6) / max(size, 1)
+
+
+policies = {
+    'lru': LRUCache,
+    'fifo': FIFOCache,
+    '2q': TwoQueueCache,
+    'gds': GreedyDualSizeCache,
+}
+
+
+def make_cache(policy='lru', max_entries=0, max_bytes=0, verbose=False):
+    """
+    :param policy: 'lru', 'fifo', '2q' or 'gds'
+    :return: A cache, None if it's not bounded at all
+    """
+    if not max_entries and not max_bytes: return None
+    if policy not in policies:
+        raise ValueError('Unknown cache policy {!r}, use one of {}'.format(policy, ', '.join(sorted(policies))))
+    return policies[policy](max_entries=max_entries, max_bytes=max_bytes, verbose=verbose)
@@ -1,6 +1,32 @@
+import importlib
+import sys
+from types import ModuleType
+
 from file import FileDataStore
-try:
-    from mongo import MongoHashMap
-except ImportError:
-    pass
-from dict_ds import DictDataStore
\ No newline at end of file
+from dict_ds import DictDataStore
+
+# Backends with heavy dependencies, they are imported the first time they are accessed
+_lazy_backends = {
+    'MongoHashMap': 'fito.data_store.mongo',
+}
+
+
+class _DataStorePackage(ModuleType):
+    def __getattr__(self, name):
+        if name not in _lazy_backends:
+            raise AttributeError("'module' object has no attribute '{}'".format(name))
+
+        res = getattr(importlib.import_module(_lazy_backends[name]), name)
+        setattr(self, name, res)
+        return res
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(_lazy_backends))
+
+
+# Python 2 has no module level __getattr__, so the package is replaced by an instance of _DataStorePackage
+_package = _DataStorePackage(__name__, __doc__)
+_package.__dict__.update(sys.modules[__name__].__dict__)
+# Modules clear their globals when they are garbage collected, and the methods above use them
+_package._module = sys.modules[__name__]
+sys.modules[__name__] = _package
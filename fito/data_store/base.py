@@ -1,14 +1,33 @@
 from fito import config
+import os
 import warnings
 from functools import wraps
 
 from fito import Spec
-from fito.data_store.rehash_ui import RehashUI
-from fito.operation_runner import FifoCache, OperationRunner
+from fito.cache import cost_per_byte, get_recorded_cost, make_cache
+from fito.operation_runner import OperationRunner
+from fito.data_store.similarity import SimilarityIndex, LSHSimilarityIndex, spec_features
 from fito.operations.decorate import as_operation
 from fito.specs.base import get_import_path
-from fito.specs.fields import NumericField, PrimitiveField
-from fito.specs.utils import matching_fields
+from fito.specs.fields import NumericField, PrimitiveField, SpecField
+from fito.specs.key_codec import KeyCodec, default_key_codec
+
+
+def get_rehash_ui():
+    """
+    The interactive rehash UI needs cmd2, which is imported only when the UI is used
+    """
+    from fito.data_store.rehash_ui import RehashUI
+    return RehashUI
+
+
+def new_lease_token():
+    """
+    Identifies the owner of a lease, each acquisition gets a new one
+    """
+    # Imported here, like the optional backends, to keep it out of `import fito`
+    import socket
+    return '{}@{}:{}'.format(os.getpid(), socket.gethostname(), os.urandom(16).encode('hex'))
 
 
 class BaseDataStore(OperationRunner):
@@ -21,27 +40,49 @@ class BaseDataStore(OperationRunner):
     """
 
     get_cache_size = NumericField(default=0)
+    get_cache_bytes = NumericField(default=0, serialize=False, help='Bound of the get cache in estimated bytes')
+    get_cache_policy = PrimitiveField(default='lru', serialize=False, help="'lru', 'fifo' or '2q', see fito.cache")
     verbose = PrimitiveField(default=False, serialize=False)
 
+    # How the keys of the specs are encoded, None means JSONKeyCodec
+    key_codec = SpecField(default=None, base_type=KeyCodec, serialize=False)
+
+    # How long the leases taken to compute a spec last, and how often the processes that wait for them poll the store.
+    # See acquire_lease
+    lease_ttl = 3600
+    lease_poll_interval = 1
+    # Whether acquire_lease is implemented, the runners don't take nor renew the leases of the stores without them
+    has_leases = False
+
+    approximate_similarity = PrimitiveField(
+        default=False, serialize=False, help='Whether find_similar should use MinHash / LSH, for very large stores'
+    )
+
     def __init__(self, *args, **kwargs):
         """
         Instances the data store.
 
-        :param get_cache_size: Size of the FIFO cache for serialization
+        :param get_cache_size: Number of entries of the cache of gets, they avoid deserializing the same values again
+        :param get_cache_bytes: Bound of that cache in estimated bytes, see :py:mod:`fito.cache`
         """
         super(BaseDataStore, self).__init__(*args, **kwargs)
-        if self.get_cache_size > 0:
-            self.get_cache = FifoCache(self.get_cache_size)
-        else:
-            self.get_cache = None
+        self.get_cache = make_cache(self.get_cache_policy, self.get_cache_size, self.get_cache_bytes)
 
-    @classmethod
-    def get_key(cls, spec):
-        if isinstance(spec, Spec):
-            return spec.key
-        else:
-            assert isinstance(spec, dict)
-            return Spec._dict2key(spec)
+        # Built on the first call to find_similar, see get_similarity_index
+        self.similarity_index = None
+
+        # digest -> token of the leases held by this process, see acquire_lease
+        self.lease_tokens = {}
+
+    def get_key_codec(self):
+        return self.key_codec or default_key_codec
+
+    def get_key(self, spec):
+        """
+        Full key of a spec, it is what gets persisted. See :py:mod:`fito.specs.key_codec`
+        """
+        assert isinstance(spec, (Spec, dict))
+        return self.get_key_codec().get_key(spec)
 
     def get(self, spec):
         """
@@ -52,7 +93,7 @@ class BaseDataStore(OperationRunner):
                 return self._get(spec)
             except KeyError, e:
                 # TODO: I don't like puting RehashUI.ignored_specs here
-                if config.interactive_rehash and spec not in RehashUI.ignored_specs:
+                if config.interactive_rehash and spec not in get_rehash_ui().ignored_specs:
                     # Interactive rehash has been enabled and this spec has not been processed
                     # Trigger interactive rehash
                     if self.interactive_rehash(spec):
@@ -91,6 +132,13 @@ class BaseDataStore(OperationRunner):
         """
         raise NotImplementedError()
 
+    def save_many(self, items):
+        """
+        Saves many (spec, object) pairs. Stores should implement it with bulk writes, the default saves them one by one
+        """
+        for spec, object in items:
+            self.save(spec, object)
+
     def iteritems(self):
         """
         Iterates over the datastore
@@ -98,13 +146,77 @@ class BaseDataStore(OperationRunner):
         """
         raise NotImplementedError()
 
-    def iterkeys(self, raw=False):
+    def iterkeys(self, raw=False, intern=False, pool=None):
         """
         Iterates over the keys of the data store
         :param raw: Whether to return raw documents or specs
+        :param intern: Whether to intern the returned specs, so the subspecs they have in common are shared.
+            See Spec.intern
+        :param pool: Optional pool used to decode the specs, see Spec.dicts2specs
         """
         raise NotImplementedError()
 
+    def contains_many(self, specs):
+        """
+        Checks which specs are in this store at once. Stores should implement it (or __contains__) without fetching
+        the values
+
+        :return: A list of bools, one per spec
+        """
+        return [spec in self for spec in specs]
+
+    def acquire_lease(self, spec):
+        """
+        Claims the computation of `spec` for this process, so that other processes that share the store wait for its
+        result instead of computing it again. Leases last `lease_ttl` seconds, so the ones of dead processes expire.
+        The runners renew the leases they hold, see renew_lease.
+
+        The default implementation always succeeds, which is enough for stores that live in a single process. The
+        stores that implement it set has_leases
+
+        :return: Whether the lease was acquired, False means that another process holds it
+        """
+        return True
+
+    def renew_lease(self, spec):
+        """
+        Extends a lease held by this process for another `lease_ttl` seconds
+        """
+        pass
+
+    def release_lease(self, spec):
+        pass
+
+    def get_stored_size(self, spec):
+        """
+        Bytes that the value of a spec takes in the store, it should raise KeyError if spec not in self
+        """
+        raise NotImplementedError()
+
+    def collect_garbage(self, max_bytes, cost_function=get_recorded_cost):
+        """
+        Removes the values that took the least time to compute per byte, until the store takes at most `max_bytes`.
+        It's the policy of :py:class:`fito.cache.GreedyDualSizeCache`. The costs are the ones recorded by
+        :py:data:`fito.planner.execution_stats`, load there the stats dumped by the processes that computed them.
+        Stores have to implement get_stored_size
+
+        :return: The removed specs
+        """
+        entries = []
+        total = 0
+        for spec in self.iterkeys():
+            size = self.get_stored_size(spec)
+            total += size
+            entries.append((cost_per_byte(cost_function(spec), size), size, spec))
+
+        res = []
+        for _, size, spec in sorted(entries, key=lambda entry: entry[0]):
+            if total <= max_bytes: break
+            self.remove(spec)
+            total -= size
+            res.append(spec)
+        return res
+
     def remove(self, spec):
         """
         Removes a spec from a data store. Updates the get_cache is necessary
@@ -113,6 +225,7 @@ class BaseDataStore(OperationRunner):
             self.get_cache.remove(spec)
 
         self._remove(spec)
+        self._unindex(spec)
 
     def _remove(self, spec):
         """
@@ -152,30 +265,110 @@ class BaseDataStore(OperationRunner):
                 else:
                     raise e
 
-    def find_similar(self, spec):
-        res = []
-        spec_dict = spec.to_dict() if isinstance(spec, Spec) else spec
-        for id, other_spec_dict in self.iterkeys(raw=True):
-            similarity = matching_fields(spec_dict, other_spec_dict)
+    def find_similar(self, spec, n=None):
+        """
+        Finds the specs of this store that are similar to `spec`, according to
+        :py:func:`fito.specs.utils.matching_fields`. See :py:mod:`fito.data_store.similarity`
 
-            if similarity > 0:
-                try:
-                    res.append((Spec.dict2spec(other_spec_dict), similarity))
-                except:
-                    # TODO: improve how exceptions are risen
-                    res.append((other_spec_dict, similarity))
+        :param n: How many specs to return, None means all the ones with a positive similarity
+        :return: A list of (spec, similarity) pairs sorted by decreasing similarity. The entries that can't be loaded
+            as specs are given as dicts
+        """
+        spec_dict = spec.to_dict() if isinstance(spec, Spec) else spec
+        key_codec = self.get_key_codec()
 
-        res.sort(key=lambda x: -x[1])
+        res = []
+        for key, similarity in self.get_similarity_index().query(spec_dict, n=n):
+            other_spec_dict = key_codec.decode(key)
+            try:
+                res.append((Spec.dict2spec(other_spec_dict, trusted=True), similarity))
+            except:
+                # TODO: improve how exceptions are risen
+                res.append((other_spec_dict, similarity))
 
         return res
 
+    def get_similarity_journal(self):
+        """
+        Where the similarity index is persisted, None means that it lives in memory and is rebuilt on every process.
+        See :py:class:`fito.data_store.similarity.FileJournal`
+        """
+        return None
+
+    def get_similarity_index(self):
+        """
+        The index behind find_similar. It's loaded from the similarity journal, or built with a scan of the store
+        the first time
+        """
+        if self.similarity_index is None:
+            index = LSHSimilarityIndex() if self.approximate_similarity else SimilarityIndex()
+            journal = self.get_similarity_journal()
+
+            if journal is not None and journal.exists():
+                for key, shape, values in journal.iterfeatures():
+                    index.add_features(key, shape, values)
+            else:
+                for _, spec_dict in self.iterkeys(raw=True):
+                    index.add(self.get_key(spec_dict), spec_dict)
+                if journal is not None: journal.reset(index.iterfeatures())
+
+            self.similarity_index = index
+        return self.similarity_index
+
+    def _index(self, spec):
+        """
+        Adds a spec to the similarity index and its journal, the stores call it after saving
+        """
+        self._index_many([spec])
+
+    def _index_many(self, specs):
+        """
+        Same as _index, with a single write to the journal
+        """
+        # Saves by id don't have the spec at hand
+        specs = [spec for spec in specs if isinstance(spec, (Spec, dict))]
+        if not specs: return
+
+        journal = self.get_similarity_journal()
+        if self.similarity_index is None and (journal is None or not journal.exists()): return
+
+        features = []
+        for spec in specs:
+            spec_dict = spec.to_dict() if isinstance(spec, Spec) else spec
+            key = self.get_key(spec_dict)
+            # Saved again (e.g. by execute on every cache hit), it is already indexed and journaled
+            if self.similarity_index is not None and key in self.similarity_index: continue
+
+            shape, values = spec_features(spec_dict)
+            if self.similarity_index is not None: self.similarity_index.add_features(key, shape, values)
+            features.append((key, shape, values))
+
+        if journal is not None and features: journal.add_many(features)
+
+    def _unindex(self, spec):
+        """
+        Removes a spec from the similarity index and its journal. Removals by id are not reflected, the index would
+        need to fetch the spec
+        """
+        if not isinstance(spec, (Spec, dict)): return
+
+        journal = self.get_similarity_journal()
+        if self.similarity_index is None and (journal is None or not journal.exists()): return
+
+        spec_dict = spec.to_dict() if isinstance(spec, Spec) else spec
+        key = self.get_key(spec_dict)
+
+        if self.similarity_index is not None: self.similarity_index.remove(key, spec_dict)
+        if journal is not None: journal.remove(key)
+
     def interactive_rehash(self, spec):
-        similar = self.find_similar(spec)
+        rehash_ui = get_rehash_ui()
+        similar = self.find_similar(spec, n=rehash_ui.n_similar)
         if similar:
             # Disable interactive rehash functionality
             # This is obviously not thread safe
             config.interactive_rehash = False
-            RehashUI(data_store=self, spec=spec).cmdloop()
+            rehash_ui(data_store=self, spec=spec, similar_specs=similar).cmdloop()
             config.interactive_rehash = True
             return True
         else:
@@ -191,15 +384,12 @@ class AutosavedFunction(as_operation):
         )
 
         class AutosavedOperation(OperationClass):
-            def to_dict(self, include_all=False):
-                res = super(AutosavedOperation, self).to_dict(include_all=include_all)
-
+            @classmethod
+            def get_type_path(cls):
                 if first_arg is not None:
-                    res['type'] = get_import_path(first_arg, func_to_execute.__name__, 'operation_class')
+                    return get_import_path(first_arg, func_to_execute.__name__, 'operation_class')
                 else:
-                    res['type'] = get_import_path(func_to_execute, 'operation_class')
-
-                return res
+                    return get_import_path(func_to_execute, 'operation_class')
 
             def __repr__(self):
                 d = self.to_dict(include_all=True)
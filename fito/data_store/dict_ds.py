@@ -1,4 +1,5 @@
 from fito import Spec
+from fito.cache import estimate_size
 from fito.data_store.base import BaseDataStore
 from fito.specs import base
 
@@ -12,7 +13,10 @@ class DictDataStore(BaseDataStore):
         return self.data.iteritems()
 
     def save(self, spec, object):
+        stored = spec in self.data
         self.data[spec] = object
+        # The stored ones are already indexed
+        if not stored: self._index(spec)
 
     def _get(self, spec):
         if isinstance(spec, dict):
@@ -22,20 +26,26 @@ class DictDataStore(BaseDataStore):
         if spec not in self.data: raise KeyError("Spec not found: {}".format(spec))
         return self.data.get(spec)
 
-    def iterkeys(self, raw=False):
+    def iterkeys(self, raw=False, intern=False, pool=None):
         for key in self.data.iterkeys():
             if raw:
                 yield key, key.to_dict()
+            elif intern:
+                yield key.intern()
             else:
                 yield key
 
     def clean(self):
         self.data = {}
+        self.similarity_index = None
 
     def get_id(self, spec):
         if spec not in self: raise KeyError(spec)
         return spec
 
+    def get_stored_size(self, spec):
+        return estimate_size(self._get(spec))
+
     def _remove(self, spec):
         self.data.pop(spec)
 
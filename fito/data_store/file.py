@@ -1,3 +1,5 @@
+import errno
+import fcntl
 import json
 import mmh3
 import os
@@ -5,15 +7,16 @@ import pickle
 import shutil
 import traceback
 import warnings
+from contextlib import contextmanager
 from time import time, sleep
 
-import yaml
 from fito import PrimitiveField
 from fito import Spec
 from fito import SpecField
 from fito import config
-from fito.data_store.base import BaseDataStore
-from fito.data_store.rehash_ui import RehashUI
+from fito.data_store.base import BaseDataStore, get_rehash_ui, new_lease_token
+from fito.data_store.similarity import FileJournal
+from fito.specs.key_codec import JSONKeyCodec
 
 
 class Serializer(Spec):
@@ -63,6 +66,9 @@ class FileDataStore(BaseDataStore):
     serializer = SpecField(default=None, base_type=Serializer)
     use_class_name = PrimitiveField(default=False, help='Whether the first level should be the class name')
 
+    # See acquire_lease
+    has_leases = True
+
     def __init__(self, *args, **kwargs):
         super(FileDataStore, self).__init__(*args, **kwargs)
 
@@ -70,7 +76,7 @@ class FileDataStore(BaseDataStore):
 
         conf_file = os.path.join(self.path, 'conf.yaml')
         if os.path.exists(conf_file):
-
+            import yaml
             with open(conf_file) as f:
                 conf = yaml.load(f)
 
@@ -90,6 +96,16 @@ class FileDataStore(BaseDataStore):
                     )
                 )
 
+            # Stores created before key codecs existed use json keys, like the ones created without a codec
+            conf_key_codec = Spec.dict2spec(conf['key_codec']) if conf.get('key_codec') else JSONKeyCodec()
+            if self.key_codec is not None and self.key_codec != conf_key_codec:
+                raise RuntimeError(
+                    'This store was initialized with key_codec = {} and now was instanced with {}'.format(
+                        conf_key_codec,
+                        self.key_codec
+                    )
+                )
+
             if self.serializer is not None and self.serializer != conf_serializer:
                 raise RuntimeError(
                     "This store was initialized with this serializer:\n{}\n\n" +
@@ -101,48 +117,161 @@ class FileDataStore(BaseDataStore):
 
             self.serializer = conf_serializer
             self.use_class_name = conf_use_class_name
+            self.key_codec = conf_key_codec
         else:
             if self.serializer is None: self.serializer = PickleSerializer()
-
-            with open(conf_file, 'w') as f:
-                yaml.dump(
-                    {
-                        'serializer': self.serializer.to_dict(),
-                        'use_class_name': self.use_class_name
-                    },
-                    f
-                )
+            if self.key_codec is None: self.key_codec = JSONKeyCodec()
+            self._write_conf()
+
+    def _write_conf(self):
+        import yaml
+        with open(os.path.join(self.path, 'conf.yaml'), 'w') as f:
+            yaml.dump(
+                {
+                    'serializer': self.serializer.to_dict(),
+                    'use_class_name': self.use_class_name,
+                    'key_codec': self.key_codec.to_dict(),
+                },
+                f
+            )
 
     def clean(self, cls=None):
         for op in self.iterkeys():
             if cls is None or (cls is not None and isinstance(op, cls)):
                 self.remove(op)
 
+    def migrate_keys(self, key_codec):
+        """
+        Re encodes the keys of this store with another codec (e.g. to move a store with json keys to
+        :py:class:`BinaryKeyCodec`). The entries are moved to the directories given by their new keys.
+
+        :param key_codec: A :py:class:`fito.specs.key_codec.KeyCodec`
+        """
+        entries = [(subdir, self.key_codec.decode(key)) for subdir, key in self._iter_keys()]
+
+        self.key_codec = key_codec
+        self._write_conf()
+
+        # The similarity index is keyed by the old keys, it gets rebuilt when it's needed
+        self.similarity_index = None
+        journal = self.get_similarity_journal()
+        if journal.exists(): os.unlink(journal.path)
+
+        for old_subdir, spec_dict in entries:
+            subdir = self.get_dir_for_saving(spec_dict)
+            # Both codecs gave the same key
+            if subdir == old_subdir: continue
+
+            for fname in os.listdir(old_subdir):
+                if fname != 'key': os.rename(os.path.join(old_subdir, fname), os.path.join(subdir, fname))
+
+            with open(os.path.join(subdir, 'key'), 'wb') as f:
+                f.write(self.get_key(spec_dict))
+
+            shutil.rmtree(old_subdir)
+            try:
+                os.removedirs(os.path.dirname(old_subdir))
+            except OSError:
+                # Not empty
+                pass
+
+    def _get_lease_path(self, spec):
+        return os.path.join(self.path, 'leases', spec.digest)
+
+    @contextmanager
+    def _leases_lock(self):
+        """
+        Serializes the changes of the leases among processes. It's a flock, so it's released if the process dies
+        """
+        lease_dir = os.path.join(self.path, 'leases')
+        if not os.path.exists(lease_dir):
+            try:
+                os.makedirs(lease_dir)
+            except OSError as e:
+                # Created by another process
+                if e.errno != errno.EEXIST: raise
+
+        fd = os.open(os.path.join(self.path, 'leases.lock'), os.O_CREAT | os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _read_lease_owner(self, path):
+        try:
+            with open(path) as f:
+                return f.read()
+        except IOError as e:
+            if e.errno != errno.ENOENT: raise
+            return None
+
+    def acquire_lease(self, spec):
+        path = self._get_lease_path(spec)
+        with self._leases_lock():
+            if os.path.exists(path):
+                if time() - os.path.getmtime(path) > self.lease_ttl:
+                    # The next attempt can take it
+                    os.unlink(path)
+                return False
+
+            token = new_lease_token()
+            with open(path, 'w') as f:
+                f.write(token)
+            self.lease_tokens[spec.digest] = token
+            return True
+
+    def renew_lease(self, spec):
+        path = self._get_lease_path(spec)
+        token = self.lease_tokens.get(spec.digest)
+        with self._leases_lock():
+            if token is not None and self._read_lease_owner(path) == token: os.utime(path, None)
+
+    def release_lease(self, spec):
+        path = self._get_lease_path(spec)
+        token = self.lease_tokens.pop(spec.digest, None)
+        with self._leases_lock():
+            # It could have expired and be taken by another process
+            if token is not None and self._read_lease_owner(path) == token: os.unlink(path)
+
+    def get_similarity_journal(self):
+        return FileJournal(os.path.join(self.path, 'similarity.journal'))
+
     def _remove(self, op):
         subdir = self._get_subdir(op)
         shutil.rmtree(subdir)
 
-    def iterkeys(self, raw=False):
+    def _iter_keys(self):
         for subdir, _, _ in os.walk(self.path):
             key_fname = os.path.join(subdir, 'key')
             if not os.path.exists(key_fname): continue
 
-            with open(key_fname) as f:
-                key = f.read()
+            with open(key_fname, 'rb') as f:
+                yield subdir, f.read()
 
-            if raw:
-                yield subdir, Spec.key2dict(key)
-            else:
+    def iterkeys(self, raw=False, intern=False, pool=None):
+        key_codec = self.get_key_codec()
+        if raw:
+            for subdir, key in self._iter_keys():
+                yield subdir, key_codec.decode(key)
+            return
+
+        def iter_dicts():
+            for _, key in self._iter_keys():
                 try:
-                    spec = Spec.key2spec(key)
-                except Exception, e:  # there might be a key that is not a valid json
-                    if len(e.args) > 0 and isinstance(e.args[0], basestring) and e.args[0].startswith(
-                            'Unknown spec type'): raise e
+                    yield key_codec.decode(key)
+                except Exception:  # there might be a key that is not a valid json
                     traceback.print_exc()
-                    warnings.warn('Unable to load spec key: {}'.format(key))
-                    continue
+                    warnings.warn('Unable to load spec key: {!r}'.format(key))
 
-                yield spec
+        def on_error(spec_dict, e):
+            if len(e.args) > 0 and isinstance(e.args[0], basestring) and e.args[0].startswith(
+                    'Unknown spec type'): raise e
+            traceback.print_exc()
+            warnings.warn('Unable to load spec key: {}'.format(spec_dict))
+
+        for spec in Spec.dicts2specs(iter_dicts(), pool=pool, on_error=on_error, intern=intern, trusted=True):
+            yield spec
 
     def get_id(self, spec):
         try:
@@ -150,6 +279,10 @@ class FileDataStore(BaseDataStore):
         except RuntimeError:
             raise KeyError(spec)
 
+    def get_stored_size(self, spec):
+        subdir = self._get_subdir(spec)
+        return sum(os.path.getsize(os.path.join(subdir, fname)) for fname in os.listdir(subdir))
+
     def iteritems(self):
         for op in self.iterkeys():
             try:
@@ -190,6 +323,7 @@ class FileDataStore(BaseDataStore):
         dir = self._get_dir(spec)
         if not os.path.exists(dir): raise KeyError("Spec not found")
 
+        spec_key = self.get_key(spec)
         subdirs = os.listdir(dir)
         for subdir in subdirs:
             subdir = os.path.join(dir, subdir)
@@ -197,14 +331,14 @@ class FileDataStore(BaseDataStore):
             key_fname = os.path.join(subdir, 'key')
             if not os.path.exists(key_fname): continue
 
-            with open(key_fname) as f:
+            with open(key_fname, 'rb') as f:
                 key = f.read()
 
             if len(key) == 0 and time() - os.path.getctime(key_fname) < 0.1:
                 sleep(0.1)
-                with open(key_fname) as f:
+                with open(key_fname, 'rb') as f:
                     key = f.read()
-            if key == self.get_key(spec) and self.serializer.exists(subdir): break
+            if key == spec_key and self.serializer.exists(subdir): break
         else:
             raise KeyError("Spec not found")
 
@@ -232,13 +366,14 @@ class FileDataStore(BaseDataStore):
             else:
                 raise RuntimeError()
 
+        spec_key = self.get_key(spec)
         for subdir in os.listdir(dir):
             subdir = os.path.join(dir, subdir)
             key_fname = os.path.join(subdir, 'key')
             if not os.path.exists(key_fname): continue
-            with open(key_fname) as f:
+            with open(key_fname, 'rb') as f:
                 key = f.read()
-            if key == spec.key:
+            if key == spec_key:
                 return subdir
         else:
             while True:
@@ -259,6 +394,18 @@ class FileDataStore(BaseDataStore):
                 return subdir
 
     def save(self, spec, obj):
+        if self._save(spec, obj): self._index(spec)
+
+    def save_many(self, items):
+        # The similarity journal is appended once
+        self._index_many([spec for spec, obj in items if self._save(spec, obj)])
+
+    def _save(self, spec, obj):
+        """
+        Writes the key and the object of a spec
+
+        :return: Whether it was saved and it wasn't stored before, the stored specs are already indexed
+        """
         if isinstance(spec, basestring):
             assert spec.startswith(self.path + '/') # security check ;)
             subdir = spec
@@ -267,21 +414,24 @@ class FileDataStore(BaseDataStore):
 
         key_fname = os.path.join(subdir, 'key')
         try:
-            with open(key_fname, 'w') as f:
+            stored = os.path.exists(key_fname) and self.serializer.exists(subdir)
+            with open(key_fname, 'wb') as f:
                 f.write(self.get_key(spec))
 
             self.serializer.save(obj, subdir)
+            return not stored
         except Exception, e:
             # clean up the mess to mantain the invariatn
             if os.path.exists(key_fname): os.unlink(key_fname)
             if os.path.exists(subdir): shutil.rmtree(subdir)
+            return False
 
     def __contains__(self, spec):
         try:
             subdir = self._get_subdir(spec)
             return self.serializer.exists(subdir)
         except KeyError:
-            if config.interactive_rehash and spec not in RehashUI.ignored_specs:
+            if config.interactive_rehash and spec not in get_rehash_ui().ignored_specs:
                 self.interactive_rehash(spec)
                 return spec in self
             else:
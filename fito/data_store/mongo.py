@@ -1,15 +1,22 @@
 import mmh3
+import sys
 import warnings
+from collections import OrderedDict
+from datetime import datetime, timedelta
 from random import random
+from types import ModuleType
 
 import pymongo
-from bson import ObjectId
+from bson import BSON, ObjectId
 from fito import PrimitiveField
 from fito import SpecField
-from fito.data_store.base import BaseDataStore
+from fito.data_store.base import BaseDataStore, new_lease_token
+from fito.data_store.similarity import MongoJournal
 from fito import Spec
+from fito.specs.key_codec import JSONKeyCodec
 from gridfs import GridFS
 from pymongo.collection import Collection
+from pymongo import UpdateOne
 from pymongo.errors import DuplicateKeyError
 from pymongo.mongo_client import MongoClient
 
@@ -20,7 +27,12 @@ def get_collection(client, name):
     return client[db][coll]
 
 
-global_client = MongoClient()
+def get_global_client():
+    """
+    The client used by the stores that are given collection names, it's created on first use. It is also available
+    as `global_client`
+    """
+    return sys.modules[__name__].global_client
 
 
 class MongoHashMap(BaseDataStore):
@@ -31,16 +43,23 @@ class MongoHashMap(BaseDataStore):
     add_incremental_id = PrimitiveField(default=False)
     use_gridfs = PrimitiveField(default=False)
 
+    # See acquire_lease
+    has_leases = True
+
     def __init__(self, *args, **kwargs):
         super(MongoHashMap, self).__init__(*args, **kwargs)
 
         if isinstance(self.coll, basestring):
-            self.coll = get_collection(global_client, self.coll)
+            self.coll = get_collection(get_global_client(), self.coll)
         else:
             assert isinstance(self.coll, Collection)
 
         if self.add_incremental_id: self._init_incremental_id()
 
+        # The codec the collection was created with is looked up on the first use, see get_key_codec
+        self.key_codec_loaded = False
+        self.similarity_journal = None
+
         if self.use_gridfs:
             self.gridfs = GridFS(self.coll.database, self.coll.name + '.fs')
         else:
@@ -51,8 +70,42 @@ class MongoHashMap(BaseDataStore):
         res['coll'] = '{}.{}'.format(self.coll.database.name, self.coll.name)
         return res
 
+    def get_similarity_journal(self):
+        # Kept, it caches whether the journal exists
+        if self.similarity_journal is None: self.similarity_journal = MongoJournal(self.coll.similarity)
+        return self.similarity_journal
+
+    def acquire_lease(self, spec):
+        now = datetime.utcnow()
+        self.coll.leases.delete_one({'_id': spec.digest, 'expires': {'$lt': now}})
+        token = new_lease_token()
+        try:
+            self.coll.leases.insert_one({
+                '_id': spec.digest,
+                'expires': now + timedelta(seconds=self.lease_ttl),
+                'owner': token,
+            })
+        except DuplicateKeyError:
+            return False
+
+        self.lease_tokens[spec.digest] = token
+        return True
+
+    def renew_lease(self, spec):
+        token = self.lease_tokens.get(spec.digest)
+        if token is None: return
+        self.coll.leases.update_one(
+            {'_id': spec.digest, 'owner': token},
+            {'$set': {'expires': datetime.utcnow() + timedelta(seconds=self.lease_ttl)}}
+        )
+
+    def release_lease(self, spec):
+        token = self.lease_tokens.pop(spec.digest, None)
+        # It could have expired and be taken by another process
+        if token is not None: self.coll.leases.delete_one({'_id': spec.digest, 'owner': token})
+
     def get_collections(self):
-        res = [self.coll, self.coll.conf]
+        res = [self.coll, self.coll.conf, self.coll.similarity, self.coll.leases]
         if self.use_gridfs:
             res.append(self.coll.fs.files)
             res.append(self.coll.fs.chunks)
@@ -66,20 +119,75 @@ class MongoHashMap(BaseDataStore):
         if doc is None:
             self.coll.conf.insert({'key': 'id_seq', 'value': 0})
 
+    def get_key_codec(self):
+        if not self.key_codec_loaded: self._init_key_codec()
+        return self.key_codec
+
+    def _init_key_codec(self):
+        doc = self.coll.conf.find_one({'key': 'key_codec'})
+        if doc is not None:
+            conf_key_codec = Spec.dict2spec(doc['value'])
+        elif self.coll.find_one(projection=[]) is not None:
+            # Collections created before key codecs existed use json keys
+            conf_key_codec = JSONKeyCodec()
+        else:
+            conf_key_codec = self.key_codec or JSONKeyCodec()
+
+        if self.key_codec is not None and self.key_codec != conf_key_codec:
+            raise RuntimeError(
+                'This collection was initialized with key_codec = {} and now was instanced with {}'.format(
+                    conf_key_codec,
+                    self.key_codec
+                )
+            )
+
+        self.key_codec = conf_key_codec
+        self.key_codec_loaded = True
+        if doc is None:
+            self.coll.conf.update_one(
+                {'key': 'key_codec'}, {'$set': {'value': self.key_codec.to_dict()}}, upsert=True
+            )
+
+    def migrate_keys(self, key_codec):
+        """
+        Recomputes the `op_hash` of every document with another codec (e.g. to move a collection with json keys to
+        :py:class:`BinaryKeyCodec`). The specs are stored as documents, so they are left as they are
+
+        :param key_codec: A :py:class:`fito.specs.key_codec.KeyCodec`
+        """
+        self.key_codec = key_codec
+        self.key_codec_loaded = True
+        requests = [
+            UpdateOne({'_id': doc['_id']}, {'$set': {'op_hash': self._get_op_hash(doc['spec'])}})
+            for doc in self.coll.find(no_cursor_timeout=False, projection=['spec'])
+        ]
+        if requests: self.coll.bulk_write(requests, ordered=False)
+
+        # The similarity index is keyed by the old keys, it gets rebuilt when it's needed
+        self.similarity_index = None
+        self.similarity_journal = None
+        self.coll.similarity.drop()
+
+        self.coll.conf.update_one({'key': 'key_codec'}, {'$set': {'value': key_codec.to_dict()}}, upsert=True)
+
     def clean(self):
         self.coll.drop()
         self.coll.conf.drop()
         self.coll.fs.files.drop()
         self.coll.fs.chunks.drop()
+        self.coll.similarity.drop()
+        self.coll.leases.drop()
+        self.similarity_index = None
+        self.similarity_journal = None
         if self.add_incremental_id: self._init_incremental_id()
+        self.key_codec_loaded = False
 
     def create_indices(self):
         self.coll.create_index('op_hash')
         self.coll.create_index('rnd')
 
-    @classmethod
-    def _get_op_hash(cls, spec):
-        op_hash = mmh3.hash(cls.get_key(spec))
+    def _get_op_hash(self, spec):
+        op_hash = mmh3.hash(self.get_key(spec))
         return op_hash
 
     def _build_doc(self, spec, value):
@@ -128,19 +236,21 @@ class MongoHashMap(BaseDataStore):
         values = doc['values']
         if self.use_gridfs:
             values = self.gridfs.get(values).read()
-        spec = Spec.dict2spec(doc['spec'])
+        spec = Spec.dict2spec(doc['spec'], trusted=True)
         return spec, values
 
     def _dict2spec(self, d):
         d = d.copy()
-        return Spec.dict2spec(d)
+        return Spec.dict2spec(d, trusted=True)
 
-    def iterkeys(self, raw=False):
-        for doc in self.coll.find(no_cursor_timeout=False, projection=['spec']):
-            if raw:
+    def iterkeys(self, raw=False, intern=False, pool=None):
+        docs = self.coll.find(no_cursor_timeout=False, projection=['spec'])
+        if raw:
+            for doc in docs:
                 yield doc['_id'], doc['spec']
-            else:
-                yield Spec.dict2spec(doc['spec'])
+        else:
+            for spec in Spec.dicts2specs((doc['spec'] for doc in docs), pool=pool, intern=intern, trusted=True):
+                yield spec
 
     def iteritems(self):
         for doc in self.coll.find(no_cursor_timeout=False):
@@ -173,13 +283,69 @@ class MongoHashMap(BaseDataStore):
     def get_id(self, spec):
         return self._get_doc(spec, projection=[])['_id']
 
+    def get_stored_size(self, spec):
+        doc = self._get_doc(spec)
+        res = len(BSON.encode(doc))
+        if self.use_gridfs: res += self.gridfs.get(doc['values']).length
+        return res
+
+    def contains_many(self, specs):
+        specs_by_hash = {}
+        for i, spec in enumerate(specs):
+            specs_by_hash.setdefault(self._get_op_hash(spec), []).append(i)
+
+        res = [False] * len(specs)
+        docs = self.coll.find({'op_hash': {'$in': list(specs_by_hash)}}, projection=['spec', 'op_hash'])
+        for doc in docs:
+            for i in specs_by_hash[doc['op_hash']]:
+                spec = specs[i]
+                if res[i]: continue
+                res[i] = doc['spec'] == spec if isinstance(spec, dict) else self._dict2spec(doc['spec']) == spec
+        return res
+
     def save(self, spec, values):
         doc = self._build_doc(spec, values)
 
         # TODO: This is slow, should be just one mongo operation
-        try: self.remove(spec)
-        except KeyError: pass
+        try:
+            self._replace(spec)
+        except KeyError:
+            stored = False
+        else:
+            # Already indexed
+            stored = True
         self._insert([doc])
+        if not stored: self._index(spec)
+
+    def save_many(self, items):
+        by_key = OrderedDict()
+        for spec, values in items:
+            if not isinstance(spec, (Spec, dict)):
+                # Saves by id fetch the spec, they are not worth batching
+                self.save(spec, values)
+            else:
+                by_key[self.get_key(spec)] = spec, values
+        if not by_key: return
+
+        specs = [spec for spec, _ in by_key.itervalues()]
+        new_specs = []
+        for spec, contained in zip(specs, self.contains_many(specs)):
+            if contained:
+                self._replace(spec)
+            else:
+                new_specs.append(spec)
+
+        self._insert([self._build_doc(spec, values) for spec, values in by_key.itervalues()])
+        # The ones that were stored are already indexed
+        self._index_many(new_specs)
+
+    def _replace(self, spec):
+        """
+        Removes the document of a spec that is going to be saved again. Unlike remove, it keeps the spec in the
+        similarity index and its journal, they would get the same entry back
+        """
+        if self.get_cache is not None: self.get_cache.remove(spec)
+        self._remove(spec)
 
     def _remove(self, spec):
         if self.use_gridfs:
@@ -215,3 +381,20 @@ class MongoHashMap(BaseDataStore):
         if len(res) == 1:
             res = res[0]
         return res
+
+
+class _MongoModule(ModuleType):
+    def __getattr__(self, name):
+        if name != 'global_client':
+            raise AttributeError("'module' object has no attribute '{}'".format(name))
+
+        # Connecting is deferred until the client is used
+        res = self.global_client = MongoClient()
+        return res
+
+
+# Same as fito.data_store, the module is replaced so global_client is created on first access
+_module = _MongoModule(__name__, __doc__)
+_module.__dict__.update(sys.modules[__name__].__dict__)
+_module._module = sys.modules[__name__]
+sys.modules[__name__] = _module
@@ -38,7 +38,7 @@ class PandasDataStore(BaseDataStore):
     def iteritems(self):
         for k, v in self.fdf.iteritems():
             try:
-                op = Spec.key2spec(k)
+                op = Spec.key2spec(k, trusted=True)
             except ValueError:
                 op = GetOperation(series_name=k)
             yield op, v
@@ -48,7 +48,7 @@ class PandasDataStore(BaseDataStore):
         res = []
         for k in self.fdf.keys():
             try:
-                res.append(Spec.key2spec(k))
+                res.append(Spec.key2spec(k, trusted=True))
             except ValueError:
                 res.append(GetOperation(k))
         return res
@@ -8,14 +8,17 @@ class RehashUI(Cmd):
     prompt = "rehash> "
     user_quit = False
     ignored_specs = set()
+    # How many similar specs are shown
+    n_similar = 10
 
-    def __init__(self, data_store, spec):
+    def __init__(self, data_store, spec, similar_specs=None):
         Cmd.__init__(self)
         self.data_store = data_store
         self.spec = spec
 
         self.print_header()
-        self.similar_specs = data_store.find_similar(spec)
+        if similar_specs is None: similar_specs = data_store.find_similar(spec, n=self.n_similar)
+        self.similar_specs = similar_specs
         print
         print self.colorize("Similar specs", 'green')
         self.do_print('similar_specs')
@@ -41,7 +44,7 @@ class RehashUI(Cmd):
 
         elif thing == 'similar_specs':
             print "{}{:^80}{}".format(*[self.colorize(e, 'green') for e in ('Position', 'Spec', 'score')])
-            for i, (spec, score) in enumerate(self.similar_specs[:10]):
+            for i, (spec, score) in enumerate(self.similar_specs):
                 print "{}){:^80}{}".format(i + 1, spec, score)
         else:
             if thing == 'ds': thing = 'data_store'
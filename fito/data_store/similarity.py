@@ -0,0 +1,457 @@
+"""
+Indices that answer :py:meth:`fito.data_store.base.BaseDataStore.find_similar` without scanning the data store.
+
+The similarity of two specs is the one of :py:func:`fito.specs.utils.matching_fields`: the number of key paths they
+have in common plus the number of equal values under them. Spec dicts are flattened into features (a hash of every
+key path, and of every path with its value), and the similarity is the number of features in common.
+
+Key paths and types are mostly shared by all the specs of a type, so they are grouped into shapes that are scored once
+per query. :py:class:`SimilarityIndex` keeps an inverted index from values to keys and gives the exact top n,
+:py:class:`LSHSimilarityIndex` uses MinHash signatures of the values for very large stores.
+
+The indices are kept up to date on save and remove, and persisted in journals (see :py:class:`FileJournal` and
+:py:class:`MongoJournal`) so that they are not rebuilt on every process.
+"""
+import heapq
+import math
+import os
+import pickle
+import struct
+from array import array
+from collections import defaultdict
+from time import time
+
+import mmh3
+
+from fito.specs.json_encoding import encode_canonical, encode_key
+from fito.specs.utils import atom_types
+
+
+def spec_features(spec_dict):
+    """
+    :return: A pair of frozensets of feature hashes: the shape of the dict (its key paths and types) and its values
+    """
+    shape = []
+    values = []
+    _collect_features(spec_dict, '', shape, values)
+    return frozenset(shape), frozenset(values)
+
+
+def _collect_features(d, path, shape, values):
+    for k, v in d.iteritems():
+        key_path = path + '.' + _encode_value(k)
+        shape.append(_hash('k' + key_path))
+
+        if isinstance(v, dict):
+            _collect_features(v, key_path, shape, values)
+        else:
+            feature = _hash('v' + key_path + '=' + _encode_value(v))
+            if k == 'type':
+                shape.append(feature)
+            else:
+                values.append(feature)
+
+
+def _hash(s):
+    return mmh3.hash64(s)[0]
+
+
+def _encode_value(value):
+    # Equal values must have equal encodings (True == 1 == 1.0, 'a' == u'a', tuples are loaded back as lists)
+    cls = type(value)
+    if cls is str:
+        return '"' + value
+    elif cls is unicode:
+        return '"' + value.encode('utf-8')
+    elif cls is int or cls is long or cls is bool:
+        return str(int(value))
+    elif value is None:
+        return 'null'
+
+    try:
+        value = _normalize(value)
+        if (cls is list or cls is tuple) and all(type(e) in atom_types for e in value):
+            # Key order is the only thing the canonical encoding adds, and it is way slower
+            return encode_key(value)
+        return encode_canonical(value)
+    except (TypeError, ValueError):
+        return repr(value)
+
+
+def _normalize(value):
+    cls = type(value)
+    if cls is bool:
+        return int(value)
+    elif cls is float:
+        if not math.isinf(value) and not math.isnan(value) and value == int(value): return int(value)
+    elif cls is list or cls is tuple:
+        return [_normalize(e) for e in value]
+    elif cls is dict:
+        return {k: _normalize(v) for k, v in value.iteritems()}
+    return value
+
+
+class SimilarityIndex(object):
+    """
+    Exact similarity search over the keys of a data store.
+
+    Values are indexed per shape: the keys of the shape that have the value, or the ones that don't once most of them
+    have it (e.g. default values). A query costs the smallest of both sets for each of its values.
+    """
+
+    # Shapes with fewer keys always index the keys that have the values
+    min_complement_size = 64
+
+    def __init__(self):
+        # shape -> keys with that shape
+        self.shapes = {}
+        # key -> shape
+        self.key_shapes = {}
+        # value -> shape -> keys of the shape with the value
+        self.postings = {}
+        # value -> shape -> keys of the shape without the value
+        self.complements = {}
+        # shape -> values indexed by complement
+        self.shape_complements = {}
+
+    def __len__(self):
+        return len(self.key_shapes)
+
+    def __contains__(self, key):
+        return key in self.key_shapes
+
+    def add(self, key, spec_dict):
+        self.add_features(key, *spec_features(spec_dict))
+
+    def remove(self, key, spec_dict):
+        self.remove_features(key, *spec_features(spec_dict))
+
+    def add_features(self, key, shape, values):
+        if key in self.key_shapes: return
+
+        self.key_shapes[key] = shape
+        self.shapes.setdefault(shape, set()).add(key)
+        self._add_values(key, shape, values)
+
+    def remove_features(self, key, shape, values):
+        if key not in self.key_shapes: return
+
+        del self.key_shapes[key]
+        self._remove_values(key, shape, values)
+
+        members = self.shapes[shape]
+        members.discard(key)
+        if not members: del self.shapes[shape]
+
+    def _add_values(self, key, shape, values):
+        members = self.shapes[shape]
+        complemented = self.shape_complements.setdefault(shape, set())
+
+        for feature in list(complemented):
+            if feature in values: continue
+
+            complement = self.complements[feature][shape]
+            complement.add(key)
+            if 3 * len(complement) > 2 * len(members):
+                # Most keys lack it now
+                self._set_complemented(feature, shape, False)
+
+        for feature in values:
+            if feature in complemented: continue
+
+            posting = self.postings.setdefault(feature, {}).setdefault(shape, set())
+            posting.add(key)
+            if len(members) >= self.min_complement_size and 3 * len(posting) > 2 * len(members):
+                self._set_complemented(feature, shape, True)
+
+    def _set_complemented(self, feature, shape, complemented):
+        """
+        Switches how `feature` is indexed in `shape`
+        """
+        source, target = (self.postings, self.complements) if complemented else (self.complements, self.postings)
+
+        keys = source[feature].pop(shape)
+        if not source[feature]: del source[feature]
+        target.setdefault(feature, {})[shape] = self.shapes[shape] - keys
+
+        if complemented:
+            self.shape_complements[shape].add(feature)
+        else:
+            self.shape_complements[shape].discard(feature)
+
+    def _remove_values(self, key, shape, values):
+        complemented = self.shape_complements[shape]
+        for feature in complemented:
+            self.complements[feature][shape].discard(key)
+
+        for feature in values:
+            if feature in complemented: continue
+
+            by_shape = self.postings[feature]
+            posting = by_shape[shape]
+            posting.discard(key)
+            if not posting:
+                del by_shape[shape]
+                if not by_shape: del self.postings[feature]
+
+        if len(self.shapes[shape]) == 1:
+            # It was the last key of the shape
+            for feature in complemented:
+                by_shape = self.complements[feature]
+                del by_shape[shape]
+                if not by_shape: del self.complements[feature]
+            del self.shape_complements[shape]
+
+    def query(self, spec_dict, n=None):
+        """
+        :param n: How many results to return, None means all the keys with a positive similarity
+        :return: A list of (key, similarity) pairs, sorted by decreasing similarity
+        """
+        shape, values = spec_features(spec_dict)
+        shape_scores = {s: len(shape & s) for s in self.shapes}
+        scores = self._score_values(values, shape_scores)
+
+        # The rest of the keys score by their shapes. Only n of each shape can be needed, the rest would tie with them
+        for s, score in sorted(shape_scores.iteritems(), key=lambda x: -x[1]):
+            if score == 0: break
+            if n is not None and len(scores) >= n and score <= _nth_score(scores, n): break
+
+            missing = (key for key in self.shapes[s] if key not in scores)
+            for i, key in enumerate(missing):
+                if n is not None and i >= n: break
+                scores[key] = score
+
+        items = ((key, score) for key, score in scores.iteritems() if score > 0)
+        if n is None:
+            return sorted(items, key=_by_score)
+        return heapq.nsmallest(n, items, key=_by_score)
+
+    def _score_values(self, values, shape_scores):
+        """
+        Scores the keys whose score differ from the one of their shapes. Updates `shape_scores` with the values that
+        most of the keys of the shape have
+        """
+        offsets = defaultdict(int)
+        for feature in values:
+            for keys in self.postings.get(feature, {}).itervalues():
+                for key in keys:
+                    offsets[key] += 1
+
+            for s, keys in self.complements.get(feature, {}).iteritems():
+                shape_scores[s] += 1
+                for key in keys:
+                    offsets[key] -= 1
+
+        key_shapes = self.key_shapes
+        return {key: shape_scores[key_shapes[key]] + offset for key, offset in offsets.iteritems()}
+
+    def iterfeatures(self):
+        """
+        Iterates over (key, shape, values), as stored by :py:class:`FileJournal` and :py:class:`MongoJournal`
+        """
+        key_values = defaultdict(set)
+        for feature, by_shape in self.postings.iteritems():
+            for keys in by_shape.itervalues():
+                for key in keys:
+                    key_values[key].add(feature)
+
+        for feature, by_shape in self.complements.iteritems():
+            for s, keys in by_shape.iteritems():
+                for key in self.shapes[s] - keys:
+                    key_values[key].add(feature)
+
+        for key, shape in self.key_shapes.iteritems():
+            yield key, shape, frozenset(key_values[key])
+
+
+class LSHSimilarityIndex(SimilarityIndex):
+    """
+    Approximate similarity search. The values of each key are summarized by a MinHash signature, split in bands. The
+    keys that share a band with the query are scored exactly, the rest by their shapes.
+
+    Keys with a Jaccard similarity of their values of `s` share at least a band with probability
+    1 - (1 - s ** rows) ** bands
+    """
+
+    def __init__(self, bands=16, rows=4, seed=42):
+        super(LSHSimilarityIndex, self).__init__()
+        self.bands = bands
+        self.rows = rows
+
+        # Each murmur hash of 128 bits gives four of the hash functions
+        n_hashes = bands * rows
+        self.seeds = range(seed, seed + (n_hashes + 3) // 4)
+        self.n_hashes = n_hashes
+        # band index -> band hash -> keys
+        self.buckets = [{} for _ in xrange(bands)]
+        # key -> values
+        self.key_values = {}
+
+    def signature(self, values):
+        if not values: return [0] * self.n_hashes
+
+        seeds = self.seeds
+        hashes = []
+        for value in values:
+            value = struct.pack('<q', value)
+            hashes.append(array('I', ''.join([mmh3.hash_bytes(value, seed) for seed in seeds])))
+        return map(min, zip(*hashes))[:self.n_hashes]
+
+    def _band_hashes(self, values):
+        signature = self.signature(values)
+        rows = self.rows
+        return [hash(tuple(signature[i * rows: (i + 1) * rows])) for i in xrange(self.bands)]
+
+    def _add_values(self, key, shape, values):
+        self.key_values[key] = values
+        for bucket, band_hash in zip(self.buckets, self._band_hashes(values)):
+            bucket.setdefault(band_hash, set()).add(key)
+
+    def _remove_values(self, key, shape, values):
+        del self.key_values[key]
+        for bucket, band_hash in zip(self.buckets, self._band_hashes(values)):
+            members = bucket[band_hash]
+            members.discard(key)
+            if not members: del bucket[band_hash]
+
+    def _score_values(self, values, shape_scores):
+        key_shapes = self.key_shapes
+        key_values = self.key_values
+
+        scores = {}
+        for bucket, band_hash in zip(self.buckets, self._band_hashes(values)):
+            for key in bucket.get(band_hash, ()):
+                if key not in scores:
+                    scores[key] = shape_scores[key_shapes[key]] + len(values & key_values[key])
+        return scores
+
+    def iterfeatures(self):
+        for key, shape in self.key_shapes.iteritems():
+            yield key, shape, self.key_values[key]
+
+
+def _by_score(item):
+    return -item[1], item[0]
+
+
+def _nth_score(scores, n):
+    return heapq.nlargest(n, scores.itervalues())[-1]
+
+
+class FileJournal(object):
+    """
+    Append only log of the additions and removals of an index, in a file. Each record is a pickle written with a single
+    write, so processes can share the file
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def add(self, key, shape, values):
+        self.add_many([(key, shape, values)])
+
+    def add_many(self, features):
+        self._append([('add', key, tuple(shape), tuple(values)) for key, shape, values in features])
+
+    def remove(self, key):
+        self._append([('remove', key)])
+
+    def _append(self, records):
+        data = ''.join(pickle.dumps(record, 2) for record in records)
+        with open(self.path, 'ab') as f:
+            f.write(data)
+
+    def _iter_records(self):
+        with open(self.path, 'rb') as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    break
+
+    def iterfeatures(self):
+        entries = {}
+        n_records = 0
+        for record in self._iter_records():
+            n_records += 1
+            if record[0] == 'add':
+                entries[record[1]] = record[2:]
+            else:
+                entries.pop(record[1], None)
+
+        for key, (shape, values) in entries.iteritems():
+            yield key, frozenset(shape), frozenset(values)
+
+        # Compact the log when most of it are overwritten records
+        if n_records > 2 * len(entries) + 1000:
+            self.reset((key, shape, values) for key, (shape, values) in entries.iteritems())
+
+    def reset(self, features):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            for key, shape, values in features:
+                f.write(pickle.dumps(('add', key, tuple(shape), tuple(values)), 2))
+        os.rename(tmp_path, self.path)
+
+
+class MongoJournal(object):
+    """
+    Stores the features of an index in a mongo collection, one document per key
+    """
+    # Every save and remove asks whether the journal exists. A missing journal is looked up again after this many
+    # seconds, another process could have created it meanwhile
+    missing_ttl = 10
+
+    def __init__(self, coll):
+        self.coll = coll
+        self._exists = False
+        self._checked_at = None
+
+    def exists(self):
+        # Once it exists it's only dropped along the store, which makes a new journal
+        if not self._exists and (self._checked_at is None or time() - self._checked_at > self.missing_ttl):
+            self._exists = self.coll.find_one({'_id': 'conf'}) is not None
+            self._checked_at = time()
+        return self._exists
+
+    def add(self, key, shape, values):
+        self.add_many([(key, shape, values)])
+
+    def add_many(self, features):
+        from bson import Binary
+        from pymongo import ReplaceOne
+        self.coll.bulk_write([
+            ReplaceOne(
+                {'h': _hash(key), 'key': Binary(key)},
+                {'h': _hash(key), 'key': Binary(key), 'shape': list(shape), 'values': list(values)},
+                upsert=True
+            )
+            for key, shape, values in features
+        ])
+
+    def remove(self, key):
+        from bson import Binary
+        self.coll.delete_many({'h': _hash(key), 'key': Binary(key)})
+
+    def iterfeatures(self):
+        for doc in self.coll.find({'_id': {'$ne': 'conf'}}):
+            yield str(doc['key']), frozenset(doc['shape']), frozenset(doc['values'])
+
+    def reset(self, features):
+        from bson import Binary
+        self.coll.drop()
+        self.coll.create_index('h')
+
+        batch = []
+        for key, shape, values in features:
+            batch.append({'h': _hash(key), 'key': Binary(key), 'shape': list(shape), 'values': list(values)})
+            if len(batch) == 1000:
+                self.coll.insert_many(batch)
+                batch = []
+        if batch: self.coll.insert_many(batch)
+
+        self.coll.insert_one({'_id': 'conf'})
+        self._exists = True
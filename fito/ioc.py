@@ -5,6 +5,9 @@ import yaml
 from fito import Spec, DictDataStore
 from fito.specs.utils import general_iterator, general_new, is_iterable, recursive_map, general_append
 
+# Values that can't be references to other objects
+_literal_types = (int, long, float, bool, type(None))
+
 
 def recursive_load(strings, paths=None):
     """
@@ -104,7 +107,7 @@ class ApplicationContext(object):
 
         for k, v in general_iterator(obj):
             if is_iterable(v):
-                v = recursive_map(v, self._try_load)
+                v = recursive_map(v, self._try_load, identity_types=_literal_types)
             else:
                 v = self._try_load(v)
 
@@ -45,14 +45,18 @@ class Model(Operation):
         return ParameterGrid(res)
 
     @classmethod
-    def get_hyper_parameters_grid(cls):
+    def get_hyper_parameters_grid(cls, intern=False):
+        """
+        :param intern: Whether to return the models interned (see :py:meth:`Spec.intern`) instead of their dicts.
+            The combinations share the instances of their submodels then, big grids take much less memory
+        """
         submodels_params = defaultdict(list)
 
         for field_name, field_spec in cls.get_fields():
             if not isinstance(field_spec, BaseModelField): continue
 
             for impl in field_spec.grid:
-                submodels_params[field_name].extend(impl.get_hyper_parameters_grid())
+                submodels_params[field_name].extend(impl.get_hyper_parameters_grid(intern=intern))
 
         res = []
 
@@ -64,15 +68,19 @@ class Model(Operation):
             if len(submodels_params) > 0:
                 # If there are submodels, let's combine them
                 for params in product(*submodels_params):
-                    params = map(Spec.dict2spec, params)
+                    if not intern: params = map(Spec.dict2spec, params)
                     model_fields_combination.update(dict(zip(submodel_fields, params)))
 
                     res.append(
-                        cls(**model_fields_combination).to_dict()
+                        cls._get_grid_entry(cls(**model_fields_combination), intern)
                     )
             else:
                 res.append(
-                    cls(**model_fields_combination).to_dict()
+                    cls._get_grid_entry(cls(**model_fields_combination), intern)
                 )
 
         return res
+
+    @staticmethod
+    def _get_grid_entry(model, intern):
+        return model.intern() if intern else model.to_dict()
@@ -1,12 +1,28 @@
-from collections import OrderedDict
+import atexit
+import inspect
+import os
+import sys
+import threading
+from collections import Counter, OrderedDict
+from itertools import imap
+from time import sleep, time
 
 from fito import PrimitiveField
 from fito import Spec
+from fito.cache import LRUCache, make_cache
+from fito.planner import build_plan, check_caches, execution_stats, is_operation
 from fito.specs.fields import NumericField
 
 
 class OperationRunner(Spec):
+    # Size of the thread pool shared by the asynchronous executions of every runner
+    async_threads = 8
+
     execute_cache_size = NumericField(default=0)
+    execute_cache_bytes = NumericField(default=0, serialize=False, help='Bound of the execute cache in estimated bytes')
+    execute_cache_policy = PrimitiveField(
+        default='lru', serialize=False, help="'lru', 'fifo', '2q' or 'gds', see fito.cache"
+    )
     verbose = PrimitiveField(default=False)
 
     # Whether to force execution and ignore caches
@@ -15,10 +31,9 @@ class OperationRunner(Spec):
 
     def __init__(self, *args, **kwargs):
         super(OperationRunner, self).__init__(*args, **kwargs)
-        if self.execute_cache_size == 0:
-            self.execute_cache = None
-        else:
-            self.execute_cache = FifoCache(self.execute_cache_size, self.verbose)
+        self.execute_cache = make_cache(
+            self.execute_cache_policy, self.execute_cache_size, self.execute_cache_bytes, self.verbose
+        )
 
     def alias(self, **kwargs):
         """
@@ -29,7 +44,7 @@ class OperationRunner(Spec):
             res.execute_cache = self.execute_cache
         return res
 
-    # TODO: The FifoCache can be casted into a FifoDataStore, and make this function an @autosave
+    # TODO: The execute cache can be casted into a DataStore, and make this function an @autosave
     def execute(self, operation, force=False):
         """
         Executes an operation using this data store as input
@@ -40,26 +55,312 @@ class OperationRunner(Spec):
         force = force or self.force
         if not force:
             # if not force, then check the caches out
-            functions = [
-                lambda: self._get_memory_cache(operation),
-                lambda: self._get_data_store_cache(operation),
-            ]
-        else:
-            functions = []
+            try:
+                res = self._get_cached(operation)
+                self._store_result(operation, res)
+                return res
+            except KeyError:
+                pass
 
-        functions.append(
-            lambda: operation.apply(
-                self.alias(force=force)
-            )
-        )
+        return self._execute_once(operation, force)
+
+    def _execute_once(self, operation, force):
+        """
+        Applies an operation that was not found in the caches. Concurrent executions of the same operation wait for
+        the first one: the ones of this process through the in flight executions, the ones of other processes through
+        the lease of the out data store
+        """
+        with _in_flight_lock:
+            leader = operation not in _in_flight
+            if leader:
+                _in_flight[operation] = operation, AsyncResult(lambda: self._apply_leased(operation, force))
+            leader_operation, execution = _in_flight[operation]
+
+        try:
+            res = execution.get()
+        finally:
+            if leader:
+                with _in_flight_lock:
+                    del _in_flight[operation]
+
+        if not leader:
+            # Equal operations can be saved to different data stores, the leader only saved to its own
+            if operation.get_out_data_store() is not leader_operation.get_out_data_store():
+                self._store_result(operation, res)
+            elif self.execute_cache is not None:
+                self.execute_cache.set(operation, res)
+        return res
 
-        for func in functions:
+    def _apply_leased(self, operation, force):
+        out_data_store = operation.get_out_data_store()
+        if out_data_store is None or not out_data_store.has_leases:
+            res = self._apply(operation, self.alias(force=force))
+            self._store_result(operation, res)
+            return res
+
+        while not _acquire_lease(out_data_store, operation):
+            # Another process is applying it, wait for its result
+            sleep(out_data_store.lease_poll_interval)
             try:
-                res = func()
-                break
+                res = out_data_store[operation]
             except KeyError:
-                pass
+                continue
+
+            if self.execute_cache is not None: self.execute_cache.set(operation, res)
+            return res
+
+        try:
+            if not force:
+                # It could have been saved between the cache miss and the lease
+                try:
+                    res = out_data_store[operation]
+                    if self.execute_cache is not None: self.execute_cache.set(operation, res)
+                    return res
+                except KeyError:
+                    pass
+
+            res = self._apply(operation, self.alias(force=force))
+            self._store_result(operation, res)
+            return res
+        finally:
+            _release_lease(out_data_store, operation)
+
+    def async_execute(self, operation, force=False):
+        """
+        Same as execute, but returns at once. The execution, cache lookups and saves included, runs on a thread pool
+        shared by all the runners, of `async_threads` threads
+
+        :return: An :py:class:`AsyncResult`, whose get method returns the result of the operation
+        """
+        res = AsyncResult(lambda: self.execute(operation, force=force))
+        get_async_pool().apply_async(res.run)
+        return res
+
+    def execute_many(self, operations, force=False, parallel=False, ordered=True, batch_size=100):
+        """
+        Executes many operations, e.g. the experiments of a sweep. The caches are probed at once, with one
+        contains_many call per out data store, only the misses are applied, and their results are saved with one
+        save_many call per out data store every `batch_size` results.
+
+        :param parallel: Whether to apply the misses on the thread pool of async_execute
+        :param ordered: Whether to return the results in the order of `operations`. Otherwise (operation, result)
+            pairs are returned as they complete, once per distinct operation, the cached ones first
+        :return: An iterator, the operations are executed as it is consumed
+        """
+        operations = list(operations)
+        force = force or self.force
+        distinct = list(OrderedDict.fromkeys(operations))
+        hits = {} if force else check_caches(self, distinct)
+        applied = self._apply_many([op for op in distinct if op not in hits], force, parallel, ordered, batch_size)
+
+        if not ordered:
+            for op in distinct:
+                if op in hits: yield op, self._get_hit(op)
+            for op, res in applied:
+                yield op, res
+            return
+
+        # How many times each applied result is still going to be returned
+        remaining = Counter(op for op in operations if op not in hits)
+        results = {}
+        for op in operations:
+            if op in hits:
+                yield self._get_hit(op)
+                continue
 
+            while op not in results:
+                applied_op, res = next(applied)
+                results[applied_op] = res
+
+            remaining[op] -= 1
+            yield results[op] if remaining[op] else results.pop(op)
+
+    def _get_hit(self, operation):
+        try:
+            res = self._get_cached(operation)
+        except KeyError:
+            # It was evicted or removed since the caches were probed
+            return self.execute(operation)
+
+        if self.execute_cache is not None: self.execute_cache.set(operation, res)
+        return res
+
+    def _apply_many(self, operations, force, parallel, ordered, batch_size):
+        """
+        Applies the misses of execute_many holding the leases of their out data stores, and saves them in batches.
+
+        :return: An iterator over (operation, result) pairs
+        """
+        runner = self.alias(force=force)
+        cancelled = threading.Event()
+
+        def apply(op):
+            if cancelled.is_set(): return None
+
+            out_data_store = op.get_out_data_store()
+            if out_data_store is not None and not _acquire_lease(out_data_store, op):
+                # Another process is applying it, execute waits for its result
+                return op, self.execute(op, force=force), False
+
+            if not force:
+                # It could have been executed since the caches were probed, by an operation of the batch that
+                # depends on it
+                try:
+                    res = self._get_cached(op)
+                except KeyError:
+                    pass
+                else:
+                    if out_data_store is not None: _release_lease(out_data_store, op)
+                    return op, res, False
+
+            with _in_flight_lock:
+                leader = op not in _in_flight
+                if leader:
+                    # Until it's saved, the executions of this process get the result from here, among them the ones
+                    # of the operations of the batch that depend on it
+                    execution = AsyncResult(lambda: self._apply(op, runner))
+                    _in_flight[op] = op, execution
+
+            if not leader:
+                # Another execution of this process is applying it
+                if out_data_store is not None: _release_lease(out_data_store, op)
+                return op, self.execute(op, force=force), False
+
+            try:
+                res = execution.get()
+            except Exception:
+                with _in_flight_lock:
+                    del _in_flight[op]
+                if out_data_store is not None: _release_lease(out_data_store, op)
+                raise
+
+            if self.execute_cache is not None: self.execute_cache.set(op, res)
+            return op, res, True
+
+        if parallel:
+            pool = get_async_pool()
+            results = (pool.imap if ordered else pool.imap_unordered)(apply, operations)
+        else:
+            results = imap(apply, operations)
+
+        # Applied results that wait to be saved
+        pending = []
+        try:
+            for op, res, to_save in results:
+                if to_save: pending.append((op, res))
+                if len(pending) >= batch_size:
+                    self._save_many(pending)
+                    pending = []
+                yield op, res
+        finally:
+            cancelled.set()
+            if parallel:
+                # The pool may have applied more operations, save them and release their leases
+                pending.extend((e[0], e[1]) for e in _iter_completed(results) if e is not None and e[2])
+            self._save_many(pending)
+
+    def _save_many(self, results):
+        """
+        Saves the results applied by execute_many, with one save_many call per out data store, and releases their
+        leases
+        """
+        by_data_store = OrderedDict()
+        for op, res in results:
+            out_data_store = op.get_out_data_store()
+            if out_data_store is not None:
+                by_data_store.setdefault(id(out_data_store), (out_data_store, []))[1].append((op, res))
+
+        try:
+            for data_store, items in by_data_store.itervalues():
+                data_store.save_many(items)
+        finally:
+            with _in_flight_lock:
+                for op, _ in results:
+                    del _in_flight[op]
+
+            for data_store, items in by_data_store.itervalues():
+                for op, _ in items:
+                    _release_lease(data_store, op)
+
+    def plan(self, operation, force=False):
+        """
+        Dry run of execute: finds which operations of the DAG of `operation` (given by their SpecField and
+        SpecCollection fields) are cached, and which ones would be computed, in order. Like execute, it does not look
+        into the dependencies of cached operations.
+
+        :return: A :py:class:`fito.planner.ExecutionPlan`, print it for an explain report
+        """
+        return build_plan(self, operation, force=force or self.force)
+
+    def _apply(self, operation, runner):
+        """
+        Applies an operation, running it until the end if it's a coroutine. See :py:func:`is_coroutine`.
+        The time it takes, without the applies nested in it, is recorded for the estimations of the plans and the
+        caches. The size of the result is estimated later, by the caches bounded by bytes
+        """
+        # Time taken by the applies nested in this one, in this thread
+        stack = _apply_times.__dict__.setdefault('stack', [])
+        stack.append(0.0)
+        start = time()
+        try:
+            res = operation.apply(runner)
+            if is_coroutine(operation):
+                res = runner.run_coroutine(res)
+        finally:
+            elapsed = time() - start
+            nested = stack.pop()
+            if stack: stack[-1] += elapsed
+
+        execution_stats.record(operation, elapsed - nested)
+        return res
+
+    def run_coroutine(self, coroutine):
+        """
+        Runs the generator returned by the apply method of a coroutine operation.
+
+        The generator yields the operations it needs, or lists or tuples of them, and gets back their results. They
+        are executed asynchronously, so the operations yielded together overlap. Yielding anything else ends the
+        coroutine, and it's the result of the operation.
+        """
+        value = exc_info = None
+        while True:
+            try:
+                if exc_info is None:
+                    yielded = coroutine.send(value)
+                else:
+                    yielded = coroutine.throw(*exc_info)
+            except StopIteration:
+                return None
+
+            if is_operation(yielded):
+                operations = [yielded]
+            elif isinstance(yielded, (list, tuple)) and all(is_operation(e) for e in yielded):
+                operations = yielded
+            else:
+                coroutine.close()
+                return yielded
+
+            results = [self.async_execute(op) for op in operations]
+            try:
+                values = [e.get() for e in results]
+                value = values[0] if is_operation(yielded) else type(yielded)(values)
+                exc_info = None
+            except Exception:
+                exc_info = sys.exc_info()
+
+    def _get_cached(self, operation):
+        """
+        Looks `operation` up in the caches, in the order that execute does. Raises KeyError when it's not cached
+        """
+        try:
+            return self._get_memory_cache(operation)
+        except KeyError:
+            return self._get_data_store_cache(operation)
+
+    def _store_result(self, operation, res):
+        """
+        Saves the result of an execution into the execute cache and the out data store of the operation
+        """
         if self.execute_cache is not None:
             self.execute_cache.set(operation, res)
 
@@ -67,8 +368,6 @@ class OperationRunner(Spec):
         if out_data_store is not None:
             out_data_store[operation] = res
 
-        return res
-
     def _get_memory_cache(self, operation):
         if self.execute_cache is not None:
             return self.execute_cache[operation]
@@ -83,45 +382,200 @@ class OperationRunner(Spec):
             raise KeyError()
 
 
-class FifoCache(object):
+def _iter_completed(results):
     """
-    Fifo caching strategy
-    It is useful when there are operations that are costly to execute and you might need the result
-    near in the future for computing another spec
+    Iterates over the results of a pool, skipping the ones that failed
     """
+    while True:
+        try:
+            yield next(results)
+        except StopIteration:
+            return
+        except Exception:
+            continue
 
-    def __init__(self, size=500, verbose=False):
-        self.verbose = verbose
-        self.queue = OrderedDict()
-        self.size = size
-
-    def _get_key(self, spec_or_dict):
-        if isinstance(spec_or_dict, Spec):
-            return spec_or_dict.key
-        elif isinstance(spec_or_dict, dict):
-            return Spec._dict2key(spec_or_dict)
-        else:
-            # assume it's an id
-            return spec_or_dict
-
-    def get(self, spec):
-        key = self._get_key(spec)
-        if key in self.queue:
-            if self.verbose: print "Fifo hit!"
-            res = self.queue.pop(key)
-            self.queue[key] = res
-            return res
 
-    def set(self, spec, value):
-        key = self._get_key(spec)
-        self.queue.pop(key, None)
-        if len(self.queue) >= self.size:
-            if self.verbose: print "Fifo pop!"
-            op, _ = self.queue.popitem(False)
-        self.queue[key] = value
+def is_coroutine(operation):
+    """
+    Whether the apply method of an operation is a generator that yields the operations it needs, see
+    :py:meth:`OperationRunner.run_coroutine`. Operations created by as_operation from generator functions are
+    coroutines too
+    """
+    return getattr(operation, 'coroutine', False) or inspect.isgeneratorfunction(type(operation).apply)
+
+
+_async_pool = None
+_async_pool_lock = threading.Lock()
+
+_apply_times = threading.local()
+
+# (leader operation, execution) of the operations being applied in this process. See OperationRunner._execute_once
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def _acquire_lease(data_store, operation):
+    """
+    Acquires the lease of `operation` in `data_store`, and keeps it renewed until it is released with _release_lease.
+    The stores without leases (see BaseDataStore.has_leases) are skipped
+    """
+    if not data_store.has_leases: return True
+    if not data_store.acquire_lease(operation): return False
+    _lease_keeper.hold(data_store, operation)
+    return True
+
+
+def _release_lease(data_store, operation):
+    if not data_store.has_leases: return
+    _lease_keeper.drop(data_store, operation)
+    data_store.release_lease(operation)
+
+
+class LeaseKeeper(object):
+    """
+    Renews the leases held by this process every third of their lease_ttl, from a daemon thread, so that the applies
+    that take longer than that don't lose them. The thread runs while there are leases held
+    """
+
+    def __init__(self):
+        # (id of the data store, operation) -> [data store, operation, time of the next renewal]
+        self.leases = {}
+        self.lock = threading.Lock()
+        self.changed = threading.Event()
+        # Process where the thread is running, None when it's not
+        self.pid = None
+        # Set at exit, see stop
+        self.stopped = False
+
+    def hold(self, data_store, operation):
+        with self.lock:
+            self.leases[id(data_store), operation] = [data_store, operation, time() + self._get_period(data_store)]
+            # Threads are not inherited by forked processes
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                thread = threading.Thread(target=self._run, name='fito-lease-keeper')
+                thread.daemon = True
+                thread.start()
+        self.changed.set()
 
-    def __getitem__(self, spec):
-        return self.queue[self._get_key(spec)]
+    def drop(self, data_store, operation):
+        with self.lock:
+            self.leases.pop((id(data_store), operation), None)
+        # The thread ends if it was the last one
+        self.changed.set()
 
-    def remove(self, spec):
-        self.queue.pop(self._get_key(spec), None)
+    def _get_period(self, data_store):
+        return max(data_store.lease_ttl / 3.0, 0.01)
+
+    def stop(self):
+        """
+        Ends the thread, it's called at exit. Daemon threads keep running while the interpreter tears down the module
+        globals
+        """
+        self.stopped = True
+        self.changed.set()
+
+    def _run(self):
+        try:
+            while self._renew():
+                pass
+        except Exception:
+            # The interpreter is tearing down the globals that it was using
+            if self.stopped: return
+            raise
+
+    def _renew(self):
+        """
+        Waits for the next renewal that is due and makes it
+
+        :return: False when there are no leases held, the thread ends then
+        """
+        with self.lock:
+            if self.stopped: return False
+            if not self.leases:
+                # The next hold starts another thread
+                self.pid = None
+                return False
+            next_renewal = min(lease[2] for lease in self.leases.itervalues())
+
+        # Wakes up on new leases, their renewal could be due earlier, and on dropped ones
+        self.changed.wait(max(next_renewal - time(), 0))
+        self.changed.clear()
+        if self.stopped: return False
+
+        now = time()
+        with self.lock:
+            due = [lease for lease in self.leases.itervalues() if lease[2] <= now]
+            for lease in due: lease[2] = now + self._get_period(lease[0])
+
+        for data_store, operation, _ in due:
+            try:
+                data_store.renew_lease(operation)
+            except Exception:
+                # The next round tries again
+                pass
+        return True
+
+
+_lease_keeper = LeaseKeeper()
+atexit.register(_lease_keeper.stop)
+
+
+def get_async_pool():
+    global _async_pool
+    with _async_pool_lock:
+        if _async_pool is None:
+            # multiprocessing is imported here to keep it out of `import fito`
+            from multiprocessing.pool import ThreadPool
+            _async_pool = ThreadPool(OperationRunner.async_threads)
+    return _async_pool
+
+
+class AsyncResult(object):
+    """
+    Result of an asynchronous execution. When its get method is called before any thread of the pool took the
+    execution, it runs in the calling thread, so executions that wait for others never exhaust the pool
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.started = False
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+        self.value = self.exc_info = None
+
+    def run(self):
+        with self.lock:
+            if self.started: return
+            self.started = True
+
+        try:
+            self.value = self.func()
+        except BaseException:
+            self.exc_info = sys.exc_info()
+        finally:
+            self.func = None
+            self.finished.set()
+
+    def ready(self):
+        return self.finished.is_set()
+
+    def wait(self, timeout=None):
+        self.finished.wait(timeout)
+
+    def get(self):
+        self.run()
+        self.finished.wait()
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.value
+
+
+class FifoCache(LRUCache):
+    """
+    Cache bounded by number of entries. Despite its name, it always evicted the least recently used entry, it's kept for
+    compatibility. See :py:mod:`fito.cache`
+    """
+
+    def __init__(self, size=500, verbose=False):
+        super(FifoCache, self).__init__(max_entries=size, verbose=verbose)
@@ -6,6 +6,7 @@ from functools import wraps
 from fito.operations.operation import Operation
 from fito.specs.fields import UnboundField, PrimitiveField, BaseSpecField, KwargsField, SpecField
 from fito.specs.base import get_import_path, Spec
+from fito.specs.registry import registry
 
 try:
     import cPickle
@@ -191,15 +192,11 @@ def operation_from_func(to_wrap, func_to_execute, out_type, out_name, args_speci
 
         return this_args
 
-    def to_dict(self, include_all=False):
-        res = super(out_type, self).to_dict(include_all=include_all)
-
+    def get_type_path(cls):
         if method_type is not None:
-            res['type'] = get_import_path(first_arg, func_to_execute.__name__)
+            return get_import_path(first_arg, func_to_execute.__name__)
         else:
-            res['type'] = get_import_path(func_to_execute)
-
-        return res
+            return get_import_path(func_to_execute)
 
     @property
     def self(self):
@@ -216,10 +213,14 @@ def operation_from_func(to_wrap, func_to_execute, out_type, out_name, args_speci
     cls_attrs['func'] = staticmethod(func_to_execute)
     cls_attrs['apply'] = apply
     cls_attrs['get_this_args'] = get_this_args
-    cls_attrs['to_dict'] = to_dict
+    cls_attrs['get_type_path'] = classmethod(get_type_path)
     cls_attrs['self'] = self
+    # Generator functions yield the operations they need, see OperationRunner.run_coroutine
+    cls_attrs['coroutine'] = inspect.isgeneratorfunction(to_wrap)
+
+    cls_attrs['__module__'] = to_wrap.__module__
 
-    cls = Operation.type2spec_class(out_name)
+    cls = registry.get_by_path('{}:{}'.format(to_wrap.__module__, out_name))
     if cls is None:
         # if the class does not exist, create it
         cls = type(out_name, (out_type,), cls_attrs)
@@ -233,5 +234,4 @@ def operation_from_func(to_wrap, func_to_execute, out_type, out_name, args_speci
     else:
         cls.default_data_store = None
 
-    cls.__module__ = to_wrap.__module__
     return cls
@@ -7,9 +7,16 @@ class Operation(Spec):
     out_data_store = SpecField(default=None, serialize=False)
     default_data_store = None
 
+    # Whether apply returns a generator that yields the operations it needs. Generator methods are detected, see
+    # fito.operation_runner.is_coroutine
+    coroutine = False
+
     def execute(self, force=False):
         return OperationRunner().execute(self, force=force)
 
+    def async_execute(self, force=False):
+        return OperationRunner().async_execute(self, force=force)
+
     def apply(self, runner):
         raise NotImplementedError()
 
@@ -0,0 +1,188 @@
+"""
+Runners that execute the independent branches of an operation DAG concurrently, on threads or on processes.
+
+The runners follow the plan of the operation (see :py:meth:`fito.operation_runner.OperationRunner.plan`), so the
+dependencies of a cached operation are not executed. The operations to compute run bottom up, and their results are
+handed to the operations that need them through the runner given to ``Operation.apply``.
+"""
+import sys
+from collections import defaultdict
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+from Queue import Queue
+
+from fito.data_store.dict_ds import DictDataStore
+from fito.operation_runner import OperationRunner
+from fito.planner import operation_dependencies
+from fito.specs.base import Spec, DecodeMemo
+from fito.specs.fields import NumericField
+from fito.specs.json_encoding import encode_key
+
+# Returned by ThreadPoolRunner._run_node when the result is already in the out data store of the operation
+_stored = object()
+
+
+class ThreadPoolRunner(OperationRunner):
+    """
+    Executes operations on a thread pool. Every operation of the DAG that is not cached runs on the pool once all of
+    its dependencies are done, so independent branches run concurrently.
+
+    Operations executed inside ``apply`` that are not fields of the operation run in the thread that asked for them.
+    """
+    n_threads = NumericField(default=4)
+
+    def __init__(self, *args, **kwargs):
+        super(ThreadPoolRunner, self).__init__(*args, **kwargs)
+        self.pool = None
+        # Results of the DAG being executed. Only set on the runners given to Operation.apply
+        self.completed = None
+
+    def alias(self, **kwargs):
+        res = super(ThreadPoolRunner, self).alias(**kwargs)
+        res.pool = self.pool
+        res.completed = self.completed
+        return res
+
+    def get_pool(self):
+        if self.pool is None:
+            self.pool = ThreadPool(self.n_threads)
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def execute(self, operation, force=False):
+        if self.completed is not None:
+            # Called from an operation of the DAG
+            if operation in self.completed: return self.completed[operation]
+            return super(ThreadPoolRunner, self).execute(operation, force=force)
+
+        force = force or self.force
+        plan = self.plan(operation, force=force)
+        if not plan.order: return super(ThreadPoolRunner, self).execute(operation, force=force)
+
+        # Results of the computed operations. The cached ones are fetched when an operation asks for them
+        completed = {}
+        # operation -> dependencies that are not done yet
+        waiting = {}
+        # operation -> operations waiting for it
+        dependents = defaultdict(list)
+        for op in plan.order:
+            waiting[op] = {dependency for dependency in plan[op].dependencies if not plan[dependency].is_hit}
+            for dependency in waiting[op]:
+                dependents[dependency].append(op)
+
+        runner = self.alias(force=force)
+        runner.completed = completed
+        pool = self.get_pool()
+        done = Queue()
+
+        def apply(op):
+            try:
+                done.put((op, self._run_node(op, runner), None))
+            except BaseException:
+                done.put((op, None, sys.exc_info()))
+
+        running = 0
+        for op, dependencies in waiting.iteritems():
+            if not dependencies:
+                pool.apply_async(apply, (op,))
+                running += 1
+
+        while running:
+            op, res, exc_info = done.get()
+            running -= 1
+            if exc_info is not None: raise exc_info[0], exc_info[1], exc_info[2]
+
+            if res is not _stored: completed[op] = res
+
+            for dependent in dependents.pop(op, ()):
+                dependencies = waiting[dependent]
+                dependencies.discard(op)
+                if not dependencies:
+                    pool.apply_async(apply, (dependent,))
+                    running += 1
+
+        if operation not in completed:
+            res = self._get_data_store_cache(operation)
+            if self.execute_cache is not None: self.execute_cache.set(operation, res)
+            return res
+        return completed[operation]
+
+    def _run_node(self, operation, runner):
+        """
+        Applies an operation of the DAG and saves its result, it's called from the threads of the pool. Like execute,
+        it waits for the executions of the same operation that other threads or processes started
+
+        :return: The result, or _stored if it was saved in the out data store of the operation
+        """
+        return runner._execute_once(operation, runner.force)
+
+
+class ProcessPoolRunner(ThreadPoolRunner):
+    """
+    Executes the operations that have an out data store on a process pool, for CPU bound operations.
+
+    Operations are shipped by key, results are not pickled back: the worker rebuilds the operation with
+    ``Spec.key2spec``, executes it with an :py:class:`OperationRunner` and saves the result in the out data store,
+    where the parent (or the workers executing the operations that depend on it) read it from. The out data store
+    must then be visible from every process, e.g. a FileDataStore or a MongoHashMap.
+
+    Operations without an out data store (or with a DictDataStore) are applied on the threads of the parent. Workers
+    can't get their results, so the ones that a worker needs are executed again by it.
+    """
+    n_processes = NumericField(default=4)
+
+    def __init__(self, *args, **kwargs):
+        super(ProcessPoolRunner, self).__init__(*args, **kwargs)
+        self.process_pool = None
+
+    def alias(self, **kwargs):
+        res = super(ProcessPoolRunner, self).alias(**kwargs)
+        res.process_pool = self.process_pool
+        return res
+
+    def get_pool(self):
+        # A thread waits for each running process
+        if self.pool is None:
+            self.pool = ThreadPool(max(self.n_threads, self.n_processes))
+        return self.pool
+
+    def get_process_pool(self):
+        if self.process_pool is None:
+            self.process_pool = Pool(self.n_processes)
+        return self.process_pool
+
+    def close(self):
+        super(ProcessPoolRunner, self).close()
+        if self.process_pool is not None:
+            self.process_pool.close()
+            self.process_pool.join()
+            self.process_pool = None
+
+    def _run_node(self, operation, runner):
+        out_data_store = operation.get_out_data_store()
+        if out_data_store is None or isinstance(out_data_store, DictDataStore):
+            return super(ProcessPoolRunner, self)._run_node(operation, runner)
+
+        # include_all keeps the out data stores, which are not part of the keys
+        operation_key = encode_key(operation.to_dict(include_all=True))
+        self.get_process_pool().apply(apply_key, (operation_key, runner.force))
+        return _stored
+
+
+_worker_memo = DecodeMemo(max_size=1000)
+
+
+def apply_key(operation_key, force=False):
+    """
+    Applies an operation given by its key, and saves the result in its out data store. Runs in the workers of
+    :py:class:`ProcessPoolRunner`, its dependencies are read from their data stores. The lease of the out data store
+    is held meanwhile, see :py:meth:`OperationRunner.execute`
+    """
+    # Data stores and other subspecs shared by the operations are decoded once per worker
+    operation = _worker_memo.load_root_spec(Spec.key2dict(operation_key), intern=False)
+    OperationRunner()._execute_once(operation, force)
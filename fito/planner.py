@@ -0,0 +1,325 @@
+"""
+Execution plans: which operations of a DAG are cached, where, and which ones have to be computed and in what order.
+See :py:meth:`fito.operation_runner.OperationRunner.plan`.
+
+The costs of the plans are estimated from the time previous applies of each type of operation took, which
+:py:data:`execution_stats` records and can persist to a json file. It also records the time of each operation, and
+the size of its result once a cache bounded by bytes estimates it.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from fito.specs.base import Spec, dict_digest
+from fito.specs.utils import general_iterator
+
+HIT_MEMORY = 'memory'
+HIT_STORE = 'store'
+COMPUTE = 'compute'
+
+
+def is_operation(obj):
+    # Operations can not be imported here, they depend on the operation runner that depends on this module
+    return isinstance(obj, Spec) and hasattr(obj, 'apply')
+
+
+def operation_dependencies(operation):
+    """
+    :return: The operations in the SpecField and SpecCollection fields of `operation`, without repetitions
+    """
+    field_table = type(operation)._field_table
+
+    res = []
+    for attr in field_table.spec_fields:
+        value = getattr(operation, attr)
+        if is_operation(value): res.append(value)
+
+    for attr in field_table.collection_fields:
+        collection = getattr(operation, attr)
+        if collection is None: continue
+        for _, value in general_iterator(collection):
+            if is_operation(value): res.append(value)
+
+    seen = set()
+    return [e for e in res if not (e in seen or seen.add(e))]
+
+
+class ExecutionStats(object):
+    """
+    Time taken by the applies of each type of operation, and by each of the last `max_operations` operations along
+    with the size of their results. The caches use them to keep the results that are expensive to compute and small,
+    see :py:class:`fito.cache.GreedyDualSizeCache` and :py:meth:`fito.data_store.base.BaseDataStore.collect_garbage`
+    """
+    max_operations = 100000
+
+    def __init__(self):
+        # module:class -> [count, total seconds]
+        self.stats = {}
+        # operation digest -> [seconds, bytes of the result or None]
+        self.operations = OrderedDict()
+        self.lock = threading.Lock()
+
+    def record(self, operation, seconds, size=None):
+        type_name = _type_name(operation)
+        key = _operation_key(operation)
+        with self.lock:
+            stats = self.stats.setdefault(type_name, [0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+
+            self.operations.pop(key, None)
+            self.operations[key] = [seconds, size]
+            if len(self.operations) > self.max_operations: self.operations.popitem(last=False)
+
+    def record_size(self, operation, size):
+        """
+        Records the size of the result of the last apply of `operation`, when the apply was recorded. Sizes are
+        estimated only when something needs them, see :py:meth:`fito.cache.Cache.set`
+        """
+        with self.lock:
+            recorded = self.operations.get(_operation_key(operation))
+            if recorded is not None: recorded[1] = size
+
+    def estimate(self, operation):
+        """
+        :return: Mean seconds taken by the operations of the type of `operation`, None if none was applied
+        """
+        stats = self.stats.get(_type_name(operation))
+        if stats is None: return None
+        return stats[1] / stats[0]
+
+    def get_cost(self, operation):
+        """
+        :return: Seconds that the last apply of `operation` took, its estimate when it was not recorded
+        """
+        recorded = self.operations.get(_operation_key(operation))
+        if recorded is None: return self.estimate(operation)
+        return recorded[0]
+
+    def get_size(self, operation):
+        """
+        :return: Estimated bytes of the result of the last apply of `operation`, None when it was not recorded
+        """
+        recorded = self.operations.get(_operation_key(operation))
+        if recorded is None: return None
+        return recorded[1]
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump({'types': self.stats, 'operations': self.operations.items()}, f)
+
+    def load(self, path):
+        """
+        Adds up the stats saved with dump, e.g. by previous processes
+        """
+        if not os.path.exists(path): return
+        with open(path) as f:
+            stats = json.load(f)
+
+        if 'types' not in stats:
+            # Saved before the operations were recorded
+            stats = {'types': stats, 'operations': []}
+
+        with self.lock:
+            for type_name, (count, seconds) in stats['types'].iteritems():
+                current = self.stats.setdefault(type_name, [0, 0.0])
+                current[0] += count
+                current[1] += seconds
+
+            for key, recorded in stats['operations']:
+                # The ones recorded by this process are newer
+                if key not in self.operations: self.operations[key] = recorded
+
+            while len(self.operations) > self.max_operations: self.operations.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.stats.clear()
+            self.operations.clear()
+
+
+def _operation_key(operation):
+    return operation.digest if isinstance(operation, Spec) else dict_digest(operation)
+
+
+def _type_name(operation):
+    # The type paths of the operations built from methods are not strings
+    cls = type(operation)
+    return '{}:{}'.format(cls.__module__, cls.__name__)
+
+
+execution_stats = ExecutionStats()
+
+
+class PlanNode(object):
+    def __init__(self, operation, status, data_store=None, dependencies=(), estimated_cost=None):
+        self.operation = operation
+        # HIT_MEMORY, HIT_STORE or COMPUTE
+        self.status = status
+        # Where the operation was found
+        self.data_store = data_store
+        # Operations in its fields, only for the operations that are computed
+        self.dependencies = list(dependencies)
+        # Seconds, only for the operations that are computed. None when it's unknown
+        self.estimated_cost = estimated_cost
+
+    @property
+    def is_hit(self):
+        return self.status != COMPUTE
+
+
+class ExecutionPlan(object):
+    """
+    Result of :py:meth:`fito.operation_runner.OperationRunner.plan`. The DAG is walked from the root down, and the
+    dependencies of cached operations are not visited: they won't be needed
+    """
+
+    def __init__(self, root, nodes, order):
+        self.root = root
+        # operation -> PlanNode, for every visited operation
+        self.nodes = nodes
+        # Operations to compute, each one after its dependencies
+        self.order = order
+
+    def __getitem__(self, operation):
+        return self.nodes[operation]
+
+    def __contains__(self, operation):
+        return operation in self.nodes
+
+    @property
+    def hits(self):
+        return [node.operation for node in self.nodes.itervalues() if node.is_hit]
+
+    @property
+    def to_compute(self):
+        return list(self.order)
+
+    @property
+    def estimated_cost(self):
+        """
+        :return: Seconds that computing the plan serially would take, counting only the operations with an estimate
+        """
+        return sum(self.nodes[op].estimated_cost or 0 for op in self.order)
+
+    def explain(self):
+        """
+        :return: A report with the tree of the plan, and the order of the operations to compute
+        """
+        lines = [
+            'Plan for {!r}: {} to compute, {} cached, estimated cost {}'.format(
+                self.root, len(self.order), len(self.hits), _format_cost(self.estimated_cost)
+            )
+        ]
+
+        def add_lines(operation, depth, seen):
+            node = self.nodes[operation]
+            if node.status == COMPUTE:
+                status = 'compute ({})'.format(_format_cost(node.estimated_cost))
+            elif node.status == HIT_STORE:
+                status = 'hit in {!r}'.format(node.data_store)
+            else:
+                status = 'hit in memory'
+
+            repeated = operation in seen
+            lines.append('{}{!r}: {}{}'.format('  ' * depth, operation, status, ' (repeated)' if repeated else ''))
+            if repeated: return
+            seen.add(operation)
+
+            for dependency in node.dependencies:
+                add_lines(dependency, depth + 1, seen)
+
+        lines.append('')
+        add_lines(self.root, 0, set())
+
+        if self.order:
+            lines.append('')
+            lines.append('Order:')
+            for i, op in enumerate(self.order):
+                lines.append('{:>4}. {!r}'.format(i + 1, op))
+
+        return '\n'.join(lines)
+
+    __str__ = explain
+
+
+def _format_cost(seconds):
+    if seconds is None: return 'unknown'
+    return '{:.3f}s'.format(seconds)
+
+
+def build_plan(runner, operation, force=False):
+    """
+    Walks the DAG of `operation` level by level. The caches of each level are checked at once: the memory cache of
+    the runner first, then the out data stores, with a single contains_many call per store.
+    """
+    nodes = OrderedDict()
+    # operation -> all its dependencies, of the operations to compute
+    all_dependencies = {}
+
+    level = [operation]
+    queued = {operation}
+    while level:
+        statuses = {} if force else check_caches(runner, level)
+
+        next_level = []
+        for op in level:
+            if op in statuses:
+                status, data_store = statuses[op]
+                nodes[op] = PlanNode(op, status, data_store=data_store)
+                continue
+
+            dependencies = operation_dependencies(op)
+            all_dependencies[op] = dependencies
+            nodes[op] = PlanNode(op, COMPUTE, estimated_cost=execution_stats.estimate(op))
+            for dependency in dependencies:
+                if dependency not in queued:
+                    queued.add(dependency)
+                    next_level.append(dependency)
+
+        level = next_level
+
+    for op, dependencies in all_dependencies.iteritems():
+        nodes[op].dependencies = dependencies
+
+    # Post order from the root
+    order = []
+    visited = set()
+
+    def visit(op):
+        if op in visited: return
+        visited.add(op)
+        node = nodes[op]
+        if node.is_hit: return
+        for dependency in node.dependencies:
+            visit(dependency)
+        order.append(op)
+
+    visit(operation)
+    return ExecutionPlan(operation, nodes, order)
+
+
+def check_caches(runner, operations):
+    """
+    Looks the operations up in the execute cache of `runner` and in their out data stores, with a single
+    contains_many call per store. The values are not fetched
+
+    :return: A dict from the cached operations to (status, data store)
+    """
+    res = {}
+    by_data_store = OrderedDict()
+    for op in operations:
+        if runner.execute_cache is not None and op in runner.execute_cache:
+            res[op] = HIT_MEMORY, None
+            continue
+
+        out_data_store = op.get_out_data_store()
+        if out_data_store is not None:
+            by_data_store.setdefault(id(out_data_store), (out_data_store, []))[1].append(op)
+
+    for data_store, ops in by_data_store.itervalues():
+        for op, contained in zip(ops, data_store.contains_many(ops)):
+            if contained: res[op] = HIT_STORE, data_store
+
+    return res
@@ -1,64 +1,26 @@
 import ctypes
+import hashlib
 import inspect
-import json
+import marshal
 import os
+import threading
 import traceback
 import warnings
-from collections import OrderedDict
+import weakref
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from functools import partial
 from functools import total_ordering
-from itertools import chain
+from itertools import chain, islice, izip, product
 
 from fito.specs.fields import KwargsField, ArgsField, Field, BaseSpecField, SpecCollection, UnboundField, \
-    PrimitiveField
-from fito.specs.utils import recursive_map, is_iterable, matching_fields
-from memoized_property import memoized_property
-
-try:
-    from bson import json_util
-    from bson import json_util
-    from json import dumps, dump, load, loads
-
-
-    def json_dumps(*args, **kwargs):
-        kwargs['default'] = json_util.default
-        return dumps(*args, **kwargs)
-
-
-    def json_dump(*args, **kwargs):
-        kwargs['default'] = json_util.default
-        return dump(*args, **kwargs)
-
-
-    def set_default_json_options():
-        # how should we handle datetimes? This forces non timezone aware datetimes
-        # TODO: Either throw exception when a tz aware datetime is received, or handle both correctly
-        res = json_util.DEFAULT_JSON_OPTIONS = json_util.JSONOptions(tz_aware=False)
-        return res
-
-
-    def json_loads(*args, **kwargs):
-        kwargs['object_hook'] = partial(json_util.object_hook, json_options=set_default_json_options())
-        return loads(*args, **kwargs)
-
-
-    def json_load(*args, **kwargs):
-        kwargs['object_hook'] = partial(json_util.object_hook, json_options=set_default_json_options())
-        return load(*args, **kwargs)
-
-
-    json.dump = json_dump
-    json.dumps = json_dumps
-    json.load = json_load
-    json.loads = json_loads
-
-except ImportError:
-    warnings.warn("Couldn't import json_util from bson, won't be able to handle datetime")
-
-try:
-    import yaml
-except ImportError:
-    warnings.warn("Couldn't yaml, some features won't be enabled")
+    PrimitiveField, FieldTable
+from fito.specs.utils import recursive_map, matching_fields, atom_types
+from fito.specs.compiler import compile_spec, is_default_method
+from fito.specs.compact import FieldSlot, CompactSpecMethods, build_slots, install_field_slots, get_compact_methods, \
+    get_slot_name
+from fito.specs.registry import registry, AmbiguousSpecName
+from fito.specs import json_encoding
 
 
 class WeirdModulePathException(Exception): pass
@@ -71,8 +33,18 @@ class InvalidSpecInstance(Exception):
 class MainModuleWarning(UserWarning): pass
 
 
+class FrozenSpecError(AttributeError): pass
+
+
 warnings.filterwarnings('once', '.*', MainModuleWarning, __name__)
 
+# Live interned specs by digest, see Spec.intern
+_interned = weakref.WeakValueDictionary()
+
+# Holds the DecodeMemo being used by the current thread (see Spec.dicts2specs) and whether the specs being decoded
+# are trusted (see trusted_decoding)
+_decoding = threading.local()
+
 
 class SpecMeta(type):
     def __new__(cls, name, bases, dct):
@@ -83,7 +55,19 @@ class SpecMeta(type):
 
         :return: New Spec subclass
         """
+        compact = dct['compact'] if 'compact' in dct else any(getattr(base, 'compact', False) for base in bases)
+        if compact:
+            dct = dict(dct, __slots__=build_slots(bases, dct))
+            if not any(getattr(base, 'compact', False) for base in bases):
+                for k, v in get_compact_methods().iteritems():
+                    dct.setdefault(k, v)
+
         res = type.__new__(cls, name, bases, dct)
+        if compact: install_field_slots(res)
+        type.__setattr__(res, '_field_table', FieldTable(res))
+        res.recompile()
+        registry.register(res)
+
         if res.__doc__ is None:
             res.__doc__ = res.get_default_doc_string()
 
@@ -93,11 +77,56 @@ class SpecMeta(type):
                 "a class is imported indirectly from a yaml"
             )
 
-        check_fields(dict(res.get_bound_fields()), name)
-        check_fields(dict(res.get_unbound_fields()), name)
+        check_fields(res._field_table.bound_dict, name)
+        check_fields(res._field_table.unbound_dict, name)
 
         return res
 
+    def __setattr__(cls, name, value):
+        old_value = cls.__dict__.get(name)
+        if isinstance(value, Field) and cls.compact:
+            member = getattr(cls, get_slot_name(name), None)
+            if member is None:
+                raise TypeError("Can not add field {} to the compact class {}".format(name, cls.__name__))
+            value = FieldSlot(value, member)
+
+        type.__setattr__(cls, name, value)
+        if isinstance(value, (Field, FieldSlot)) or isinstance(old_value, (Field, FieldSlot)):
+            cls.rebuild_field_table()
+        elif name in ('__module__', '__name__', 'compiled', 'get_type_path'):
+            # The generated code depends on them
+            cls.recompile(recursive=True)
+            registry.register(cls)
+
+    def __delattr__(cls, name):
+        old_value = cls.__dict__.get(name)
+        type.__delattr__(cls, name)
+        if isinstance(old_value, (Field, FieldSlot)):
+            cls.rebuild_field_table()
+
+    def rebuild_field_table(cls):
+        """
+        Rebuilds the field table of this class and its subclasses.
+        Called when fields are added, replaced or removed after the class was created
+        """
+        queue = [cls]
+        while queue:
+            klass = queue.pop()
+            type.__setattr__(klass, '_field_table', FieldTable(klass))
+            klass.recompile()
+            queue.extend(klass.__subclasses__())
+
+    def recompile(cls, recursive=False):
+        """
+        Generates the fast paths of classes that set `compiled = True`, see :py:mod:`fito.specs.compiler`
+        """
+        queue = [cls]
+        while queue:
+            klass = queue.pop()
+            compiled = compile_spec(klass) if klass.compiled is True else None
+            type.__setattr__(klass, '_compiled', compiled)
+            if recursive: queue.extend(klass.__subclasses__())
+
 
 def check_fields(fields, class_name):
     fields_pos = sorted([attr_type.pos for attr_name, attr_type in fields.iteritems() if attr_type.pos is not None])
@@ -105,8 +134,9 @@ def check_fields(fields, class_name):
     if fields_pos != range(len(fields_pos)):
         raise ValueError("Bad `pos` for attribute in class %s" % class_name)
 
-    if 'key' in fields:
-        raise ValueError("Can not use the `key` field, it's reserved")
+    for reserved in ('key', 'digest'):
+        if reserved in fields:
+            raise ValueError("Can not use the `{}` field, it's reserved".format(reserved))
 
 
 class MissingUnwiredParamError(Exception):
@@ -147,21 +177,59 @@ class Spec(object):
     And load it back
     >>> with open('exp_spec.yaml') as f:
     >>>     exp = Experiment.from_yaml()
+
+    Subclasses can set `compiled = True` in order to have SpecMeta generate specialized code for initialize,
+    to_dict and _from_dict, see :py:mod:`fito.specs.compiler`
+
+    Subclasses can set `frozen = True` in order to make their instances immutable: fields can not be changed once
+    the instance is created (a :py:class:`FrozenSpecError` is raised), so the key, digest and hash are computed only
+    once. Use `replace` or `bind` to get modified copies
+
+    Subclasses can set `compact = True` in order to store the fields of their instances in `__slots__` instead of a
+    `__dict__`, and to not memoize their keys. That's meant for keeping many instances in memory (e.g. model grids),
+    see :py:mod:`fito.specs.compact`
     """
     __metaclass__ = SpecMeta
 
+    compiled = False
+    frozen = False
+    compact = False
+
     def __init__(self, *args, **kwargs):
-        self.initialize(True, *args, **kwargs)
+        compiled = type(self)._compiled
+        if compiled is None or compiled.initialize is None:
+            self.initialize(True, *args, **kwargs)
+        else:
+            compiled.initialize(self, args, kwargs)
+
+        if type(self).frozen: self._freeze()
+
+    def _freeze(self):
+        self.__dict__['_frozen'] = True
+
+    def is_frozen(self):
+        return '_frozen' in self.__dict__
+
+    @contextmanager
+    def _thawed(self):
+        """
+        Allows to modify the fields of a frozen spec, only meant for specs that are still being built
+        """
+        frozen = self.__dict__.pop('_frozen', None)
+        try:
+            yield self
+        finally:
+            if frozen is not None:
+                self.invalidate()
+                self.__dict__['_frozen'] = frozen
 
     @classmethod
     def auto_instance(cls, locals, globals):
         context = locals.copy()
         context.update(globals)
 
-        fields = dict(cls.get_bound_fields())
-
         instance_kwargs = {}
-        for field, field_spec in fields.iteritems():
+        for field, field_spec in cls._field_table.bound_dict.iteritems():
             if isinstance(field_spec, BaseSpecField):
                 if field in context and isinstance(context[field], Spec):
                     # If there's a spec with that name in the context, use it
@@ -205,36 +273,19 @@ class Spec(object):
 
         :param being_created: Tells the method whether *args map to bound or unbound fields
         """
-        pos2name = {}
-        kwargs_field = None
-        args_field = None
-
-        all_fields = dict(self.get_fields())
-        bound_fields = dict(self.get_bound_fields())
-        unbound_fields = dict(self.get_unbound_fields())
-
-        # Check positional arguments
-        for attr_name, attr_type in (bound_fields if being_created else unbound_fields).iteritems():
-            if attr_type.pos is not None:
-                pos2name[attr_type.pos] = attr_name
-
-            elif isinstance(attr_type, KwargsField):
-                # KwargsField always have pos = None
-                if kwargs_field is not None:
-                    raise RuntimeError(
-                        "A spec can have at most one kwargs field, found {} and {}".format(attr_name, kwargs_field))
-                kwargs_field = attr_name
-
-            elif isinstance(attr_type, ArgsField):
-                if args_field is not None:
-                    raise RuntimeError(
-                        "A spec can have at most one args field, found {} and {}".format(attr_name, kwargs_field))
-                args_field = attr_name
-
-        if len(pos2name) == 0:
-            max_nargs = 0
-        else:
-            max_nargs = (max(pos2name) + 1)
+        field_table = type(self)._field_table
+        all_fields = field_table.field_dict
+        bound_fields = field_table.bound_dict
+        unbound_fields = field_table.unbound_dict
+
+        argument_table = field_table.created if being_created else field_table.binding
+        if argument_table.error is not None:
+            raise RuntimeError(argument_table.error)
+
+        pos2name = argument_table.pos2name
+        kwargs_field = argument_table.kwargs_field
+        args_field = argument_table.args_field
+        max_nargs = argument_table.max_nargs
 
         if len(args) > max_nargs and args_field is None:
             raise InvalidSpecInstance(
@@ -261,10 +312,9 @@ class Spec(object):
             kwargs.pop(args_field, None)
 
         # Set defaults for missing kwargs, that do have default
-        for attr, attr_type in (bound_fields if being_created else unbound_fields).iteritems():
-            if attr not in kwargs and attr != args_field:
-                if attr_type.has_default_value():
-                    kwargs[attr] = attr_type.default
+        for attr, attr_type in argument_table.defaults:
+            if attr not in kwargs:
+                kwargs[attr] = attr_type.default
 
         # If there's an actual kwargs field, put all extra keyword arguments there
         if kwargs_field is not None:
@@ -337,20 +387,75 @@ class Spec(object):
         return self
 
     def copy(self):
+        """
+        Deep copy of this spec, nothing is shared with it. The specs made by replace, vary and bind share the values
+        that they don't change instead, see _copy_with
+        """
         return type(self)._from_dict(self.to_dict(include_all=True))
 
+    def _copy_with(self, changes):
+        """
+        Copies this spec without serializing it: the copy shares the values of the fields, subspecs included, and
+        only the containers of the collection fields are copied
+
+        :param changes: Dict with the new values of some fields, they are not validated
+        """
+        cls = type(self)
+        values = {}
+        for attr, attr_type in cls._field_table.fields:
+            if attr in changes:
+                val = changes[attr]
+            else:
+                val = getattr(self, attr)
+                if isinstance(attr_type, SpecCollection): val = copy_collection(val)
+
+            # Do not consider fields not bound yet
+            if isinstance(val, UnboundField): continue
+            values[attr] = val
+
+        if can_build_trusted(cls):
+            return new_spec(cls, values)
+
+        args, kwargs = values2arguments(cls, values)
+        return cls(*args, **kwargs)
+
+    def _check_replacement(self, attr, val):
+        field_spec = self.get_field_spec(attr)
+
+        if not field_spec.check_valid_value(val):
+            raise InvalidSpecInstance(
+                "Invalid value for field {}. Received {}, expected {}".format(attr, val, field_spec.allowed_types)
+            )
+
     def replace(self, **kwargs):
-        res = self.copy()
+        """
+        :return: A copy of this spec with the fields in `kwargs` replaced. It shares the rest of the values with this
+            one, subspecs included, so they should not be modified in place
+        """
         for attr, val in kwargs.iteritems():
-            field_spec = self.get_field_spec(attr)
+            self._check_replacement(attr, val)
+        return self._copy_with(kwargs)
 
-            if not field_spec.check_valid_value(val):
-                raise InvalidSpecInstance(
-                    "Invalid value for field {}. Received {}, expected {}".format(attr, val, field_spec.allowed_types)
-                )
+    def vary(self, **fields):
+        """
+        Generates the copies of this spec for every combination of the given values (e.g. for a parameter sweep)
 
-            setattr(res, attr, val)
-        return res
+        >>> for model in LinearRegression().vary(alpha=[0.1, 1, 10], fit_intercept=[True, False]):
+        >>>     runner.execute(Experiment(input=input, model=model))
+
+        The values are validated once, and every copy shares the fields that don't vary (see `copy`).
+
+        :param fields: Iterables of values for each field to vary, the combinations are generated in the order of
+            the field names
+        :return: A generator of specs
+        """
+        names = sorted(fields)
+        values = [list(fields[name]) for name in names]
+        for name, field_values in izip(names, values):
+            for val in field_values:
+                self._check_replacement(name, val)
+
+        return (self._copy_with(dict(izip(names, combination))) for combination in product(*values))
 
     @classmethod
     def get_field_spec(cls, field_name):
@@ -360,27 +465,129 @@ class Spec(object):
 
     def get_spec_fields(self):
         res = {}
-        for attr, attr_type in type(self).get_fields():
-            if isinstance(attr_type, BaseSpecField):
-                res[attr] = getattr(self, attr)
+        for attr in type(self)._field_table.spec_fields:
+            res[attr] = getattr(self, attr)
         return res
 
     def get_primitive_fields(self):
         res = {}
-        for attr, attr_type in type(self).get_fields():
-            if isinstance(attr_type, PrimitiveField):
-                res[attr] = getattr(self, attr)
+        for attr in type(self)._field_table.primitive_fields:
+            res[attr] = getattr(self, attr)
         return res
 
-    @memoized_property
+    @property
     def key(self):
-        return self._dict2key(self.to_dict(include_all=False))
+        """
+        Full json representation of this spec, it is what data stores persist
+        """
+        res = self.__dict__.get('_key')
+        if res is None:
+            res = self.__dict__['_key'] = self._dict2key(self.to_dict(include_all=False))
+        return res
+
+    @property
+    def digest(self):
+        """
+        Fixed size digest of this spec. It is built from the digests of the subspecs (which are cached) plus the
+        primitive fields, so computing it for a chain of specs does not serialize the chain over and over.
+
+        It is invalidated whenever this spec or any of its subspecs is modified.
+        Equals :py:func:`dict_digest` of `self.to_dict()`
+        """
+        res = self.__dict__.get('_digest')
+        if res is None:
+            res = self.__dict__['_digest'] = self._compute_digest()
+        return res
+
+    def _compute_digest(self):
+        cls = type(self)
+
+        if getattr(cls.to_dict, 'im_func', None) is not Spec.to_dict.im_func:
+            # to_dict was overriden, so the only safe thing is to digest its output
+            for spec in self.get_spec_fields().itervalues():
+                if isinstance(spec, Spec): spec._add_dependent(self)
+            return dict_digest(self.to_dict(include_all=False))
+
+        if inspect.getmodule(cls).__name__ == '__main__':
+            warn_main_module(cls)
+
+        res = {'type': digest_value(cls.get_type_path())}
+        for attr, attr_type in cls._field_table.fields:
+            if attr not in cls._field_table.serialized: continue
+
+            val = getattr(self, attr)
+            if isinstance(val, UnboundField): continue
+
+            if isinstance(attr_type, PrimitiveField):
+                res[attr] = digest_value(encode_primitive(val))
+            elif isinstance(attr_type, (BaseSpecField, SpecCollection)):
+                res[attr] = digest_value(val, self)
+
+        return _digest(res)
+
+    def _add_dependent(self, spec):
+        """
+        Registers `spec` as a spec whose digest was built using this one
+        """
+        # Frozen specs can not change, no need to keep track of who depends on them
+        if '_frozen' in self.__dict__: return
+
+        dependents = self.__dict__.get('_dependents')
+        if dependents is None:
+            dependents = self.__dict__['_dependents'] = {}
+        dependents[id(spec)] = weakref.ref(spec)
+
+    def invalidate(self):
+        """
+        Drops the cached key and digest of this spec and of every spec that contains it
+        """
+        queue = [self]
+        while queue:
+            dependents = queue.pop()._drop_caches()
+            if dependents:
+                queue.extend(filter(None, (ref() for ref in dependents.itervalues())))
+
+    def _drop_caches(self):
+        """
+        Drops the cached key and digest of this spec
+        :return: The dependents of this spec, see _add_dependent
+        """
+        spec_dict = self.__dict__
+        spec_dict.pop('_key', None)
+        spec_dict.pop('_binary_key', None)
+        spec_dict.pop('_digest', None)
+        spec_dict.pop('_hash', None)
+        return spec_dict.pop('_dependents', None)
+
+    def __getstate__(self):
+        """
+        The caches are not pickled: the subspecs are unpickled as new objects, which could not invalidate them
+        """
+        res = self.__dict__.copy()
+        for cache in ('_key', '_binary_key', '_digest', '_hash', '_dependents'):
+            res.pop(cache, None)
+        return res
 
     def __setattr__(self, key, value):
-        # invalidate key cache if you change the object
-        if hasattr(self, '_key'): del self._key
+        spec_dict = self.__dict__
+        if '_frozen' in spec_dict:
+            # Attributes that are not fields do not change the key, they are allowed
+            if key in type(self)._field_table.field_dict:
+                raise FrozenSpecError("Can not set field {} of a frozen {}".format(key, type(self).__name__))
+
+        # invalidate key and digest caches if you change the object
+        elif '_key' in spec_dict or '_digest' in spec_dict or '_dependents' in spec_dict or \
+                '_binary_key' in spec_dict:
+            self.invalidate()
+
         return super(Spec, self).__setattr__(key, value)
 
+    def __delattr__(self, key):
+        if '_frozen' in self.__dict__ and key in type(self)._field_table.field_dict:
+            raise FrozenSpecError("Can not delete field {} of a frozen {}".format(key, type(self).__name__))
+        self.invalidate()
+        return super(Spec, self).__delattr__(key)
+
     def to_kwargs(self, include_all=False):
         """
         Useful function to call f(**spec.to_kwargs())
@@ -399,12 +606,14 @@ class Spec(object):
 
     @property
     def yaml(self, include_all=False):
+        # yaml is a good share of the import time of fito, it's imported when it's needed
+        import yaml
         yaml.dumps = yaml.dump
         return Spec.Exporter(yaml, self.to_dict(include_all=include_all), default_flow_style=False)
 
     @property
     def json(self, include_all=False):
-        return Spec.Exporter(json, self.to_dict(include_all=include_all), indent=2)
+        return Spec.Exporter(json_encoding, self.to_dict(include_all=include_all), indent=2)
 
     class Importer(object):
         def __init__(self, cls, module):
@@ -419,34 +628,38 @@ class Spec(object):
 
     @classmethod
     def from_json(cls):
-        return Spec.Importer(cls, json)
+        return Spec.Importer(cls, json_encoding)
 
     @classmethod
     def from_yaml(cls):
+        import yaml
         yaml.loads = yaml.load
         return Spec.Importer(cls, yaml)
 
+    @classmethod
+    def get_field_table(cls):
+        """
+        :return: The :py:class:`FieldTable` that SpecMeta built for this class
+        """
+        return cls._field_table
+
     @classmethod
     def get_fields(cls):
-        for k in dir(cls):
-            v = getattr(cls, k)
-            if isinstance(v, Field):
-                yield k, v
+        return iter(cls._field_table.fields)
 
     @classmethod
     def get_unbound_fields(cls):
-        for k, v in cls.get_fields():
-            if isinstance(v, UnboundField):
-                yield k, v
+        return iter(cls._field_table.unbound)
 
     @classmethod
     def get_bound_fields(cls):
-        for k, v in cls.get_fields():
-            if not isinstance(v, UnboundField):
-                yield k, v
+        return iter(cls._field_table.bound)
 
     def bind(self, *args, **kwargs):
-        return self.copy().initialize(False, *args, **kwargs)
+        # Binding sets the fields of the copy, the values it shares with this spec are left alone
+        res = self._copy_with({})
+        with res._thawed():
+            return res.initialize(False, *args, **kwargs)
 
     def inplace_bind(self, *args, **kwargs):
         return self.initialize(False, *args, **kwargs)
@@ -471,42 +684,72 @@ class Spec(object):
         :param spec_type: Either the name of the class, which must be imported before calling this function or the
         import path spec
         :return: A subclass of Spec
+        :raises AmbiguousSpecName: When given a name and there are many classes with it
         """
         if not isinstance(spec_type, dict) and not isinstance(spec_type, basestring):
             raise ValueError("Invalid type for spec_type")
 
-        if (isinstance(spec_type, dict) or
-                    ':' in spec_type or
-                    '.' in spec_type):
+        if isinstance(spec_type, dict):
+            return resolve_method_path(spec_type)
 
-            cls = obj_from_path(spec_type)
-            assert issubclass(cls, Spec), "The provided path does not point to an Spec subclass"
+        elif ':' in spec_type or '.' in spec_type:
+            cls = registry.get_by_path(spec_type)
+            if cls is None:
+                cls = obj_from_path(spec_type)
+                assert issubclass(cls, Spec), "The provided path does not point to an Spec subclass"
+                # Paths with ids point to live objects, don't trust them
+                if '@' not in spec_type: registry.add_alias(spec_type, cls)
             return cls
         else:
             # Then assume it's the name of the class, this is somewhat legacy
-            for cls in Spec._get_all_subclasses():
-                if cls.__name__ == spec_type: return cls
+            return registry.get_by_name(spec_type)
 
     @staticmethod
-    def dict2spec(dict, path=None):
+    def dict2spec(dict, path=None, intern=False, trusted=False):
         """
         Loads a Spec from a dictionary
         :param dict: Dictionary to load it from
         :param path: Used to build relative paths when referencing other files, see Spec.Importer.load
+        :param intern: Whether to return the interned instance, see Spec.intern
+        :param trusted: Whether the dict was already validated (e.g. it was written by a data store), see
+            trusted_decoding
         """
-        cls = Spec.type2spec_class(dict['type'])
-        if cls is None:
-            raise ValueError(
-                "Unknown spec type: {}\n".format(dict['type']) +
-                "This might happen if you are referencing an Spec that hasn't been imported"
-            )
+        if trusted and not getattr(_decoding, 'trusted', False):
+            with trusted_decoding():
+                return Spec.dict2spec(dict, path=path, intern=intern)
+
+        memo = getattr(_decoding, 'memo', None)
+        if memo is None:
+            res = load_spec(dict, path)
+        else:
+            res = memo.load_spec(dict, path)
 
-        return cls._from_dict(dict, path=path)
+        if intern: res = res.intern()
+        return res
+
+    @staticmethod
+    def dicts2specs(dicts, pool=None, on_error=None, intern=False, chunk_size=1000, trusted=False):
+        """
+        Loads many specs at once, meant for scanning data stores.
+        Equal subspecs (or specs) are decoded only once, so the returned specs share them.
+
+        :param dicts: Iterable of dicts, it is consumed lazily
+        :param pool: Optional pool (e.g. `multiprocessing.Pool`) to decode chunks of `chunk_size` dicts in parallel.
+        :param on_error: Called as `on_error(dict, exception)` with the dicts that can not be loaded, which are
+            skipped. By default the exception is raised
+        :param intern: Whether to intern the returned specs, see Spec.intern
+        :param trusted: Whether the dicts were already validated, see trusted_decoding
+        :return: A generator of specs, in the same order than `dicts`
+        """
+        if pool is None:
+            return _iter_dicts2specs(dicts, on_error, intern, trusted)
+        else:
+            return _iter_pool_dicts2specs(dicts, pool, on_error, intern, chunk_size, trusted)
 
     @staticmethod
-    def key2spec(str):
+    def key2spec(str, intern=False, trusted=False):
         try:
-            return Spec.dict2spec(Spec.key2dict(str))
+            return Spec.dict2spec(Spec.key2dict(str), intern=intern, trusted=trusted)
         except ValueError, e:
             raise e
         except Exception, e:
@@ -514,68 +757,109 @@ class Spec(object):
             raise ValueError(e.args)
 
     def __hash__(self):
-        return hash(self.key)
+        res = self.__dict__.get('_hash')
+        if res is None:
+            res = self.__dict__['_hash'] = hash(self.digest)
+        return res
 
     def __eq__(self, other):
-        return isinstance(other, Spec) and self.key == other.key
+        return self is other or (isinstance(other, Spec) and self.digest == other.digest)
+
+    def intern(self):
+        """
+        Hash consing of specs: returns the live interned spec that is equal to this one, or interns this one if
+        there is none. Subspecs get interned too, so identical subtrees end up being shared. When that changes some
+        subspec, a copy of this spec gets interned instead, this one is not modified.
+
+        Specs with values in their non serialized fields (e.g. an out_data_store), or with subspecs that have them,
+        are equal to specs that do not, so they are returned as they are.
+
+        The returned spec is shared, so it should not be modified (frozen specs are a good fit).
+        """
+        res = self._intern()
+        return self if res is None else res
+
+    def _intern(self):
+        """
+        :return: The interned spec, or None if this spec can not be interned
+        """
+        field_table = type(self)._field_table
+        for attr, field in field_table.unserialized:
+            if getattr(self, attr) != field.default: return None
+
+        changes = {}
+        for attr in chain(field_table.spec_fields, field_table.collection_fields):
+            val = getattr(self, attr)
+            if val is None or isinstance(val, UnboundField): continue
+
+            interned_val = intern_value(val)
+            if interned_val is None: return None
+            if interned_val is not val: changes[attr] = interned_val
+
+        digest = self.digest
+        res = _interned.get(digest)
+        # If the interned spec was modified anyway, replace it
+        if res is not None and res.digest == digest: return res
+
+        res = self._copy_with(changes) if changes else self
+        _interned[digest] = res
+        return res
 
     def __lt__(self, other):
         return self.key < other.key
 
     def __ne__(self, other):
-        return self.key != other.key
+        return not self == other
+
+    @classmethod
+    def get_type_path(cls):
+        """
+        :return: The value of the 'type' entry of the dicts built by to_dict, it must point back to this class
+        """
+        return get_import_path(cls)
 
     def to_dict(self, include_all=False):
         """
         :param include_toggles: Wether to include or not toggle_fields, default=False
         """
-        import_path = get_import_path(type(self))
+        compiled = type(self)._compiled
+        if compiled is not None:
+            return compiled.to_dict(self, include_all)
+
+        import_path = type(self).get_type_path()
         if inspect.getmodule(type(self)).__name__ == '__main__':
-            warnings.warn(
-                """
-                The module of {} is __main__.
-                It's likely that you are not going to be able to desserialize this spec
-                """.format(type(self)),
-                MainModuleWarning
-            )
+            warn_main_module(type(self))
 
         res = {'type': import_path}
 
-        for attr, attr_type in self.get_fields():
+        for attr, attr_type in type(self)._field_table.fields:
             val = getattr(self, attr)
 
             # Do not consider fields not bound yet
             if isinstance(val, UnboundField): continue
 
             if isinstance(attr_type, PrimitiveField) and (attr_type.serialize or include_all):
-                if inspect.isfunction(val) or inspect.isclass(val):
-                    val = 'import {}'.format(get_import_path(val))
-                elif isinstance(val, basestring) and val.startswith('import '):
-                    val = '!!{}'.format(val)
-
-                res[attr] = val
+                res[attr] = encode_primitive(val)
 
             elif isinstance(attr_type, BaseSpecField) and (include_all or attr_type.serialize):
                 res[attr] = val if val is None else val.to_dict(include_all=include_all)
 
             elif isinstance(attr_type, SpecCollection) and (include_all or attr_type.serialize):
-                def f(obj):
-                    if isinstance(obj, Spec):
-                        return obj.to_dict(include_all=include_all)
-                    else:
-                        return obj
-
-                res[attr] = recursive_map(val, f)
+                res[attr] = encode_collection(val, include_all)
 
         return res
 
     @classmethod
     def _from_dict(cls, kwargs, path=None):
+        compiled = cls._compiled
+        if compiled is not None:
+            return compiled.from_dict(cls, kwargs, path)
+
         kwargs = kwargs.copy()
         kwargs.pop('type')
         args = tuple()
 
-        for attr, attr_type in cls.get_fields():
+        for attr, attr_type in cls._field_table.fields:
             if attr not in kwargs and isinstance(attr_type, UnboundField):
                 continue
             elif attr_type.has_default_value():
@@ -584,48 +868,14 @@ class Spec(object):
                 val = kwargs[attr]
 
             if isinstance(attr_type, PrimitiveField) and isinstance(val, basestring):
-                if val.startswith('import '):
-                    kwargs[attr] = obj_from_path(val[len('import '):])
-                elif val.startswith('!!import'):
-                    kwargs[attr] = val[2:]
+                if val.startswith('import ') or val.startswith('!!import'):
+                    kwargs[attr] = decode_primitive(val)
 
             elif isinstance(attr_type, BaseSpecField) and val is not None and attr in kwargs:
-                if isinstance(val, basestring):
-                    if not os.path.exists(val) and path is not None:
-                        if not os.path.exists(os.path.join(path, val)):
-                            raise RuntimeError(
-                                "Could not load referenced file ({}) for attribute {}".format(val, attr)
-                            )
-                        val = os.path.join(path, val)
-
-                    if val.endswith('.yaml'):
-                        with open(val) as f:
-                            val = yaml.load(f)
-                    elif val.endswith('.json'):
-                        with open(val) as f:
-                            val = json.load(f)
-                    else:
-                        raise RuntimeError('Invalid extension for referenced attribute {}, path: {}'.format(attr, val))
-
-                # should be a dict
-                kwargs[attr] = Spec.dict2spec(val, path=path)
+                kwargs[attr] = decode_spec_field(attr, val, path)
 
             elif isinstance(attr_type, SpecCollection):
-                def f(obj):
-                    try:
-                        return Spec.dict2spec(obj)
-                    except:
-                        return obj
-
-                def recursion_condition(obj):
-                    try:
-                        # TODO: this masks errors in a very ugly way
-                        Spec.dict2spec(obj)
-                        return False
-                    except:
-                        return is_iterable(obj)
-
-                val = recursive_map(val, f, recursion_condition)
+                val = decode_collection(val, path)
                 if isinstance(attr_type, ArgsField):
                     args = tuple(val)
                 elif isinstance(attr_type, KwargsField):
@@ -633,24 +883,17 @@ class Spec(object):
                 else:
                     kwargs[attr] = val
 
-        return cls(*args, **kwargs)
+        return build_spec(cls, args, kwargs)
 
     @classmethod
     def _dict2key(cls, d):
-        def prepare_dict(input):
-            output = input.copy()
-            for k, v in output.iteritems():
-                if isinstance(v, dict):
-                    output[k] = prepare_dict(v)
-            return output
-
-        d = prepare_dict(d)
-        return json.dumps({'transformed': True, 'dict': sorted(d.iteritems(), key=lambda x: x[0])})
+        # Keys are unique, so the items are sorted by them
+        return json_encoding.encode_key({'transformed': True, 'dict': sorted(d.iteritems())})
 
     @classmethod
     def key2dict(cls, str):
         if str.startswith('/'): str = str[1:]
-        return cls._key2dict(json.loads(str))
+        return cls._key2dict(json_encoding.loads(str))
 
     @classmethod
     def _key2dict(cls, obj):
@@ -664,11 +907,8 @@ class Spec(object):
 
     @classmethod
     def get_default_doc_string(cls):
-        fields = list(cls.get_fields())
-        fields.sort(key=lambda x: x[1].pos or len(fields))
-
         res = ['\n\t{} fields: '.format(cls.__name__)]
-        for attr, attr_type in fields:
+        for attr, attr_type in cls._field_table.repr_order:
             res.append('\t\t{} = {}'.format(attr, attr_type))
 
         return '\n'.join(res) + '\n'
@@ -695,11 +935,8 @@ class Spec(object):
         return Diff.build(other.to_dict(), self.to_dict())
 
     def __repr__(self):
-        signature = list(self.get_fields())
-        signature.sort(key=lambda x: x[1].pos or len(signature))
-
         fields = OrderedDict()
-        for field_name, field_spec in signature:
+        for field_name, field_spec in type(self)._field_table.repr_order:
             val = getattr(self, field_name)
             # Do not print default values
             if val == field_spec.default: continue
@@ -716,6 +953,413 @@ class Spec(object):
         )
 
 
+def _digest(obj):
+    return hashlib.md5(json_encoding.encode_canonical(obj)).hexdigest()
+
+
+def dict_digest(d):
+    """
+    Digest of the output of :py:meth:`Spec.to_dict`, equals the :py:attr:`Spec.digest` of the spec it represents
+    """
+    return _digest({k: digest_value(v) for k, v in d.iteritems()})
+
+
+def digest_value(obj, parent=None):
+    """
+    Replaces specs and spec dicts inside `obj` by their digests
+
+    :param parent: If given, it is registered as a dependent of the specs found, so it gets invalidated along them
+    """
+    if isinstance(obj, Spec):
+        if parent is not None: obj._add_dependent(parent)
+        return {'$digest': obj.digest}
+    elif isinstance(obj, dict):
+        if 'type' in obj: return {'$digest': dict_digest(obj)}
+        return {k: digest_value(v, parent) for k, v in obj.iteritems()}
+    elif isinstance(obj, (list, tuple)):
+        return [digest_value(e, parent) for e in obj]
+    return obj
+
+
+def load_spec(spec_dict, path=None):
+    cls = Spec.type2spec_class(spec_dict['type'])
+    if cls is None:
+        raise ValueError(
+            "Unknown spec type: {}\n".format(spec_dict['type']) +
+            "This might happen if you are referencing an Spec that hasn't been imported"
+        )
+
+    return cls._from_dict(spec_dict, path=path)
+
+
+@contextmanager
+def trusted_decoding(trusted=True):
+    """
+    Within this context the specs loaded by :py:meth:`Spec._from_dict` are trusted to be valid, like the ones that
+    data stores wrote: the argument checks and `check_valid_value` are skipped, see :py:func:`build_spec`
+    """
+    previous = getattr(_decoding, 'trusted', False)
+    _decoding.trusted = trusted
+    try:
+        yield
+    finally:
+        _decoding.trusted = previous
+
+
+def can_build_trusted(cls):
+    """
+    Whether the instances of `cls` can be built by assigning their fields, i.e. construction was not customized
+    """
+    setattr_func = getattr(cls.__setattr__, 'im_func', None)
+    return (
+        is_default_method(cls, '__init__') and
+        is_default_method(cls, 'initialize') and
+        (setattr_func is Spec.__setattr__.im_func or setattr_func is CompactSpecMethods.__setattr__.im_func)
+    )
+
+
+def build_spec(cls, args, kwargs):
+    """
+    Creates the spec loaded by :py:meth:`Spec._from_dict` from the decoded values of its fields.
+
+    It calls `cls(*args, **kwargs)`, unless the spec is being decoded within :py:func:`trusted_decoding`. In that
+    case the values are assigned straight away, falling back to the constructor whenever the arguments are not the
+    expected ones so the usual errors are raised
+    """
+    if not getattr(_decoding, 'trusted', False) or not can_build_trusted(cls):
+        return cls(*args, **kwargs)
+
+    field_table = cls._field_table
+    argument_table = field_table.created
+    all_fields = field_table.field_dict
+    args_field = argument_table.args_field
+    kwargs_field = argument_table.kwargs_field
+
+    if args and args_field is None: return cls(*args, **kwargs)
+    if kwargs_field is None and not all_fields.viewkeys() >= kwargs.viewkeys(): return cls(*args, **kwargs)
+
+    values = {attr: attr_type.default for attr, attr_type in argument_table.defaults}
+    if kwargs_field is None:
+        values.update(kwargs)
+    else:
+        extra = {}
+        for attr, val in kwargs.iteritems():
+            if attr not in all_fields:
+                extra[attr] = val
+            elif attr != kwargs_field:
+                values[attr] = val
+        values[kwargs_field] = extra
+
+    if args_field is not None:
+        values[args_field] = tuple(args)
+
+    if not values.viewkeys() >= field_table.bound_dict.viewkeys(): return cls(*args, **kwargs)
+
+    return new_spec(cls, values)
+
+
+def new_spec(cls, values):
+    """
+    Creates an instance of `cls` by assigning the values of its fields, see :py:func:`can_build_trusted`
+    """
+    res = cls.__new__(cls)
+    if cls.compact:
+        for attr, val in values.iteritems():
+            object.__setattr__(res, attr, val)
+    else:
+        res.__dict__.update(values)
+
+    if cls.frozen: res._freeze()
+    return res
+
+
+def values2arguments(cls, values):
+    """
+    Inverse of :py:meth:`Spec.initialize`: maps the values of the fields of a spec to the arguments that create it
+    :return: A tuple (args, kwargs)
+    """
+    argument_table = cls._field_table.created
+    args_field = argument_table.args_field
+    kwargs_field = argument_table.kwargs_field
+
+    kwargs = values.copy()
+    if kwargs_field is not None:
+        kwargs.update(kwargs.pop(kwargs_field, {}))
+
+    if args_field is None:
+        return (), kwargs
+
+    # The extra positional arguments can only be passed after the positional fields
+    args = [kwargs.pop(argument_table.pos2name[i]) for i in xrange(argument_table.max_nargs)]
+    args.extend(kwargs.pop(args_field, ()))
+    return tuple(args), kwargs
+
+
+class DecodeMemo(object):
+    """
+    Remembers the subspecs decoded by :py:meth:`Spec.dicts2specs`, so equal ones are only decoded once.
+    """
+
+    def __init__(self, max_size=100000, trusted=False):
+        self.specs = {}
+        self.max_size = max_size
+        self.trusted = trusted
+
+    def load_spec(self, spec_dict, path=None):
+        try:
+            # Equal bytes imply equal dicts (types included), which is all we need. It's way faster than json
+            key = marshal.dumps(spec_dict)
+        except ValueError:
+            # datetimes and other objects can not be marshaled
+            return load_spec(spec_dict, path)
+
+        res = self.specs.get(key)
+        if res is None:
+            if len(self.specs) >= self.max_size: self.specs.clear()
+            res = self.specs[key] = load_spec(spec_dict, path)
+        return res
+
+    def load_root_spec(self, spec_dict, intern):
+        """
+        Loads a spec using this memo for its subspecs.
+        The root specs are not memoized, in a data store they are all different
+        """
+        previous = getattr(_decoding, 'memo', None), getattr(_decoding, 'trusted', False)
+        _decoding.memo = self
+        _decoding.trusted = self.trusted
+        try:
+            res = load_spec(spec_dict)
+        finally:
+            _decoding.memo, _decoding.trusted = previous
+
+        return res.intern() if intern else res
+
+
+def _iter_dicts2specs(dicts, on_error, intern, trusted):
+    memo = DecodeMemo(trusted=trusted)
+    for d in dicts:
+        try:
+            spec = memo.load_root_spec(d, intern)
+        except Exception, e:
+            if on_error is None: raise
+            on_error(d, e)
+            continue
+
+        yield spec
+
+
+def decode_chunk(dicts, intern=False, trusted=False):
+    """
+    Worker function of :py:meth:`Spec.dicts2specs`
+    :return: A list of (spec, exception) pairs
+    """
+    memo = DecodeMemo(trusted=trusted)
+    res = []
+    for d in dicts:
+        try:
+            res.append((memo.load_root_spec(d, intern), None))
+        except Exception, e:
+            res.append((None, e))
+    return res
+
+
+def _iter_pool_dicts2specs(dicts, pool, on_error, intern, chunk_size, trusted):
+    # The pool consumes the chunks from another thread, in order
+    chunks = deque()
+
+    def iter_chunks():
+        dicts_iter = iter(dicts)
+        while True:
+            chunk = list(islice(dicts_iter, chunk_size))
+            if not chunk: break
+            chunks.append(chunk)
+            yield chunk
+
+    for results in pool.imap(partial(decode_chunk, intern=intern, trusted=trusted), iter_chunks()):
+        for d, (spec, error) in izip(chunks.popleft(), results):
+            if error is not None:
+                if on_error is None: raise error
+                on_error(d, error)
+                continue
+
+            yield spec
+
+
+def resolve_method_path(path):
+    """
+    Resolves the dict paths built by :py:func:`get_import_path` for operations created from methods of specs.
+    The resolution is memoized by digest.
+    """
+    key = dict_digest(path)
+    cls = registry.get_by_path(key)
+
+    # The classes of operations built from methods are shared and get rebound to the last instance they were
+    # resolved from, so check it is still bound to an equal one
+    if cls is None or dict_digest(cls.get_type_path()) != key:
+        cls = obj_from_path(path)
+        assert issubclass(cls, Spec), "The provided path does not point to an Spec subclass"
+        registry.add_alias(key, cls)
+
+    return cls
+
+
+def intern_value(obj):
+    """
+    Interns the specs inside `obj`, collections are only copied when some of their elements were replaced
+
+    :return: None if some spec can not be interned, see Spec.intern
+    """
+    if isinstance(obj, Spec):
+        return obj._intern()
+    elif isinstance(obj, dict):
+        res = {}
+        for k, v in obj.iteritems():
+            res[k] = intern_value(v)
+            if res[k] is None and v is not None: return None
+        if all(v is obj[k] for k, v in res.iteritems()): return obj
+        return type(obj)(res)
+    elif isinstance(obj, (list, tuple)):
+        res = []
+        for e in obj:
+            res.append(intern_value(e))
+            if res[-1] is None and e is not None: return None
+        if all(a is b for a, b in zip(res, obj)): return obj
+        return res if isinstance(obj, list) else tuple(res)
+    return obj
+
+
+def warn_main_module(cls):
+    warnings.warn(
+        """
+        The module of {} is __main__.
+        It's likely that you are not going to be able to desserialize this spec
+        """.format(cls),
+        MainModuleWarning
+    )
+
+
+def encode_primitive(val):
+    """
+    Serializes the value of a :py:class:`PrimitiveField`
+    """
+    if inspect.isfunction(val) or inspect.isclass(val):
+        return 'import {}'.format(get_import_path(val))
+    elif isinstance(val, basestring) and val.startswith('import '):
+        return '!!{}'.format(val)
+    return val
+
+
+def encode_collection(val, include_all):
+    """
+    Serializes the value of a :py:class:`SpecCollection`
+    """
+    def f(obj):
+        if isinstance(obj, Spec):
+            return obj.to_dict(include_all=include_all)
+        else:
+            return obj
+
+    return recursive_map(val, f, identity_types=atom_types)
+
+
+def copy_collection(val):
+    """
+    Copies the lists, tuples and dicts of the value of a :py:class:`SpecCollection`, the specs and the rest of the
+    values are shared
+    """
+    if isinstance(val, dict):
+        return {k: copy_collection(v) for k, v in val.iteritems()}
+    elif isinstance(val, list):
+        return [copy_collection(e) for e in val]
+    elif isinstance(val, tuple):
+        return tuple(copy_collection(e) for e in val)
+    return val
+
+
+def decode_primitive(val):
+    """
+    Inverse of :py:func:`encode_primitive` for strings
+    """
+    if val.startswith('import '):
+        return obj_from_path(val[len('import '):])
+    elif val.startswith('!!import'):
+        return val[2:]
+    return val
+
+
+def decode_spec_field(attr, val, path):
+    """
+    Loads the value of a :py:class:`BaseSpecField`, which can be either a dict or a reference to a yaml/json file
+    """
+    if isinstance(val, basestring):
+        if not os.path.exists(val) and path is not None:
+            if not os.path.exists(os.path.join(path, val)):
+                raise RuntimeError(
+                    "Could not load referenced file ({}) for attribute {}".format(val, attr)
+                )
+            val = os.path.join(path, val)
+
+        if val.endswith('.yaml'):
+            import yaml
+            with open(val) as f:
+                val = yaml.load(f)
+        elif val.endswith('.json'):
+            with open(val) as f:
+                val = json_encoding.load(f)
+        else:
+            raise RuntimeError('Invalid extension for referenced attribute {}, path: {}'.format(attr, val))
+
+    # should be a dict
+    return Spec.dict2spec(val, path=path)
+
+
+def decode_collection(val, path=None):
+    """
+    Loads the value of a :py:class:`SpecCollection`
+
+    The collection is walked once: the dicts whose `type` key names a Spec subclass are specs serialized by
+    :py:func:`encode_collection`, the other lists, tuples and dicts are decoded recursively and the rest of the values
+    are left as they are. Errors raised while loading the specs are propagated
+    """
+    if isinstance(val, dict):
+        return {k: decode_collection_item(v, path) for k, v in val.iteritems()}
+
+    res = [decode_collection_item(e, path) for e in val]
+    if isinstance(val, tuple): res = tuple(res)
+    return res
+
+
+def decode_collection_item(obj, path=None):
+    if isinstance(obj, dict):
+        if 'type' in obj and is_spec_dict(obj):
+            return Spec.dict2spec(obj, path=path)
+    elif not isinstance(obj, (list, tuple)):
+        return obj
+
+    return decode_collection(obj, path)
+
+
+def is_spec_dict(obj):
+    """
+    Whether a dict of a collection is a serialized spec. Plain dicts can have a `type` key too, they are the ones
+    whose type does not resolve to a Spec subclass
+    """
+    spec_type = obj.get('type')
+    if isinstance(spec_type, basestring):
+        if registry.get_by_path(spec_type) is not None: return True
+    elif not isinstance(spec_type, dict):
+        return False
+
+    try:
+        cls = Spec.type2spec_class(spec_type)
+    except AmbiguousSpecName:
+        # It names many specs
+        return True
+    except Exception:
+        return False
+    return inspect.isclass(cls) and issubclass(cls, Spec)
+
+
 def is_import_path(obj):
     try:
         return obj != obj_from_path(obj)
@@ -0,0 +1,186 @@
+"""
+Storage of the Spec subclasses that set `compact = True`.
+
+SpecMeta gives these classes one `__slots__` entry per field (plus a few entries for the cached digest and hash) and
+replaces each field in the class by a :py:class:`FieldSlot`, which reads and writes the slot while still returning
+the field when accessed from the class.
+
+Instances still inherit the `__dict__` slot of Spec, but python only allocates the dict when an attribute that is not
+a slot is set, which does not happen unless the user sets attributes that are not fields.
+
+The methods that deal with the caches of regular specs go straight to `__dict__`, :py:class:`CompactSpecMethods`
+holds their counterparts for compact specs and SpecMeta copies them into the class that turns on `compact`.
+"""
+import weakref
+from contextlib import contextmanager
+
+from fito.specs.fields import Field
+
+# Slots used by the caches, see Spec.digest and Spec.__hash__
+cache_slots = ('_digest', '_hash', '_frozen', '_dependents')
+
+
+def get_slot_name(attr):
+    return '_slot_{}'.format(attr)
+
+
+class FieldSlot(object):
+    """
+    Class attribute of a compact spec for one of its fields.
+
+    Instances read and write the value from the slot, and see the field itself while the slot is empty (like regular
+    specs see the class attribute when the field was not set yet, e.g. unbound fields).
+    """
+    __slots__ = ('field', 'member')
+
+    def __init__(self, field, member):
+        self.field = field
+        self.member = member
+
+    def __get__(self, instance, owner):
+        if instance is None: return self.field
+        try:
+            return self.member.__get__(instance, owner)
+        except AttributeError:
+            return self.field
+
+    def __set__(self, instance, value):
+        self.member.__set__(instance, value)
+
+    def __delete__(self, instance):
+        self.member.__delete__(instance)
+
+
+def build_slots(bases, dct):
+    """
+    :return: The `__slots__` that a compact class needs on top of the ones its bases already have
+    """
+    fields = set(k for k, v in dct.iteritems() if isinstance(v, (Field, FieldSlot)))
+    for base in bases:
+        fields.update(k for k in dir(base) if isinstance(getattr(base, k, None), Field))
+
+    def has_slot(name):
+        return any(hasattr(base, name) for base in bases)
+
+    res = [get_slot_name(attr) for attr in sorted(fields) if not has_slot(get_slot_name(attr))]
+    res.extend(name for name in cache_slots if not has_slot(name))
+    return tuple(res)
+
+
+def install_field_slots(cls):
+    """
+    Wraps the fields of `cls` that are not wrapped by a :py:class:`FieldSlot` yet (i.e. the ones defined by `cls` or
+    inherited from classes that are not compact)
+    """
+    for attr in dir(cls):
+        value = next(klass.__dict__[attr] for klass in cls.__mro__ if attr in klass.__dict__)
+        if isinstance(value, Field):
+            type.__setattr__(cls, attr, FieldSlot(value, getattr(cls, get_slot_name(attr))))
+
+
+def get_compact_methods():
+    """
+    :return: The methods that SpecMeta copies into the classes that turn on `compact`
+    """
+    return {
+        k: v for k, v in CompactSpecMethods.__dict__.iteritems()
+        if k not in ('__module__', '__doc__', '__dict__', '__weakref__')
+    }
+
+
+class CompactSpecMethods(object):
+    """
+    Counterparts of the Spec methods that deal with caches and frozen state. The key is not memoized, compact specs
+    are meant for big collections where those strings are what takes the memory
+    """
+
+    def _freeze(self):
+        object.__setattr__(self, '_frozen', True)
+
+    def is_frozen(self):
+        return getattr(self, '_frozen', False)
+
+    @contextmanager
+    def _thawed(self):
+        frozen = self.is_frozen()
+        if frozen: object.__delattr__(self, '_frozen')
+        try:
+            yield self
+        finally:
+            if frozen:
+                self.invalidate()
+                self._freeze()
+
+    @property
+    def key(self):
+        return self._dict2key(self.to_dict(include_all=False))
+
+    @property
+    def digest(self):
+        try:
+            return self._digest
+        except AttributeError:
+            res = self._compute_digest()
+            object.__setattr__(self, '_digest', res)
+            return res
+
+    def __hash__(self):
+        try:
+            return self._hash
+        except AttributeError:
+            res = hash(self.digest)
+            object.__setattr__(self, '_hash', res)
+            return res
+
+    def _add_dependent(self, spec):
+        if self.is_frozen(): return
+
+        dependents = getattr(self, '_dependents', None)
+        if dependents is None:
+            dependents = {}
+            object.__setattr__(self, '_dependents', dependents)
+        dependents[id(spec)] = weakref.ref(spec)
+
+    def _drop_caches(self):
+        res = getattr(self, '_dependents', None)
+        for name in ('_digest', '_hash', '_dependents'):
+            if hasattr(self, name): object.__delattr__(self, name)
+        return res
+
+    def __setattr__(self, key, value):
+        if self.is_frozen():
+            if key in type(self)._field_table.field_dict:
+                from fito.specs.base import FrozenSpecError
+                raise FrozenSpecError("Can not set field {} of a frozen {}".format(key, type(self).__name__))
+
+        elif hasattr(self, '_digest') or hasattr(self, '_dependents'):
+            self.invalidate()
+
+        object.__setattr__(self, key, value)
+
+    def __delattr__(self, key):
+        if self.is_frozen() and key in type(self)._field_table.field_dict:
+            from fito.specs.base import FrozenSpecError
+            raise FrozenSpecError("Can not delete field {} of a frozen {}".format(key, type(self).__name__))
+        self.invalidate()
+        object.__delattr__(self, key)
+
+    def __getstate__(self):
+        """
+        Same state than the one of regular specs: the fields that were set plus the other attributes, but not the
+        caches
+        """
+        res = dict(self.__dict__)
+        for attr in type(self)._field_table.field_dict:
+            try:
+                res[attr] = getattr(self, get_slot_name(attr))
+            except AttributeError:
+                pass
+
+        if self.is_frozen(): res['_frozen'] = True
+        return res
+
+    def __setstate__(self, state):
+        for attr, value in state.iteritems():
+            object.__setattr__(self, attr, value)
+
@@ -0,0 +1,420 @@
+"""
+Generates specialized initialize/to_dict/_from_dict functions for Spec subclasses that set `compiled = True`.
+
+The generated code is straight line code built from the class :py:class:`FieldTable`. It only handles the common
+case: whenever the received arguments look unusual (missing, extra or invalid values, unbound fields received on
+creation, etc) it falls back to the generic :py:meth:`Spec.initialize`, so errors are raised exactly as before.
+"""
+import inspect
+
+from fito.specs.fields import Field, PrimitiveField, BaseSpecField, SpecCollection, ArgsField, KwargsField, \
+    UnboundField
+from fito.specs.registry import registry
+from fito.specs.utils import atom_types
+
+# Marks a value that was not received
+_missing = object()
+
+_scalar_types = frozenset([int, long, float, bool])
+_atom_types = frozenset(atom_types)
+
+# fito.specs.base, which imports this module. Set by compile_spec
+_base = None
+
+
+class CompiledSpec(object):
+    """
+    Holds the generated functions for a Spec subclass
+    """
+
+    def __init__(self, initialize, to_dict, from_dict, source):
+        self.initialize = initialize
+        self.to_dict = to_dict
+        self.from_dict = from_dict
+        self.source = source
+
+
+def encode_collection(val, include_all):
+    """
+    Same as :py:func:`fito.specs.base.encode_collection` for the usual values of collection fields (lists, tuples and
+    dicts of specs and atoms) without its generic traversal. Other values go through it
+    """
+    cls = type(val)
+    if cls is dict:
+        res = {}
+        items = val.iteritems()
+    elif cls is list or cls is tuple:
+        res = [None] * len(val)
+        items = enumerate(val)
+    else:
+        return _base.encode_collection(val, include_all)
+
+    spec_type = _base.Spec
+    for k, e in items:
+        if type(e) in _atom_types:
+            res[k] = e
+        elif isinstance(e, spec_type):
+            res[k] = e.to_dict(include_all=include_all)
+        else:
+            return _base.encode_collection(val, include_all)
+
+    return tuple(res) if cls is tuple else res
+
+
+def decode_collection(val, path=None):
+    """
+    Same as :py:func:`fito.specs.base.decode_collection`, loading the specs with :py:func:`load_subspec`
+    """
+    cls = type(val)
+    if cls is dict:
+        res = {}
+        items = val.iteritems()
+    elif cls is list or cls is tuple:
+        res = [None] * len(val)
+        items = enumerate(val)
+    else:
+        return _base.decode_collection(val, path)
+
+    for k, e in items:
+        if type(e) in _atom_types:
+            res[k] = e
+        elif type(e) is dict and type(e.get('type')) is str and registry.get_by_path(e['type']) is not None:
+            res[k] = load_subspec(e, path)
+        else:
+            res[k] = _base.decode_collection_item(e, path)
+
+    return tuple(res) if cls is tuple else res
+
+
+def load_subspec(spec_dict, path=None):
+    """
+    Same as :py:meth:`Spec.dict2spec` for the subspecs of compiled specs. The class is taken from the registry, the
+    specs that are not registered there and the decodings that share subspecs go through dict2spec
+    """
+    type_path = spec_dict.get('type')
+    if isinstance(type_path, basestring) and getattr(_base._decoding, 'memo', None) is None:
+        cls = registry.get_by_path(type_path)
+        if cls is not None: return cls._from_dict(spec_dict, path=path)
+    return _base.Spec.dict2spec(spec_dict, path=path)
+
+
+def is_default_method(cls, name):
+    from fito.specs.base import Spec
+    return getattr(getattr(cls, name), 'im_func', None) is getattr(Spec, name).im_func
+
+
+def compile_spec(cls):
+    """
+    :param cls: A Spec subclass
+    :return: A :py:class:`CompiledSpec`
+    """
+    global _base
+    from fito.specs import base
+    _base = base
+
+    field_table = cls._field_table
+    argument_table = field_table.created
+
+    namespace = {
+        'missing': _missing,
+        'scalar_types': _scalar_types,
+        'UnboundField': UnboundField,
+        'generic_initialize': base.Spec.initialize.im_func,
+        'encode_primitive': base.encode_primitive,
+        'encode_collection': encode_collection,
+        'decode_primitive': base.decode_primitive,
+        'decode_spec_field': base.decode_spec_field,
+        'load_subspec': load_subspec,
+        'decode_collection': decode_collection,
+        'build_spec': base.build_spec,
+        'decoding': base._decoding,
+        'warn_main_module': base.warn_main_module,
+        'basestring': basestring,
+        'cls': cls,
+        'spec_cls': cls,
+    }
+
+    fields_vars = {}
+    for i, (attr, attr_type) in enumerate(field_table.fields):
+        fields_vars[attr] = var = 'F{}'.format(i)
+        namespace[var] = attr_type
+
+    lines = []
+    has_initialize = argument_table.error is None and is_default_method(cls, 'initialize')
+    if has_initialize:
+        lines.extend(_initialize_source(cls, fields_vars, namespace))
+    _add_encoded_defaults(cls, fields_vars, namespace)
+    lines.extend(_to_dict_source(cls, fields_vars, namespace))
+    lines.extend(_from_dict_source(cls, fields_vars, namespace, has_initialize and base.can_build_trusted(cls)))
+
+    source = '\n'.join(lines) + '\n'
+    code = compile(source, '<compiled {}>'.format(cls.__name__), 'exec')
+    exec code in namespace
+
+    return CompiledSpec(
+        initialize=namespace.get('initialize'),
+        to_dict=namespace['to_dict'],
+        from_dict=namespace['from_dict'],
+        source=source,
+    )
+
+
+def _add_encoded_defaults(cls, fields_vars, namespace):
+    """
+    Encodes once the defaults of the primitive fields that are functions or classes, encoding and decoding their
+    import paths is most of the time spent on the specs that have them. They are added to the namespace as
+    `<field var>_encoded`, when they can be decoded back
+    """
+    from fito.specs.base import encode_primitive, decode_primitive
+
+    for attr, attr_type in cls._field_table.fields:
+        if not isinstance(attr_type, PrimitiveField) or not attr_type.has_default_value(): continue
+
+        default = attr_type.default
+        if not (inspect.isfunction(default) or inspect.isclass(default)): continue
+
+        try:
+            encoded = encode_primitive(default)
+            if decode_primitive(encoded) is not default: continue
+        except Exception:
+            continue
+
+        namespace['{}_encoded'.format(fields_vars[attr])] = encoded
+
+
+def _check_source(attr_type, var, value_var, namespace):
+    """
+    Returns an expression that is True when `value_var` is not a valid value for the field, or None if every
+    value is valid
+    """
+    try:
+        if type(attr_type).check_valid_value.im_func is not Field.check_valid_value.im_func:
+            raise NotImplementedError()
+        allowed_types = tuple(attr_type.allowed_types)
+    except NotImplementedError:
+        return 'not {}.check_valid_value({})'.format(var, value_var)
+
+    if object in allowed_types:
+        return None
+
+    types_var = '{}_types'.format(var)
+    namespace[types_var] = allowed_types
+    return 'not isinstance({}, {})'.format(value_var, types_var)
+
+
+def _initialize_source(cls, fields_vars, namespace):
+    from fito.specs.base import Spec
+
+    field_table = cls._field_table
+    argument_table = field_table.created
+    args_field = argument_table.args_field
+    kwargs_field = argument_table.kwargs_field
+
+    # Fields that are going to be received either by position or by name
+    regular_fields = [
+        (attr, attr_type) for attr, attr_type in field_table.bound if attr not in (args_field, kwargs_field)
+    ]
+
+    # Whether values can be written straight into __dict__
+    use_dict = getattr(cls.__setattr__, 'im_func', None) is Spec.__setattr__.im_func
+
+    namespace['regular_names'] = frozenset(attr for attr, _ in regular_fields)
+    namespace['all_names'] = frozenset(field_table.field_dict)
+    namespace['special_names'] = frozenset(field_table.field_dict) - namespace['regular_names']
+
+    res = [
+        'def initialize(self, args, kwargs):',
+        '    fallback = False',
+        '    nargs = len(args)',
+    ]
+
+    if args_field is None:
+        res.append('    if nargs > {}: fallback = True'.format(argument_table.max_nargs))
+
+    if kwargs_field is None:
+        res.append('    if not regular_names.issuperset(kwargs): fallback = True')
+    else:
+        res.append('    if not special_names.isdisjoint(kwargs): fallback = True')
+
+    res.append('    if fallback: return generic_initialize(self, True, *args, **kwargs)')
+
+    for i, (attr, attr_type) in enumerate(regular_fields):
+        var = fields_vars[attr]
+        value_var = 'v{}'.format(i)
+
+        if attr_type.pos is not None:
+            res.append('    if nargs > {pos}: {v} = args[{pos}]'.format(pos=attr_type.pos, v=value_var))
+            res.append('    else: {v} = kwargs.get({attr!r}, missing)'.format(v=value_var, attr=attr))
+        else:
+            res.append('    {v} = kwargs.get({attr!r}, missing)'.format(v=value_var, attr=attr))
+
+        res.append('    if {v} is missing:'.format(v=value_var))
+        if attr_type.has_default_value():
+            res.append('        {v} = {var}.default'.format(v=value_var, var=var))
+        else:
+            res.append('        return generic_initialize(self, True, *args, **kwargs)')
+
+        check = _check_source(attr_type, var, value_var, namespace)
+        if check is not None:
+            res.append(
+                '    if {v} is not None and {check} and not isinstance({v}, UnboundField):'.format(
+                    v=value_var, check=check
+                )
+            )
+            res.append('        return generic_initialize(self, True, *args, **kwargs)')
+
+    if args_field is not None:
+        if argument_table.max_nargs == 0:
+            res.append('    args_value = tuple(args)')
+        else:
+            res.append('    args_value = tuple(args[{}:])'.format(argument_table.max_nargs))
+
+    if kwargs_field is not None:
+        res.append('    if kwargs: kwargs_value = {k: v for k, v in kwargs.iteritems() if k not in all_names}')
+        res.append('    else: kwargs_value = {}')
+
+    if use_dict:
+        res.append('    d = self.__dict__')
+        assignment = '    d[{attr!r}] = {v}'
+    else:
+        assignment = '    self.{attr} = {v}'
+
+    if args_field is not None:
+        res.append(assignment.format(attr=args_field, v='args_value'))
+    if kwargs_field is not None:
+        res.append(assignment.format(attr=kwargs_field, v='kwargs_value'))
+
+    for i, (attr, attr_type) in enumerate(regular_fields):
+        res.append(assignment.format(attr=attr, v='v{}'.format(i)))
+
+    res.append('    return self')
+    res.append('')
+    return res
+
+
+def _to_dict_source(cls, fields_vars, namespace):
+    res = [
+        'def to_dict(self, include_all=False):',
+    ]
+
+    if inspect.getmodule(cls).__name__ == '__main__':
+        res.append('    warn_main_module(cls)')
+
+    type_path = cls.get_type_path()
+    if isinstance(type_path, basestring):
+        res.append('    res = {{"type": {!r}}}'.format(type_path))
+    else:
+        # The path of operations built from methods of specs depends on the spec instance, which can change
+        res.append('    res = {"type": cls.get_type_path()}')
+
+    for attr, attr_type in cls._field_table.fields:
+        if isinstance(attr_type, (PrimitiveField, BaseSpecField, SpecCollection)):
+            indent = '    '
+            if not attr_type.serialize:
+                res.append('    if include_all:')
+                indent = '        '
+
+            res.append('{}v = self.{}'.format(indent, attr))
+
+            if isinstance(attr_type, PrimitiveField):
+                res.append('{}if v is None or type(v) in scalar_types: res[{!r}] = v'.format(indent, attr))
+                encoded_var = '{}_encoded'.format(fields_vars[attr])
+                if encoded_var in namespace:
+                    res.append('{}elif v is {}.default: res[{!r}] = {}'.format(
+                        indent, fields_vars[attr], attr, encoded_var
+                    ))
+                res.append(
+                    '{}elif not isinstance(v, UnboundField): res[{!r}] = encode_primitive(v)'.format(indent, attr)
+                )
+
+            elif isinstance(attr_type, BaseSpecField):
+                res.append('{}if v is None: res[{!r}] = v'.format(indent, attr))
+                res.append(
+                    '{}elif not isinstance(v, UnboundField): res[{!r}] = v.to_dict(include_all=include_all)'.format(
+                        indent, attr
+                    )
+                )
+
+            else:
+                res.append(
+                    '{}if not isinstance(v, UnboundField): res[{!r}] = encode_collection(v, include_all)'.format(
+                        indent, attr
+                    )
+                )
+
+    res.append('    return res')
+    res.append('')
+    return res
+
+
+def _from_dict_source(cls, fields_vars, namespace, build_directly):
+    res = [
+        'def from_dict(cls, kwargs, path=None):',
+        '    kwargs = kwargs.copy()',
+        '    kwargs.pop("type")',
+        '    args = ()',
+    ]
+
+    for attr, attr_type in cls._field_table.fields:
+        var = fields_vars[attr]
+        indent = '    '
+
+        if isinstance(attr_type, UnboundField):
+            res.append('    if {!r} in kwargs:'.format(attr))
+            indent = '        '
+
+        # The values of *args and **kwargs fields are passed spread, like the constructor receives them
+        method = 'pop' if isinstance(attr_type, (ArgsField, KwargsField)) else 'get'
+        if attr_type.has_default_value():
+            res.append('{}val = kwargs.{}({!r}, {}.default)'.format(indent, method, attr, var))
+        elif method == 'pop':
+            res.append('{}val = kwargs.pop({!r})'.format(indent, attr))
+        else:
+            res.append('{}val = kwargs[{!r}]'.format(indent, attr))
+
+        if isinstance(attr_type, PrimitiveField):
+            res.append(
+                "{}if isinstance(val, basestring) and (val.startswith('import ') or val.startswith('!!import')):".format(
+                    indent
+                )
+            )
+            encoded_var = '{}_encoded'.format(var)
+            if encoded_var in namespace:
+                res.append('{}    kwargs[{!r}] = {}.default if val == {} else decode_primitive(val)'.format(
+                    indent, attr, var, encoded_var
+                ))
+            else:
+                res.append('{}    kwargs[{!r}] = decode_primitive(val)'.format(indent, attr))
+
+        elif isinstance(attr_type, BaseSpecField):
+            res.append('{}if val is not None and {!r} in kwargs:'.format(indent, attr))
+            res.append(
+                '{}    kwargs[{attr!r}] = load_subspec(val, path) if type(val) is dict else '
+                'decode_spec_field({attr!r}, val, path)'.format(indent, attr=attr)
+            )
+
+        elif isinstance(attr_type, SpecCollection):
+            res.append('{}val = decode_collection(val, path)'.format(indent))
+            if isinstance(attr_type, ArgsField):
+                res.append('{}args = tuple(val)'.format(indent))
+            elif isinstance(attr_type, KwargsField):
+                res.append('{}kwargs.update(val)'.format(indent))
+            else:
+                res.append('{}kwargs[{!r}] = val'.format(indent, attr))
+
+        else:
+            # Keep the same semantic than the generic version: the value is required even if it is not used
+            res.append('{}pass'.format(indent))
+
+    if build_directly:
+        # Same as cls(*args, **kwargs), without going through the generic __init__. Trusted decoding skips the checks
+        # of the arguments, build_spec handles it
+        res.append("    if cls is spec_cls and not getattr(decoding, 'trusted', False):")
+        res.append('        self = cls.__new__(cls)')
+        res.append('        initialize(self, args, kwargs)')
+        res.append('        if cls.frozen: self._freeze()')
+        res.append('        return self')
+
+    res.append('    return build_spec(cls, args, kwargs)')
+    res.append('')
+    return res
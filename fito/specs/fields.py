@@ -50,7 +50,7 @@ class Field(object):
         raise NotImplementedError()
 
     def check_valid_value(self, value):
-        return any([isinstance(value, t) for t in self.allowed_types])
+        return isinstance(value, tuple(self.allowed_types))
 
     def __eq__(self, other):
         return self is other
@@ -212,3 +212,93 @@ def UnboundSpecField(pos=None, default=_no_default, base_type=None, spec_field_s
 
 class UnboundPrimitiveField(PrimitiveField, UnboundField):
     pass
+
+
+class ArgumentTable(object):
+    """
+    Describes how :py:meth:`Spec.initialize` maps the received arguments to fields, either when the spec is being
+    created (bound fields) or when it is being bound (unbound fields)
+    """
+    __slots__ = ('fields', 'pos2name', 'max_nargs', 'args_field', 'kwargs_field', 'defaults', 'error')
+
+    def __init__(self, fields):
+        pos2name = {}
+        kwargs_field = None
+        args_field = None
+        error = None
+
+        for attr_name, attr_type in fields.iteritems():
+            if attr_type.pos is not None:
+                pos2name[attr_type.pos] = attr_name
+
+            elif isinstance(attr_type, KwargsField):
+                # KwargsField always have pos = None
+                if kwargs_field is not None and error is None:
+                    error = "A spec can have at most one kwargs field, found {} and {}".format(attr_name, kwargs_field)
+                kwargs_field = attr_name
+
+            elif isinstance(attr_type, ArgsField):
+                if args_field is not None and error is None:
+                    error = "A spec can have at most one args field, found {} and {}".format(attr_name, kwargs_field)
+                args_field = attr_name
+
+        self.fields = fields
+        self.pos2name = pos2name
+        self.max_nargs = 0 if len(pos2name) == 0 else max(pos2name) + 1
+        self.args_field = args_field
+        self.kwargs_field = kwargs_field
+        self.error = error
+
+        # Fields whose default should be used when they are not received
+        self.defaults = tuple(
+            (attr, attr_type)
+            for attr, attr_type in fields.iteritems()
+            if attr != args_field and attr_type.has_default_value()
+        )
+
+
+class FieldTable(object):
+    """
+    Ordered and immutable description of the fields of a :py:class:`Spec` subclass.
+
+    It is built once by :py:class:`SpecMeta` when the class is created (and rebuilt when a field is set on the
+    class afterwards), so the hot paths do not need to scan `dir(cls)` on every call
+    """
+    __slots__ = (
+        'fields', 'bound', 'unbound', 'field_dict', 'bound_dict', 'unbound_dict', 'created', 'binding',
+        'spec_fields', 'primitive_fields', 'collection_fields', 'serialized', 'unserialized', 'repr_order', '_frozen'
+    )
+
+    def __init__(self, cls):
+        fields = []
+        for k in dir(cls):
+            v = getattr(cls, k)
+            if isinstance(v, Field):
+                fields.append((k, v))
+
+        self.fields = tuple(fields)
+        self.bound = tuple((k, v) for k, v in fields if not isinstance(v, UnboundField))
+        self.unbound = tuple((k, v) for k, v in fields if isinstance(v, UnboundField))
+        self.field_dict = dict(self.fields)
+        self.bound_dict = dict(self.bound)
+        self.unbound_dict = dict(self.unbound)
+
+        self.created = ArgumentTable(self.bound_dict)
+        self.binding = ArgumentTable(self.unbound_dict)
+
+        self.spec_fields = tuple(k for k, v in fields if isinstance(v, BaseSpecField))
+        self.primitive_fields = tuple(k for k, v in fields if isinstance(v, PrimitiveField))
+        self.collection_fields = tuple(k for k, v in fields if isinstance(v, SpecCollection))
+        self.serialized = frozenset(k for k, v in fields if v.serialize)
+        self.unserialized = tuple((k, v) for k, v in self.bound if not v.serialize)
+
+        self.repr_order = sorted(fields, key=lambda x: x[1].pos or len(fields))
+        self._frozen = True
+
+    def __setattr__(self, key, value):
+        if getattr(self, '_frozen', False):
+            raise AttributeError("FieldTable instances are immutable")
+        super(FieldTable, self).__setattr__(key, value)
+
+    def __repr__(self):
+        return 'FieldTable({})'.format(', '.join(k for k, _ in self.fields))
@@ -0,0 +1,122 @@
+"""
+The json encoding of fito: the one of :py:attr:`Spec.key`, :py:attr:`Spec.digest` and :py:attr:`Spec.json`.
+
+On top of the json types it handles datetimes and ObjectIds with the extended json of mongo (``{"$date": millis}`` and
+``{"$oid": hex}``, as ``bson.json_util`` did it in its legacy mode) and classes and functions with their import paths.
+Everything happens here, the global :py:mod:`json` module is left untouched.
+
+This module can be given to :py:class:`Spec.Exporter` and :py:class:`Spec.Importer`, it has the dump, dumps, load and
+loads functions of :py:mod:`json`.
+"""
+import calendar
+import inspect
+import json
+import sys
+from datetime import datetime, timedelta
+
+_epoch = datetime(1970, 1, 1)
+# Datetimes are not timezone aware
+_json_options = None
+_datetime_formats = ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S')
+
+
+def default(obj):
+    """
+    The `default` hook of :py:class:`json.JSONEncoder` for the non json values that specs can hold
+    """
+    if isinstance(obj, datetime):
+        if obj.utcoffset() is not None:
+            obj = obj - obj.utcoffset()
+        millis = calendar.timegm(obj.timetuple()) * 1000 + obj.microsecond // 1000
+        return {'$date': millis}
+    elif 'bson' in sys.modules and isinstance(obj, sys.modules['bson'].ObjectId):
+        # There can't be ObjectIds if bson wasn't imported
+        return {'$oid': str(obj)}
+    elif inspect.isfunction(obj) or inspect.isclass(obj):
+        # Lazy import to avoid dependency loops
+        from fito.specs.base import get_import_path
+        return 'import {}'.format(get_import_path(obj))
+    raise TypeError(repr(obj) + " is not JSON serializable")
+
+
+def object_hook(obj):
+    """
+    The inverse of :py:func:`default`
+    """
+    if len(obj) == 1 and '$date' in obj:
+        return _parse_date(obj['$date'])
+
+    if any(k.startswith('$') for k in obj):
+        # ObjectIds and the rest of the extended json types ($regex, $binary, ...) need bson. It's imported here, it
+        # takes longer than the rest of fito to import
+        try:
+            from bson import json_util
+        except ImportError:
+            return obj
+
+        global _json_options
+        if _json_options is None: _json_options = json_util.JSONOptions(tz_aware=False)
+        return json_util.object_hook(obj, json_options=_json_options)
+    return obj
+
+
+def _parse_date(value):
+    if isinstance(value, dict) and '$numberLong' in value:
+        value = int(value['$numberLong'])
+
+    if isinstance(value, (int, long)):
+        return _epoch + timedelta(milliseconds=value)
+
+    if isinstance(value, basestring):
+        # ISO 8601 in UTC, as the canonical extended json writes them
+        value = value.rstrip('Z')
+        for fmt in _datetime_formats:
+            try:
+                return datetime.strptime(value, fmt)
+            except ValueError:
+                pass
+
+    raise ValueError("Invalid $date: {!r}".format(value))
+
+
+# Encoders and decoders are reused, json.dumps and json.loads build new ones whenever they get arguments
+_key_encoder = json.JSONEncoder(default=default)
+_canonical_encoder = json.JSONEncoder(sort_keys=True, separators=(',', ':'), default=default)
+_plain_decoder = json.JSONDecoder()
+_hooked_decoder = json.JSONDecoder(object_hook=object_hook)
+
+
+def encode_key(obj):
+    """
+    Encoding of :py:attr:`Spec.key`, the same of ``json.dumps(obj)``
+    """
+    return _key_encoder.encode(obj)
+
+
+def encode_canonical(obj):
+    """
+    Compact encoding with sorted keys, equal objects get equal strings
+    """
+    return _canonical_encoder.encode(obj)
+
+
+def loads(s, **kwargs):
+    if kwargs: return json.loads(s, object_hook=object_hook, **kwargs)
+
+    # Only extended json has "$ keys
+    if '"$' in s:
+        return _hooked_decoder.decode(s)
+    return _plain_decoder.decode(s)
+
+
+def load(fp, **kwargs):
+    return loads(fp.read(), **kwargs)
+
+
+def dumps(obj, **kwargs):
+    if not kwargs: return _key_encoder.encode(obj)
+    return json.dumps(obj, default=default, **kwargs)
+
+
+def dump(obj, fp, **kwargs):
+    return json.dump(obj, fp, default=default, **kwargs)
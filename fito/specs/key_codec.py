@@ -0,0 +1,390 @@
+"""
+Codecs that turn spec dicts (the output of :py:meth:`Spec.to_dict`) into the keys that data stores persist and hash.
+
+:py:class:`JSONKeyCodec` produces the historical :py:attr:`Spec.key` strings, and is the default one.
+:py:class:`BinaryKeyCodec` produces deterministic CBOR (RFC 8949, section 4.2): the maps are sorted by their encoded
+keys and every value has a single encoding, so equal dicts always give equal bytes. It's written in pure python to
+avoid a new dependency, its keys are about half the size of the json ones. Stores use it when they are created with
+``key_codec=BinaryKeyCodec()``.
+"""
+import struct
+from codecs import utf_8_decode as _utf8_decode
+from datetime import datetime
+
+from fito.specs import json_encoding
+from fito.specs.base import Spec
+
+_uint8 = struct.Struct('>B')
+_uint16 = struct.Struct('>H')
+_uint32 = struct.Struct('>I')
+_uint64 = struct.Struct('>Q')
+_float32 = struct.Struct('>f')
+_float64 = struct.Struct('>d')
+
+# Major types
+_UINT, _NEGINT, _BYTES, _TEXT, _ARRAY, _MAP, _TAG, _SIMPLE = range(8)
+
+# Tags
+_DATETIME_TAG = 0
+_POSITIVE_BIGNUM_TAG = 2
+_NEGATIVE_BIGNUM_TAG = 3
+# Unassigned tag, it holds the extended json of mongo of the values that only json keys knew (e.g. {"$oid": hex})
+_EXTENDED_JSON_TAG = 40000
+
+_datetime_formats = ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S')
+
+
+class KeyCodec(Spec):
+    """
+    Base class of the codecs, see :py:attr:`fito.data_store.base.BaseDataStore.key_codec`
+    """
+
+    def encode(self, spec_dict):
+        raise NotImplementedError()
+
+    def decode(self, key):
+        raise NotImplementedError()
+
+    def get_key(self, spec):
+        """
+        :param spec: Either a Spec or the output of its to_dict
+        """
+        if isinstance(spec, Spec): spec = spec.to_dict()
+        return self.encode(spec)
+
+
+class JSONKeyCodec(KeyCodec):
+    """
+    The keys are the json strings of :py:attr:`Spec.key`
+    """
+
+    def encode(self, spec_dict):
+        return Spec._dict2key(spec_dict)
+
+    def decode(self, key):
+        return Spec.key2dict(key)
+
+    def get_key(self, spec):
+        # Spec.key is cached
+        if isinstance(spec, Spec): return spec.key
+        return self.encode(spec)
+
+
+class BinaryKeyCodec(KeyCodec):
+    """
+    The keys are deterministic CBOR byte strings
+    """
+
+    def encode(self, spec_dict):
+        return cbor_dumps(spec_dict)
+
+    def decode(self, key):
+        return cbor_loads(key)
+
+    def get_key(self, spec):
+        if not isinstance(spec, Spec): return self.encode(spec)
+        # Compact specs don't memoize their keys
+        if type(spec).compact: return self.encode(spec.to_dict())
+
+        # Cached like Spec.key, and invalidated along it
+        res = spec.__dict__.get('_binary_key')
+        if res is None:
+            res = spec.__dict__['_binary_key'] = self.encode(spec.to_dict())
+        return res
+
+
+def _head(major, n):
+    major <<= 5
+    if n < 24:
+        return chr(major | n)
+    elif n < 0x100:
+        return chr(major | 24) + _uint8.pack(n)
+    elif n < 0x10000:
+        return chr(major | 25) + _uint16.pack(n)
+    elif n < 0x100000000:
+        return chr(major | 26) + _uint32.pack(n)
+    else:
+        return chr(major | 27) + _uint64.pack(n)
+
+
+# Encoded strings, field names and type paths repeat a lot across keys
+_str_cache = {}
+_max_cached_str_len = 128
+_max_str_cache_size = 10000
+
+
+def _encode_str(obj):
+    res = _str_cache.get(obj)
+    if res is not None: return res
+
+    raw = obj.encode('utf-8') if isinstance(obj, unicode) else obj
+    try:
+        raw.decode('utf-8')
+    except UnicodeDecodeError:
+        res = _head(_BYTES, len(raw)) + raw
+    else:
+        # Equal str and unicode objects must have the same encoding
+        res = _head(_TEXT, len(raw)) + raw
+
+    if len(raw) <= _max_cached_str_len:
+        if len(_str_cache) >= _max_str_cache_size: _str_cache.clear()
+        _str_cache[obj] = res
+    return res
+
+
+def _encode_int(obj):
+    if obj >= 0:
+        major, n, tag = _UINT, obj, _POSITIVE_BIGNUM_TAG
+    else:
+        major, n, tag = _NEGINT, -1 - obj, _NEGATIVE_BIGNUM_TAG
+
+    if n < 0x10000000000000000:
+        return _head(major, n)
+
+    payload = '{:x}'.format(n)
+    payload = ('0' * (len(payload) % 2) + payload).decode('hex')
+    return _head(_TAG, tag) + _head(_BYTES, len(payload)) + payload
+
+
+def _encode_float(obj):
+    # Use the shortest encoding that keeps the value
+    try:
+        packed = _float32.pack(obj)
+        if _float32.unpack(packed)[0] == obj or obj != obj:
+            return '\xfa' + packed
+    except OverflowError:
+        pass
+    return '\xfb' + _float64.pack(obj)
+
+
+def _encode_datetime(obj):
+    if obj.tzinfo is not None:
+        # Like the json keys, datetimes are not timezone aware
+        obj = (obj - obj.utcoffset()).replace(tzinfo=None)
+    return _head(_TAG, _DATETIME_TAG) + _encode_str(obj.isoformat())
+
+
+_atoms = {
+    int: _encode_int,
+    long: _encode_int,
+    float: _encode_float,
+    str: _encode_str,
+    unicode: _encode_str,
+    datetime: _encode_datetime,
+}
+
+def _encode_extended(obj):
+    # The values that json_encoding handles besides datetimes: ObjectIds and, as their import paths, classes and
+    # functions
+    try:
+        value = json_encoding.default(obj)
+    except TypeError:
+        raise TypeError("{!r} can not be encoded into a key".format(obj))
+
+    if isinstance(value, dict): return _head(_TAG, _EXTENDED_JSON_TAG) + _encode_key(value)
+    return _encode_key(value)
+
+
+_constants = {None: '\xf6', True: '\xf5', False: '\xf4'}
+
+# Heads of the small ints, arrays and maps
+_small_ints = {i: _encode_int(i) for i in xrange(-256, 1024)}
+_array_heads = [_head(_ARRAY, n) for n in xrange(24)]
+_map_heads = [_head(_MAP, n) for n in xrange(24)]
+
+
+def _encode_atom(obj):
+    cls = type(obj)
+    if cls is str or cls is unicode:
+        return _str_cache.get(obj) or _encode_str(obj)
+    elif cls is int:
+        return _small_ints.get(obj) or _encode_int(obj)
+    elif obj is None or cls is bool:
+        return _constants[obj]
+
+    encoder = _atoms.get(cls)
+    if encoder is None:
+        encoder = next((f for klass, f in _atoms.iteritems() if isinstance(obj, klass)), None)
+        if encoder is None: return _encode_extended(obj)
+    return encoder(obj)
+
+
+def _encode(obj, chunks):
+    cls = type(obj)
+    if cls is dict:
+        items = []
+        for k, v in obj.iteritems():
+            items.append(((_str_cache.get(k) if type(k) is str else None) or _encode_key(k), v))
+
+        # Deterministic order: bytewise order of the encoded keys (RFC 8949, section 4.2.1)
+        items.sort()
+
+        n = len(items)
+        chunks.append(_map_heads[n] if n < 24 else _head(_MAP, n))
+        for k, v in items:
+            chunks.append(k)
+            cls = type(v)
+            if cls is str:
+                chunks.append(_str_cache.get(v) or _encode_str(v))
+            elif cls is dict or cls is list or cls is tuple:
+                _encode(v, chunks)
+            elif cls is int:
+                chunks.append(_small_ints.get(v) or _encode_int(v))
+            else:
+                _encode(v, chunks)
+
+    elif cls is list or cls is tuple:
+        n = len(obj)
+        chunks.append(_array_heads[n] if n < 24 else _head(_ARRAY, n))
+        for e in obj:
+            _encode(e, chunks)
+
+    elif isinstance(obj, dict):
+        _encode(dict(obj), chunks)
+    elif isinstance(obj, (list, tuple)):
+        _encode(list(obj), chunks)
+    else:
+        chunks.append(_encode_atom(obj))
+
+
+def _encode_key(obj):
+    chunks = []
+    _encode(obj, chunks)
+    return ''.join(chunks)
+
+
+def cbor_dumps(obj):
+    """
+    Deterministic CBOR encoding of `obj`, which can hold None, bools, numbers, strings, datetimes, lists, tuples,
+    dicts and the rest of the values of :py:mod:`fito.specs.json_encoding`
+    """
+    return _encode_key(obj)
+
+
+# Decoded text strings, same idea than _str_cache
+_text_cache = {}
+
+
+def _decode_text(raw):
+    res = _text_cache.get(raw)
+    if res is None:
+        res = _utf8_decode(raw)[0]
+        if len(raw) <= _max_cached_str_len:
+            if len(_text_cache) >= _max_str_cache_size: _text_cache.clear()
+            _text_cache[raw] = res
+    return res
+
+
+def _decode_length(data, pos, info):
+    if info < 24:
+        return info, pos
+    elif info == 24:
+        return ord(data[pos]), pos + 1
+    elif info == 25:
+        return _uint16.unpack_from(data, pos)[0], pos + 2
+    elif info == 26:
+        return _uint32.unpack_from(data, pos)[0], pos + 4
+    elif info == 27:
+        return _uint64.unpack_from(data, pos)[0], pos + 8
+    raise ValueError("Invalid key, indefinite lengths are not allowed (at byte {})".format(pos - 1))
+
+
+def _decode(data, pos):
+    initial = ord(data[pos])
+    major = initial >> 5
+    info = initial & 0x1f
+    pos += 1
+
+    if info < 24:
+        n = info
+    elif major == _SIMPLE:
+        if info == 26: return _float32.unpack_from(data, pos)[0], pos + 4
+        if info == 27: return _float64.unpack_from(data, pos)[0], pos + 8
+        raise ValueError("Invalid key, unknown simple value {} (at byte {})".format(info, pos - 1))
+    else:
+        n, pos = _decode_length(data, pos, info)
+
+    if major == _TEXT:
+        end = pos + n
+        return _decode_text(data[pos:end]), end
+
+    elif major == _MAP:
+        res = {}
+        for _ in xrange(n):
+            # Most keys and values are short text strings or small ints
+            initial = ord(data[pos])
+            if 0x60 <= initial < 0x78:
+                end = pos + 1 + initial - 0x60
+                raw = data[pos + 1:end]
+                k = _text_cache.get(raw) or _decode_text(raw)
+                pos = end
+            else:
+                k, pos = _decode(data, pos)
+
+            initial = ord(data[pos])
+            if 0x60 <= initial < 0x78:
+                end = pos + 1 + initial - 0x60
+                raw = data[pos + 1:end]
+                res[k] = _text_cache.get(raw) or _decode_text(raw)
+                pos = end
+            elif initial < 0x18:
+                res[k] = initial
+                pos += 1
+            else:
+                res[k], pos = _decode(data, pos)
+        return res, pos
+
+    elif major == _UINT:
+        return n, pos
+    elif major == _ARRAY:
+        res = []
+        for _ in xrange(n):
+            e, pos = _decode(data, pos)
+            res.append(e)
+        return res, pos
+    elif major == _SIMPLE:
+        if n == 20: return False, pos
+        if n == 21: return True, pos
+        if n == 22: return None, pos
+        raise ValueError("Invalid key, unknown simple value {} (at byte {})".format(n, pos - 1))
+    elif major == _NEGINT:
+        return -1 - n, pos
+    elif major == _BYTES:
+        return data[pos:pos + n], pos + n
+    else:
+        value, pos = _decode(data, pos)
+        if n == _DATETIME_TAG:
+            return _parse_datetime(value), pos
+        elif n == _POSITIVE_BIGNUM_TAG:
+            return long(value.encode('hex'), 16), pos
+        elif n == _NEGATIVE_BIGNUM_TAG:
+            return -1 - long(value.encode('hex'), 16), pos
+        elif n == _EXTENDED_JSON_TAG and isinstance(value, dict):
+            return json_encoding.object_hook(value), pos
+        raise ValueError("Invalid key, unknown tag {}".format(n))
+
+
+def _parse_datetime(value):
+    for fmt in _datetime_formats:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise ValueError("Invalid key, bad datetime {}".format(value))
+
+
+def cbor_loads(data):
+    """
+    Inverse of :py:func:`cbor_dumps`. Text strings are loaded as unicode, like json does
+    """
+    try:
+        res, pos = _decode(data, 0)
+    except (IndexError, struct.error):
+        raise ValueError("Invalid key, it is truncated")
+
+    if pos != len(data):
+        raise ValueError("Invalid key, it has trailing data")
+    return res
+
+
+default_key_codec = JSONKeyCodec()
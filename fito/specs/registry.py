@@ -0,0 +1,89 @@
+"""
+Index of the live Spec subclasses, it's kept up to date by SpecMeta and used by :py:meth:`Spec.type2spec_class`
+"""
+import weakref
+from collections import defaultdict
+
+
+class AmbiguousSpecName(ValueError):
+    pass
+
+
+class SpecRegistry(object):
+    """
+    Indexes the Spec subclasses by import path (`module:Class`) and by class name.
+
+    It also memoizes other paths that resolve to a Spec subclass (e.g. classes re exported by another module or
+    operations built from methods). Those are forgotten whenever the classes change
+    """
+
+    def __init__(self):
+        self.by_path = weakref.WeakValueDictionary()
+        self.by_name = defaultdict(weakref.WeakSet)
+        self.paths = weakref.WeakKeyDictionary()
+        self.aliases = weakref.WeakValueDictionary()
+
+    @staticmethod
+    def get_path(cls):
+        return '{}:{}'.format(cls.__module__, cls.__name__)
+
+    def register(self, cls):
+        path = self.get_path(cls)
+        if self.paths.get(cls) == path: return
+
+        self.unregister(cls)
+
+        # The newest class wins, like when a module is reloaded
+        previous = self.by_path.get(path)
+        if previous is not None: self.unregister(previous)
+
+        self.by_path[path] = cls
+        self.by_name[cls.__name__].add(cls)
+        self.paths[cls] = path
+        self.aliases.clear()
+
+    def unregister(self, cls):
+        path = self.paths.pop(cls, None)
+        if path is None: return
+
+        if self.by_path.get(path) is cls:
+            del self.by_path[path]
+
+        name = path.split(':', 1)[1]
+        self.by_name[name].discard(cls)
+        if len(self.by_name[name]) == 0:
+            del self.by_name[name]
+
+        self.aliases.clear()
+
+    def get_by_path(self, path):
+        """
+        :return: The class registered under `path`, or previously resolved from it. None if it's unknown
+        """
+        res = self.by_path.get(path)
+        if res is None:
+            res = self.aliases.get(path)
+        return res
+
+    def get_by_name(self, name):
+        """
+        :return: The class with the given name or None if there's none
+        :raises AmbiguousSpecName: If there's more than one
+        """
+        classes = list(self.by_name.get(name, ()))
+        if len(classes) > 1:
+            raise AmbiguousSpecName(
+                "There are many specs named {}: {}. Use the import path instead".format(
+                    name, ', '.join(sorted(self.paths[e] for e in classes))
+                )
+            )
+        return classes[0] if classes else None
+
+    def add_alias(self, path, cls):
+        """
+        Memoizes that `path` resolves to `cls`
+        """
+        self.aliases[path] = cls
+
+
+registry = SpecRegistry()
@@ -0,0 +1,287 @@
+"""
+Columnar view of many specs, meant for analyzing sweeps without comparing specs one pair at a time.
+
+Spec dicts are flattened into one column per dotted field path (``'spec_a.field'``, as
+:py:class:`fito.specs.diff.Diff` names fields of subspecs), and every column is dictionary encoded: an array of codes
+that index the distinct values of the column. Comparing fields across the whole table is then done on the codes.
+
+Values are encoded by equality, as ``Diff`` compares them: ``1``, ``1.0`` and ``True`` share a code.
+"""
+from array import array
+from collections import OrderedDict
+
+from fito.specs.json_encoding import encode_canonical
+
+# Code of the rows that do not have a field
+MISSING = -1
+
+# Marks the encodings of unhashable values, so they can't be mistaken for any other value
+_unhashable = object()
+
+
+class Column(object):
+    """
+    A dictionary encoded column: `codes` has a code per row, that indexes `values`, or MISSING
+    """
+
+    def __init__(self, n_rows=0):
+        self.codes = array('i', [MISSING]) * n_rows
+        self.values = []
+        self.value_codes = {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def encode(self, value):
+        """
+        :return: The code of `value`, it's added to the values of the column if it's new
+        """
+        lookup = _lookup_key(value)
+        code = self.value_codes.get(lookup)
+        if code is None:
+            code = self.value_codes[lookup] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def find(self, value):
+        """
+        :return: The code of `value`, or None if no row has it
+        """
+        return self.value_codes.get(_lookup_key(value))
+
+    def append(self, value):
+        self.codes.append(self.encode(value))
+
+    def append_missing(self):
+        self.codes.append(MISSING)
+
+    def decode(self, code, default=None):
+        return default if code == MISSING else self.values[code]
+
+    def tolist(self, default=None):
+        values = self.values
+        return [default if code == MISSING else values[code] for code in self.codes]
+
+    def distinct_codes(self):
+        return set(self.codes)
+
+    def take(self, rows):
+        """
+        :return: A column with the given rows. Values are kept, codes are valid in both columns
+        """
+        res = Column()
+        res.values = self.values
+        res.value_codes = self.value_codes
+        codes = self.codes
+        res.codes = array('i', [codes[i] for i in rows])
+        return res
+
+
+class SpecTable(object):
+    """
+    Flattened specs, one row per spec and one :py:class:`Column` per field path.
+
+    Rows are identified by `ids`: the ids of the data store the specs were read from, or the specs themselves.
+    """
+
+    def __init__(self):
+        self.columns = OrderedDict()
+        self.ids = []
+
+    @classmethod
+    def from_specs(cls, specs):
+        res = cls()
+        for spec in specs:
+            res.add(spec.to_dict(), spec)
+        return res
+
+    @classmethod
+    def from_dicts(cls, spec_dicts, ids=None):
+        res = cls()
+        if ids is None:
+            for i, spec_dict in enumerate(spec_dicts):
+                res.add(spec_dict, i)
+        else:
+            for id, spec_dict in zip(ids, spec_dicts):
+                res.add(spec_dict, id)
+        return res
+
+    @classmethod
+    def from_data_store(cls, data_store, results=None):
+        """
+        Streams the raw keys of `data_store`, no spec is loaded.
+
+        :param results: If given, the name of a column where the stored objects are joined, see :py:meth:`join`
+        """
+        res = cls()
+        for id, spec_dict in data_store.iterkeys(raw=True):
+            res.add(spec_dict, id)
+
+        if results is not None: res.join(data_store, results)
+        return res
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, path):
+        return path in self.columns
+
+    def __getitem__(self, path):
+        return self.columns[path]
+
+    @property
+    def paths(self):
+        return self.columns.keys()
+
+    def add(self, spec_dict, id=None):
+        """
+        Appends the row of a spec dict
+        """
+        n_rows = len(self.ids)
+        row = {}
+        _flatten(spec_dict, '', row)
+
+        for path, value in row.iteritems():
+            column = self.columns.get(path)
+            if column is None:
+                column = self.columns[path] = Column(n_rows)
+            column.append(value)
+
+        if len(row) < len(self.columns):
+            for path, column in self.columns.iteritems():
+                if path not in row: column.append_missing()
+
+        self.ids.append(id)
+
+    def column(self, path, default=None):
+        """
+        :return: The values of the field of every row, `default` for the rows that don't have it
+        """
+        return self.columns[path].tolist(default)
+
+    def row(self, i):
+        """
+        :return: A flat dict from field paths to the values of the i-th row
+        """
+        return {
+            path: column.values[column.codes[i]]
+            for path, column in self.columns.iteritems() if column.codes[i] != MISSING
+        }
+
+    def varying_fields(self):
+        """
+        :return: The paths of the fields that do not have the same value in every row.
+            A field that some rows don't have varies
+        """
+        return [path for path, column in self.columns.iteritems() if len(column.distinct_codes()) > 1]
+
+    def constant_fields(self):
+        """
+        :return: A dict with the fields that have the same value in every row
+        """
+        res = OrderedDict()
+        for path, column in self.columns.iteritems():
+            codes = column.distinct_codes()
+            if len(codes) == 1 and MISSING not in codes:
+                res[path] = column.values[codes.pop()]
+        return res
+
+    def group_by(self, *paths):
+        """
+        :return: An OrderedDict from the tuples of values of `paths` to the lists of rows that have them,
+            in order of appearance. Missing fields are grouped as None
+        """
+        columns = [self.columns[path] for path in paths]
+        groups = OrderedDict()
+        for i, codes in enumerate(zip(*[column.codes for column in columns])):
+            groups.setdefault(codes, []).append(i)
+
+        return OrderedDict(
+            (tuple(column.decode(code) for column, code in zip(columns, codes)), rows)
+            for codes, rows in groups.iteritems()
+        )
+
+    def where(self, **values):
+        """
+        :param values: Values the rows must have, by field path. Use ``**{'spec_a.field': value}`` for dotted paths
+        :return: The indices of the rows that have them
+        """
+        conditions = []
+        for path, value in values.iteritems():
+            column = self.columns.get(path)
+            if column is None: return []
+
+            code = column.find(value)
+            if code is None: return []
+            conditions.append((column.codes, code))
+
+        return [i for i in xrange(len(self)) if all(codes[i] == code for codes, code in conditions)]
+
+    def take(self, rows):
+        """
+        :return: A table with the given rows
+        """
+        res = type(self)()
+        for path, column in self.columns.iteritems():
+            res.columns[path] = column.take(rows)
+        res.ids = [self.ids[i] for i in rows]
+        return res
+
+    def join(self, results, name='result', default=None):
+        """
+        Adds a column with the result of every row.
+
+        :param results: A data store, or any mapping, indexed by the ids of the rows
+        :param default: Result of the rows that are not in `results`
+        """
+        if name in self.columns: raise ValueError("There already is a column named {}".format(name))
+
+        column = Column()
+        for id in self.ids:
+            try:
+                value = results[id]
+            except KeyError:
+                value = default
+            column.append(value)
+
+        self.columns[name] = column
+        return self
+
+    def to_pandas(self):
+        """
+        :return: A pandas DataFrame with a categorical column per field, indexed by row number
+        """
+        import pandas as pd
+
+        data = OrderedDict()
+        for path, column in self.columns.iteritems():
+            try:
+                data[path] = pd.Categorical.from_codes(column.codes, column.values)
+            except (TypeError, ValueError):
+                # Unhashable or unorderable values
+                data[path] = column.tolist()
+        return pd.DataFrame(data, columns=list(data))
+
+
+def _flatten(d, path, res):
+    for k, v in d.iteritems():
+        key_path = k if not path else path + '.' + k
+        if isinstance(v, dict) and 'type' in v:
+            # Subspec
+            _flatten(v, key_path, res)
+        else:
+            res[key_path] = v
+
+
+def _lookup_key(value):
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        pass
+
+    try:
+        return _unhashable, encode_canonical(value)
+    except (TypeError, ValueError):
+        # Not json serializable either (e.g. results), only equal to itself
+        return _unhashable, id(value)
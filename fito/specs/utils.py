@@ -35,13 +35,35 @@ def is_iterable(obj):
     return isinstance(obj, list) or isinstance(obj, dict) or isinstance(obj, tuple)
 
 
-def recursive_map(iterable, callable, recursion_condition=None):
+# Values that can't hold specs or references
+atom_types = (int, long, float, bool, str, unicode, type(None))
+
+
+def get_arity(callable):
+    """
+    Number of arguments that `callable` receives, not counting `self`
+    """
+    try:
+        return len(inspect.getargspec(callable).args) - inspect.ismethod(callable)
+    except TypeError:
+        # Callable objects
+        call = getattr(callable, '__call__', None)
+        if inspect.ismethod(call): return get_arity(call)
+        raise
+
+
+def recursive_map(iterable, callable, recursion_condition=None, identity_types=()):
     """
     Provides a map that works on lists, dicts and tuples, and is recursive into sub collections (default behaviour)
 
+    Sub collections are given to `callable` before recursing into them (along their keys for two argument callables).
+
     :param recursion_condition: Predicate specifying on which cases the function should recurse.
     Default: :py:func:`is_iterable`
 
+    :param identity_types: Types whose values are left untouched by `callable`. Those values are not given to it,
+    and lists, tuples and dicts that only hold them are copied at once.
+
     :return: A similar structure to the given iterable where :param callable: was applied
 
     Example:
@@ -52,34 +74,45 @@ def recursive_map(iterable, callable, recursion_condition=None):
     >>> [[1], {2: 5, 5: 15}]
 
     """
-    recursion_condition = recursion_condition or is_iterable
-    res = general_new(iterable)
-
-    callable_nargs = len(inspect.getargspec(callable).args) - inspect.ismethod(callable)
+    # The arity is resolved once for the whole traversal
+    callable_nargs = get_arity(callable)
     if callable_nargs == 0 or callable_nargs > 2:
         raise RuntimeError("`callable` should be a one or two argument function")
 
-    for k, v in general_iterator(iterable):
-        if recursion_condition(v):
-            res = general_append(
-                res,
-                k,
-                recursive_map(
-                    callable(v),
-                    callable,
-                    recursion_condition
-                )
-            )
-        else:
+    identity_types = frozenset(identity_types)
+    if recursion_condition is None:
+        def recursion_condition(obj): return isinstance(obj, (list, dict, tuple))
 
-            if callable_nargs == 1:
-                v = callable(v)
-            else:
-                v = callable(k, v)
+    def map_value(k, v):
+        if type(v) in identity_types: return v
 
-            res = general_append(res, k, v)
+        recurse = recursion_condition(v)
+        v = callable(v) if callable_nargs == 1 else callable(k, v)
+        return map_collection(v) if recurse else v
 
-    return res
+    def map_collection(obj):
+        cls = type(obj)
+        if cls is list or cls is tuple:
+            if identity_types and all(type(e) in identity_types for e in obj):
+                # Tuples of immutable values can be shared
+                return list(obj) if cls is list else obj
+
+            res = [map_value(i, e) for i, e in enumerate(obj)]
+            return res if cls is list else tuple(res)
+
+        elif cls is dict:
+            if identity_types and all(type(v) in identity_types for v in obj.itervalues()):
+                return dict(obj)
+            return {k: map_value(k, v) for k, v in obj.iteritems()}
+
+        else:
+            # Subclasses (e.g. OrderedDict) keep their type
+            res = general_new(obj)
+            for k, v in general_iterator(obj):
+                res = general_append(res, k, map_value(k, v))
+            return res
+
+    return map_collection(iterable)
 
 
 def is_dict(obj): return isinstance(obj, dict)
@@ -0,0 +1,130 @@
+import sys
+import unittest
+
+from fito.cache import FIFOCache, GreedyDualSizeCache, LRUCache, TwoQueueCache, estimate_size, make_cache, \
+    register_size_estimator
+from fito.operation_runner import OperationRunner
+from fito.planner import execution_stats
+from test_operation_runner import GetNumber
+
+try:
+    import numpy as np
+    import pandas as pd
+except ImportError:
+    np = pd = None
+
+
+class Blob(object):
+    def __init__(self, size):
+        self.size = size
+
+
+class SizedBlob(Blob):
+    pass
+
+
+class TestCache(unittest.TestCase):
+    def test_policies(self):
+        fifo = FIFOCache(max_entries=2)
+        lru = LRUCache(max_entries=2)
+        for cache in fifo, lru:
+            cache.set(GetNumber(1), 1)
+            cache.set(GetNumber(2), 2)
+            assert cache[GetNumber(1)] == 1
+            cache.set(GetNumber(3), 3)
+
+        assert GetNumber(1) not in fifo and GetNumber(2) in fifo
+        assert GetNumber(1) in lru and GetNumber(2) not in lru
+        assert fifo.stats() == {'hits': 1, 'misses': 0, 'evictions': 1, 'entries': 2, 'bytes': 0}
+
+        assert lru.get(GetNumber(2)) is None
+        self.assertRaises(KeyError, lru.__getitem__, GetNumber(2))
+        assert lru.misses == 2
+
+    def test_two_queues(self):
+        cache = TwoQueueCache(max_entries=8)
+        hot = [GetNumber(i) for i in xrange(2)]
+        for op in hot: cache.set(op, op.input)
+        # The hot entries are evicted once, and go to the main queue when they come back
+        for i in xrange(10, 18): cache.set(GetNumber(i), i)
+        assert not any(op in cache for op in hot)
+        for op in hot: cache.set(op, op.input)
+
+        # A scan of entries that are used once does not evict them
+        for i in xrange(20, 100): cache.set(GetNumber(i), i)
+        assert all(op in cache for op in hot)
+        assert len(cache) == 8
+
+    def test_bytes(self):
+        cache = LRUCache(max_bytes=100, size_estimator=lambda blob: blob.size)
+        cache.set(GetNumber(1), Blob(60))
+        cache.set(GetNumber(2), Blob(30))
+        assert cache.bytes == 90
+
+        cache.set(GetNumber(3), Blob(30))
+        assert GetNumber(1) not in cache
+        assert cache.bytes == 60
+
+        # Too big to be cached
+        cache.set(GetNumber(4), Blob(101))
+        assert GetNumber(4) not in cache
+
+        cache.remove(GetNumber(2))
+        assert cache.stats()['bytes'] == 30
+
+    def test_estimate_size(self):
+        small = [1.0] * 10
+        big = [1.0] * 10000
+        assert estimate_size(big) > 10000 * sys.getsizeof(1.0)
+        assert estimate_size({'a': big}) > estimate_size({'a': small})
+        assert estimate_size(Blob(0)) > sys.getsizeof(Blob(0))
+
+        register_size_estimator(SizedBlob, lambda blob: blob.size)
+        assert estimate_size(SizedBlob(1000)) == 1000
+
+    @unittest.skipIf(np is None, 'numpy and pandas are not installed')
+    def test_estimate_size_numpy(self):
+        assert estimate_size(np.zeros(1000)) >= 8000
+        df = pd.DataFrame({'a': np.zeros(1000), 'b': ['some string'] * 1000})
+        assert estimate_size(df) > 8000 + 1000 * len('some string')
+
+    def test_make_cache(self):
+        assert make_cache('lru') is None
+        assert isinstance(make_cache('2q', max_bytes=10), TwoQueueCache)
+        self.assertRaises(ValueError, make_cache, 'arc', 10)
+
+    def test_greedy_dual_size(self):
+        costs = {GetNumber(1): 60., GetNumber(2): 1., GetNumber(3): 1.}
+        cache = GreedyDualSizeCache(max_bytes=100, size_estimator=lambda blob: blob.size, cost_function=costs.get)
+
+        # Expensive and small
+        cache.set(GetNumber(1), Blob(10))
+        # Cheap and big
+        cache.set(GetNumber(2), Blob(80))
+        cache.set(GetNumber(3), Blob(20))
+        assert GetNumber(1) in cache and GetNumber(2) not in cache and GetNumber(3) in cache
+
+        # Not admitted, its priority is the lowest
+        costs[GetNumber(4)] = 1.
+        cache.set(GetNumber(4), Blob(75))
+        assert GetNumber(4) not in cache and GetNumber(3) in cache
+
+        # Entries that are not used age
+        for i in xrange(5, 1005):
+            costs[GetNumber(i)] = 1.
+            cache.set(GetNumber(i), Blob(1))
+        assert GetNumber(1) not in cache
+
+    def test_recorded_costs(self):
+        # Sizes are estimated only for the caches bounded by bytes
+        op = GetNumber(1001)
+        OperationRunner(execute_cache_size=10).execute(op)
+        assert execution_stats.get_cost(op) is not None
+        assert execution_stats.get_size(op) is None
+
+        op = GetNumber(1000)
+        runner = OperationRunner(execute_cache_bytes=10 ** 6, execute_cache_policy='gds')
+        runner.execute(op)
+        assert execution_stats.get_cost(op) is not None
+        assert execution_stats.get_size(op) == estimate_size(1001)
+        assert runner.execute_cache.bytes == estimate_size(1001)
@@ -1,9 +1,12 @@
 import tempfile
 import unittest
 
+from bson import ObjectId
+
 from fito.data_store.file import FileDataStore, RawSerializer, PickleSerializer
+from fito.specs.key_codec import JSONKeyCodec, BinaryKeyCodec
 from test_data_store import delete
-from test_spec import get_test_specs
+from test_spec import get_test_specs, SpecA
 
 
 class TestFileDataStore(unittest.TestCase):
@@ -39,7 +42,62 @@ class TestFileDataStore(unittest.TestCase):
 
             self.assertRaises(StopIteration, ds.iterkeys().next)
 
+    def test_key_codec(self):
+        for ds in self.data_stores:
+            assert ds.key_codec == JSONKeyCodec()
+
+        ds = FileDataStore(tempfile.mktemp(), key_codec=JSONKeyCodec())
+        self.data_stores.append(ds)
+        for i, spec in enumerate(self.test_specs):
+            ds[spec] = i
+
+        # The codec is persisted in the store, not in its spec
+        assert FileDataStore(ds.path).key_codec == JSONKeyCodec()
+        assert 'key_codec' not in ds.to_dict()
+        assert ds == FileDataStore(ds.path)
+        self.assertRaises(RuntimeError, FileDataStore, ds.path, key_codec=BinaryKeyCodec())
+
+        ds.migrate_keys(BinaryKeyCodec())
+        ds = FileDataStore(ds.path)
+        assert ds.key_codec == BinaryKeyCodec()
+        assert sorted(ds.iterkeys()) == sorted(set(self.test_specs))
+        for spec in self.test_specs:
+            assert ds[spec] == self.test_specs.index(spec)
+
+    def test_object_ids(self):
+        self.data_stores.append(FileDataStore(tempfile.mktemp(), key_codec=BinaryKeyCodec()))
+        spec = SpecA(0, field2=[ObjectId(), SpecA])
+        for ds in self.data_stores:
+            ds[spec] = 'value'
+            assert spec in ds
+            assert ds[spec] == 'value'
+            assert list(ds.iterkeys()) == [spec]
+
+    def test_save_many(self):
+        for ds in self.data_stores:
+            # Build the similarity index, so that it has to be kept up to date
+            ds.find_similar(self.test_specs[0])
+
+            ds.save_many([(spec, str(i)) for i, spec in enumerate(self.test_specs)])
+            for spec in self.test_specs:
+                assert ds[spec] == str(self.test_specs.index(spec))
 
+            # The journal was updated
+            reloaded = FileDataStore(ds.path, use_class_name=ds.use_class_name)
+            assert len(reloaded.get_similarity_index()) == len(set(self.test_specs))
 
+    def test_collect_garbage(self):
+        ds = self.data_stores[0]
+        specs = self.test_specs[:3]
+        # The first spec is cheap and big
+        ds[specs[0]] = 'a' * 1000
+        ds[specs[1]] = 'b' * 100
+        ds[specs[2]] = 'c' * 100
+        costs = {specs[0]: 1., specs[1]: 10., specs[2]: 10.}
 
+        sizes = [ds.get_stored_size(spec) for spec in specs]
+        assert sizes[0] > 1000
 
+        assert ds.collect_garbage(sum(sizes), cost_function=costs.get) == []
+        assert ds.collect_garbage(sum(sizes) - 1, cost_function=costs.get) == [specs[0]]
+        assert specs[0] not in ds and specs[1] in ds and specs[2] in ds
@@ -0,0 +1,37 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(code):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([root, os.environ.get('PYTHONPATH', '')]))
+    output = subprocess.check_output([sys.executable, '-c', code], env=env)
+    return json.loads(output.splitlines()[-1])
+
+
+class TestImport(unittest.TestCase):
+    def test_lazy_backends(self):
+        heavy = ['bson', 'pymongo', 'gridfs', 'yaml', 'cmd2']
+        imported = run(
+            'import json, sys, fito, fito.data_store\n'
+            'print(json.dumps([m for m in {} if sys.modules.get(m) is not None]))'.format(heavy)
+        )
+        assert imported == []
+
+    def test_lazy_attributes(self):
+        res = run(
+            'import json, sys\n'
+            'from fito.data_store import MongoHashMap\n'
+            'from fito.data_store import mongo\n'
+            'created = "global_client" in vars(mongo)\n'
+            'from fito.data_store.mongo import global_client, get_global_client\n'
+            'print(json.dumps([MongoHashMap is mongo.MongoHashMap, created, global_client is get_global_client()]))'
+        )
+        assert res == [True, False, True]
+
+        import fito.data_store
+        self.assertRaises(AttributeError, getattr, fito.data_store, 'NotABackend')
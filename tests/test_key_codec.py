@@ -0,0 +1,45 @@
+import unittest
+from datetime import datetime
+
+from bson import ObjectId
+
+from fito import Spec
+from fito.specs.key_codec import JSONKeyCodec, BinaryKeyCodec, cbor_dumps, cbor_loads
+from test_spec import get_test_specs, SpecA
+
+
+class TestKeyCodec(unittest.TestCase):
+    def setUp(self):
+        self.instances = get_test_specs()
+        self.codecs = [JSONKeyCodec(), BinaryKeyCodec()]
+
+    def test_round_trip(self):
+        for codec in self.codecs:
+            for spec in self.instances:
+                key = codec.get_key(spec)
+                assert key == codec.encode(spec.to_dict())
+                assert codec.encode(codec.decode(key)) == key
+                assert Spec.dict2spec(codec.decode(key)) == spec
+
+    def test_deterministic(self):
+        values = [
+            None, True, False, 0, 23, 24, 255, 256, 2 ** 32, 2 ** 64, -1, -2 ** 64 - 1, 1.5, 0.1, 1e300,
+            'text', u'\xe1', '\xff', [], (1, [2]), {'b': 1, 'a': [None]}, {1: 'a', 'ab': 2, 'b': 3},
+            datetime(2017, 1, 1, 10, 30, 1, 50), ObjectId(), {'id': [ObjectId()]},
+        ]
+        for value in values:
+            loaded = cbor_loads(cbor_dumps(value))
+            assert loaded == (list(value) if isinstance(value, tuple) else value)
+
+        # Equal dicts give equal keys, regardless of how they were built
+        d1 = {'field%d' % i: i for i in xrange(20)}
+        d2 = dict(reversed(d1.items()))
+        assert cbor_dumps(d1) == cbor_dumps(d2)
+        assert cbor_dumps({'a': 'b'}) == cbor_dumps({u'a': u'b'})
+
+        assert cbor_dumps(1) == '\x01' and cbor_dumps(-1) == '\x20' and cbor_dumps({'b': 1, 'aa': 2})[1] == 'a'
+        assert len(BinaryKeyCodec().get_key(SpecA(0))) < len(JSONKeyCodec().get_key(SpecA(0)))
+
+        self.assertRaises(TypeError, cbor_dumps, object())
+        self.assertRaises(ValueError, cbor_loads, cbor_dumps([1, 2])[:-1])
+        self.assertRaises(ValueError, cbor_loads, cbor_dumps([1, 2]) + '\x00')
@@ -50,6 +50,17 @@ class TestModel(unittest.TestCase):
 
         assert sorted(Pepe.get_hyper_parameters_grid()) == sorted(expected_result)
 
+    def test_interned_hyper_parameters(self):
+        grid = Pepe.get_hyper_parameters_grid(intern=True)
+        assert sorted(model.to_dict() for model in grid) == sorted(Pepe.get_hyper_parameters_grid())
+
+        # The combinations share their submodels
+        stage2 = {id(model.stage2) for model in grid}
+        assert len(stage2) == len(Stage2Impl1.d.grid)
+        stage1 = {id(model.stage1) for model in grid}
+        assert len(stage1) == len(grid) / len(stage2)
+        assert all(model.intern() is model for model in grid)
+
     def test_scikit_learn(self):
         # just make sure it executes
         for model_class in LogisticRegression, LinearRegression, GradientBoostingClassifier:
@@ -1,11 +1,21 @@
 from collections import defaultdict
+from itertools import product
 import inspect
+import os
+import tempfile
+import time
+import threading
 import unittest
+from multiprocessing import Process
 from random import Random
 
+from fito.data_store.dict_ds import DictDataStore
+from fito.data_store.file import FileDataStore
 from fito.operation_runner import OperationRunner
+from fito.operations.decorate import as_operation
 from fito.operations.operation import Operation
-from fito.specs.fields import NumericField, SpecField
+from fito.specs.fields import NumericField, SpecField, PrimitiveField, SpecCollection
+from test_data_store import delete
 
 
 class SentinelOperation(Operation):
@@ -105,3 +115,263 @@ class TestOperation(unittest.TestCase):
             for op in self.operations:
                 assert op.times_run == cardinality[op] * (i + 1)
 
+
+
+class Wait(Operation):
+    value = NumericField(0)
+    seconds = PrimitiveField(1, default=0.2)
+
+    def apply(self, runner):
+        time.sleep(self.seconds)
+        return self.value
+
+
+class WaitAll(Operation):
+    operations = SpecCollection(0)
+
+    def apply(self, runner):
+        values = yield self.operations
+        yield sum(values)
+
+
+class Chain(Operation):
+    depth = NumericField(0)
+
+    def apply(self, runner):
+        if self.depth == 0: yield 0
+        value = yield Chain(self.depth - 1)
+        yield value + 1
+
+
+class Fails(Operation):
+    def apply(self, runner):
+        raise ValueError()
+
+
+class Catches(Operation):
+    def apply(self, runner):
+        try:
+            yield Fails()
+        except ValueError:
+            yield 'caught'
+
+
+@as_operation()
+def wait_all(n):
+    values = yield [Wait(i) for i in xrange(n)]
+    yield sum(values)
+
+
+class TestAsyncExecute(unittest.TestCase):
+    def test_async_execute(self):
+        start = time.time()
+        results = [Wait(i).async_execute() for i in xrange(4)]
+        assert [e.get() for e in results] == range(4)
+        assert time.time() - start < 0.6
+
+    def test_coroutines(self):
+        for op in WaitAll([Wait(i) for i in xrange(4)]), wait_all(4):
+            start = time.time()
+            assert op.execute() == 6
+            assert time.time() - start < 0.6
+
+        assert Catches().execute() == 'caught'
+        self.assertRaises(ValueError, Fails().async_execute().get)
+
+    def test_nested(self):
+        # More coroutines waiting for each other than threads in the pool
+        assert Chain(3 * OperationRunner.async_threads).execute() == 3 * OperationRunner.async_threads
+
+    def test_caches(self):
+        ds = DictDataStore()
+        runner = OperationRunner(execute_cache_size=10)
+        op = WaitAll([Wait(1, out_data_store=ds), Wait(2)])
+        assert runner.async_execute(op).get() == 3
+        assert ds[Wait(1)] == 1
+
+        start = time.time()
+        assert runner.async_execute(op).get() == 3
+        assert time.time() - start < 0.1
+
+
+class AppendLine(Operation):
+    """
+    Appends a line to a file every time it's applied
+    """
+    path = PrimitiveField(0)
+    seconds = PrimitiveField(1, default=0.3)
+
+    def apply(self, runner):
+        with open(self.path, 'a') as f:
+            f.write('applied\n')
+        time.sleep(self.seconds)
+        return os.getpid()
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mktemp()
+        self.ds = FileDataStore(tempfile.mktemp())
+        self.ds.lease_poll_interval = 0.05
+
+    def tearDown(self):
+        if os.path.exists(self.path): os.unlink(self.path)
+        delete(self.ds.path)
+
+    def n_applied(self):
+        with open(self.path) as f:
+            return len(f.readlines())
+
+    def test_threads(self):
+        op = AppendLine(self.path)
+        results = [OperationRunner().async_execute(op) for _ in xrange(4)]
+        assert len({e.get() for e in results}) == 1
+        assert self.n_applied() == 1
+
+    def test_out_data_stores(self):
+        stores = [DictDataStore(), DictDataStore()]
+        results = [OperationRunner().async_execute(AppendLine(self.path, out_data_store=ds)) for ds in stores]
+        for e in results: e.get()
+
+        assert self.n_applied() == 1
+        # Each one is saved to its own data store
+        assert all(AppendLine(self.path) in ds for ds in stores)
+
+    def test_processes(self):
+        op = AppendLine(self.path, out_data_store=self.ds)
+        processes = [Process(target=op.execute) for _ in xrange(3)]
+        for process in processes: process.start()
+        for process in processes: process.join()
+
+        assert self.n_applied() == 1
+        assert self.ds[op] in [process.pid for process in processes]
+        # Leases are released
+        assert os.listdir(os.path.join(self.ds.path, 'leases')) == []
+
+    def test_expired_leases(self):
+        op = AppendLine(self.path)
+        assert self.ds.acquire_lease(op)
+        assert not self.ds.acquire_lease(op)
+
+        self.ds.lease_ttl = -1
+        # The first attempt breaks the expired lease
+        assert not self.ds.acquire_lease(op)
+        assert self.ds.acquire_lease(op)
+        self.ds.release_lease(op)
+
+    def test_lease_keeper(self):
+        def keeper_running():
+            return any(thread.name == 'fito-lease-keeper' for thread in threading.enumerate())
+
+        # Dict data stores don't have leases
+        AppendLine(self.path, 0, out_data_store=DictDataStore()).execute()
+        assert not keeper_running()
+
+        self.ds.lease_ttl = 0.2
+        thread = threading.Thread(target=AppendLine(self.path, 0.3, out_data_store=self.ds).execute)
+        thread.start()
+        time.sleep(0.1)
+        assert keeper_running()
+
+        # It ends when no leases are held
+        thread.join()
+        time.sleep(0.1)
+        assert not keeper_running()
+
+    def test_renew_leases(self):
+        self.ds.lease_ttl = 0.2
+        op = AppendLine(self.path, 1, out_data_store=self.ds)
+        thread = threading.Thread(target=op.execute)
+        thread.start()
+
+        # Applying takes longer than the ttl, but the lease is renewed meanwhile
+        time.sleep(0.6)
+        other = FileDataStore(self.ds.path)
+        other.lease_ttl = 0.2
+        assert not other.acquire_lease(op)
+        assert not other.acquire_lease(op)
+
+        thread.join()
+        assert other.acquire_lease(op)
+        other.release_lease(op)
+
+
+class CountingDataStore(DictDataStore):
+    def __init__(self, *args, **kwargs):
+        super(CountingDataStore, self).__init__(*args, **kwargs)
+        self.calls = defaultdict(int)
+
+    def contains_many(self, specs):
+        self.calls['contains_many'] += 1
+        return super(CountingDataStore, self).contains_many(specs)
+
+    def save(self, spec, object):
+        self.calls['save'] += 1
+        super(CountingDataStore, self).save(spec, object)
+
+    def save_many(self, items):
+        self.calls['save_many'] += 1
+        super(CountingDataStore, self).save_many(items)
+
+
+class TestExecuteMany(unittest.TestCase):
+    def setUp(self):
+        self.ds = CountingDataStore()
+        self.operations = [GetNumber(i, out_data_store=self.ds) for i in xrange(10)]
+        for op in self.operations[:4]:
+            self.ds[op] = op.input + 1
+        self.ds.calls.clear()
+
+    def test_ordered(self):
+        operations = self.operations + self.operations[::-1]
+        results = OperationRunner().execute_many(operations, batch_size=4)
+        assert list(results) == [op.input + 1 for op in operations]
+
+        assert [op.times_run for op in self.operations] == [0] * 4 + [1] * 6
+        assert self.ds.calls == {'contains_many': 1, 'save_many': 2, 'save': 6}
+        assert all(op in self.ds for op in self.operations)
+
+    def test_unordered(self):
+        results = list(OperationRunner().execute_many(self.operations, parallel=True, ordered=False))
+        assert len(results) == len(self.operations)
+        assert dict(results) == {op: op.input + 1 for op in self.operations}
+        assert [op for op, _ in results[:4]] == self.operations[:4]
+        assert self.ds.calls['save_many'] == 1
+
+    def test_force_and_memory(self):
+        runner = OperationRunner(execute_cache_size=20)
+        assert list(runner.execute_many(self.operations, force=True)) == range(1, 11)
+        assert all(op.times_run == 1 for op in self.operations)
+
+        self.ds.calls.clear()
+        assert list(runner.execute_many(self.operations)) == range(1, 11)
+        assert all(op.times_run == 1 for op in self.operations)
+        # Everything was in the execute cache
+        assert self.ds.calls == {}
+
+    def test_lazy(self):
+        results = OperationRunner().execute_many(self.operations, batch_size=100)
+        assert next(results) == 1
+        assert self.operations[4].times_run == 0
+
+        assert list(results)[:4] == [2, 3, 4, 5]
+        assert self.operations[4].times_run == 1
+
+    def test_dependencies(self):
+        for reverse, parallel in product([False, True], repeat=2):
+            ds = FileDataStore(tempfile.mktemp())
+            ds.lease_ttl = 3
+            ds.lease_poll_interval = 0.05
+            a = GetNumber(1, out_data_store=ds)
+            b = MultiplyOperation(a, GetNumber(2), out_data_store=ds)
+            operations = [b, a] if reverse else [a, b]
+            try:
+                start = time.time()
+                # b executes a in its apply, before the batch is saved
+                results = list(OperationRunner().execute_many(operations, parallel=parallel))
+                assert results == ([6, 2] if reverse else [2, 6])
+                assert time.time() - start < 1
+                assert a.times_run == 1 and b.times_run == 1
+                assert os.listdir(os.path.join(ds.path, 'leases')) == []
+            finally:
+                delete(ds.path)
@@ -0,0 +1,198 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from multiprocessing import Process
+
+from fito.data_store.dict_ds import DictDataStore
+from fito.data_store.file import FileDataStore
+from fito.operation_runner import OperationRunner
+from fito.operations.decorate import as_operation
+from fito.operations.operation import Operation, OperationField
+from fito.parallel import ThreadPoolRunner, ProcessPoolRunner, operation_dependencies
+from fito.specs.fields import NumericField, PrimitiveField, SpecCollection, SpecField
+from test_data_store import delete
+from test_operation_runner import TestOperation, AppendLine
+
+
+class Sleep(Operation):
+    value = NumericField(0)
+    seconds = PrimitiveField(1, default=0.2)
+
+    def apply(self, runner):
+        time.sleep(self.seconds)
+        return self.value
+
+
+class Sum(Operation):
+    operations = SpecCollection(0)
+
+    def apply(self, runner):
+        return sum(runner.execute(op) for op in self.operations)
+
+
+class Pid(Operation):
+    value = NumericField(0)
+    dependency = SpecField(default=None)
+
+    def apply(self, runner):
+        dependency = None if self.dependency is None else runner.execute(self.dependency)
+        return self.value, os.getpid(), dependency
+
+
+class Collect(Operation):
+    operations = SpecCollection(0)
+
+    def apply(self, runner):
+        return [runner.execute(op) for op in self.operations]
+
+
+class Fail(Operation):
+    def apply(self, runner):
+        raise ValueError('fail')
+
+
+class Recorder(Operation):
+    """
+    Records the operations it's applied on
+    """
+    name = PrimitiveField(0)
+    dependency = SpecField(default=None)
+    applied = []
+    lock = threading.Lock()
+
+    def apply(self, runner):
+        with self.lock:
+            Recorder.applied.append(self.name)
+        if self.dependency is not None: runner.execute(self.dependency)
+        return self.name
+
+
+@as_operation()
+def load(value):
+    time.sleep(0.2)
+    return value
+
+
+@as_operation(a=OperationField, b=OperationField)
+def add(a, b):
+    return a + b
+
+
+class TestThreadPoolRunner(unittest.TestCase):
+    def setUp(self):
+        # The random DAG of multiplications of the OperationRunner tests
+        TestOperation.setUp.im_func(self)
+        Recorder.applied = []
+
+    def test_results(self):
+        runner = ThreadPoolRunner()
+        expected = [OperationRunner().execute(op) for op in self.operations]
+        assert [runner.execute(op) for op in self.operations] == expected
+        runner.close()
+
+    def test_dependencies(self):
+        a, b = Sleep(1), Sleep(2)
+        assert operation_dependencies(Sum([a, b, a])) == [a, b]
+        assert operation_dependencies(Recorder('x', dependency=Recorder('y'))) == [Recorder('y')]
+        assert operation_dependencies(a) == []
+
+    def test_concurrency(self):
+        runner = ThreadPoolRunner(n_threads=4)
+        op = Sum([Sleep(i) for i in xrange(4)])
+
+        start = time.time()
+        assert runner.execute(op) == 6
+        assert time.time() - start < 0.6
+        runner.close()
+
+    def test_as_operation(self):
+        runner = ThreadPoolRunner()
+        start = time.time()
+        assert runner.execute(add(load(1), load(2))) == 3
+        assert time.time() - start < 0.35
+        runner.close()
+
+    def test_caches(self):
+        ds = DictDataStore()
+        runner = ThreadPoolRunner(execute_cache_size=10)
+
+        leaf = Recorder('leaf')
+        root = Recorder('root', dependency=leaf, out_data_store=ds)
+        assert runner.execute(root) == 'root'
+        assert sorted(Recorder.applied) == ['leaf', 'root']
+        assert ds[root] == 'root'
+
+        # Cached in memory
+        runner.execute(root)
+        assert len(Recorder.applied) == 2
+
+        # Cached in the data store, the dependencies of a cached operation are not executed
+        runner = ThreadPoolRunner()
+        runner.execute(root)
+        assert len(Recorder.applied) == 2
+
+        # Forced executions ignore every cache
+        runner.execute(root, force=True)
+        assert sorted(Recorder.applied) == ['leaf', 'leaf', 'root', 'root']
+
+    def test_single_flight(self):
+        path = tempfile.mktemp()
+        ds = FileDataStore(tempfile.mktemp())
+        ds.lease_poll_interval = 0.05
+        try:
+            op = Collect([AppendLine(path, out_data_store=ds)])
+            # Other threads and processes that execute it wait for the first one
+            process = Process(target=OperationRunner().execute, args=(AppendLine(path, out_data_store=ds),))
+            process.start()
+            threads = [threading.Thread(target=ThreadPoolRunner().execute, args=(op,)) for _ in xrange(3)]
+            for thread in threads: thread.start()
+            for thread in threads: thread.join()
+            process.join()
+
+            with open(path) as f:
+                assert len(f.readlines()) == 1
+        finally:
+            if os.path.exists(path): os.unlink(path)
+            delete(ds.path)
+
+    def test_errors(self):
+        runner = ThreadPoolRunner()
+        self.assertRaises(ValueError, runner.execute, Sum([Sleep(1, 0), Fail()]))
+        # The runner can still be used
+        assert runner.execute(Sum([Sleep(1, 0), Sleep(2, 0)])) == 3
+        runner.close()
+
+
+class TestProcessPoolRunner(unittest.TestCase):
+    def setUp(self):
+        self.ds = FileDataStore(tempfile.mktemp())
+
+    def tearDown(self):
+        delete(self.ds.path)
+
+    def test_execute(self):
+        runner = ProcessPoolRunner(n_processes=2)
+        leaves = [Pid(i, out_data_store=self.ds) for i in xrange(4)]
+        middle = Pid(4, dependency=leaves[0], out_data_store=self.ds)
+        # Collect runs in the parent, it has no data store
+        res = runner.execute(Collect([middle] + leaves[1:]))
+        assert [value for value, _, _ in res] == [4, 1, 2, 3]
+
+        # Executed by the workers and saved in the data store
+        assert all(pid != os.getpid() for _, pid, _ in res)
+        assert all(op in self.ds for op in leaves + [middle])
+        # The worker read the result of the dependency from the data store
+        assert res[0][2] == self.ds[leaves[0]]
+
+        # Everything is cached now
+        assert runner.execute(middle) == res[0]
+        runner.close()
+
+    def test_memory_stores(self):
+        runner = ProcessPoolRunner(n_processes=2)
+        ds = DictDataStore()
+        res = runner.execute(Collect([Pid(i, out_data_store=ds) for i in xrange(2)]))
+        assert all(pid == os.getpid() for _, pid, _ in res)
+        runner.close()
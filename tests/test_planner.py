@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+
+from fito.data_store.dict_ds import DictDataStore
+from fito.data_store.file import FileDataStore
+from fito.operation_runner import OperationRunner
+from fito.planner import ExecutionStats, execution_stats, COMPUTE, HIT_MEMORY, HIT_STORE
+from test_data_store import delete
+from test_operation_runner import GetNumber, MultiplyOperation
+
+
+class TestPlanner(unittest.TestCase):
+    def setUp(self):
+        self.ds = DictDataStore()
+        self.a = GetNumber(1, out_data_store=self.ds)
+        self.b = GetNumber(2)
+        self.ab = MultiplyOperation(self.a, self.b, out_data_store=self.ds)
+        self.root = MultiplyOperation(self.ab, GetNumber(3))
+
+    def test_plan(self):
+        runner = OperationRunner()
+        plan = runner.plan(self.root)
+        assert plan.hits == []
+        assert set(plan.to_compute) == {self.root, self.ab, self.a, self.b, GetNumber(3)}
+
+        # Dependencies come first
+        order = plan.to_compute
+        assert order[-1] == self.root
+        assert order.index(self.a) < order.index(self.ab)
+        assert order.index(self.b) < order.index(self.ab)
+
+        # Planning does not execute anything
+        assert self.ab not in self.ds
+        assert self.a.times_run == 0
+
+    def test_hits(self):
+        runner = OperationRunner(execute_cache_size=10)
+        runner.execute(self.ab)
+        runner.execute_cache.remove(self.ab)
+
+        plan = runner.plan(self.root)
+        assert plan[self.ab].status == HIT_STORE
+        assert plan[self.ab].data_store is self.ds
+        # Cached subtrees are not visited
+        assert self.a not in plan
+        assert plan.to_compute == [GetNumber(3), self.root]
+
+        runner.execute(GetNumber(3))
+        assert runner.plan(self.root)[GetNumber(3)].status == HIT_MEMORY
+
+        # Forced executions compute everything
+        plan = runner.plan(self.root, force=True)
+        assert all(plan[op].status == COMPUTE for op in [self.root, self.ab, self.a, self.b])
+
+    def test_explain(self):
+        runner = OperationRunner()
+        runner.execute(self.ab)
+
+        report = runner.plan(self.root).explain()
+        assert 'hit in {!r}'.format(self.ds) in report
+        assert 'Order:' in report
+        # GetNumber was applied before, so its cost is known
+        assert '{!r}: compute (unknown)'.format(GetNumber(3)) not in report
+        assert str(runner.plan(self.root)) == report
+
+    def test_stats(self):
+        stats = ExecutionStats()
+        stats.record(self.a, 1)
+        stats.record(self.b, 3)
+        assert stats.estimate(GetNumber(10)) == 2
+        assert stats.estimate(self.root) is None
+
+        path = tempfile.mktemp()
+        try:
+            stats.dump(path)
+            loaded = ExecutionStats()
+            loaded.load(path)
+            assert loaded.estimate(self.a) == 2
+        finally:
+            os.unlink(path)
+
+        runner = OperationRunner()
+        runner.execute(self.root)
+        assert execution_stats.estimate(self.root) is not None
+
+    def test_contains_many(self):
+        path = tempfile.mktemp()
+        try:
+            for ds in DictDataStore(), FileDataStore(path):
+                ds[self.a] = 1
+                ds[self.ab] = 2
+                assert ds.contains_many([self.a, self.b, self.ab, self.root]) == [True, False, True, False]
+        finally:
+            delete(path)
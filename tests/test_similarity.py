@@ -0,0 +1,99 @@
+import tempfile
+import unittest
+
+from fito.data_store.dict_ds import DictDataStore
+from fito.data_store.file import FileDataStore
+from fito.data_store.similarity import SimilarityIndex, LSHSimilarityIndex
+from fito.specs.utils import matching_fields
+from test_data_store import delete
+from test_spec import get_test_specs, SpecA, SpecB
+
+
+def get_specs():
+    res = get_test_specs(only_lists=True)
+    res.extend(SpecA(i, j % 3) for i in xrange(10) for j in xrange(5))
+    res.extend(SpecB(spec_a=SpecA(i, 1.0)) for i in xrange(5))
+    return res
+
+
+class TestSimilarity(unittest.TestCase):
+    def setUp(self):
+        self.specs = get_specs()
+        self.spec_dicts = [spec.to_dict() for spec in self.specs]
+
+    def build_index(self, index):
+        for i, spec_dict in enumerate(self.spec_dicts):
+            index.add(i, spec_dict)
+        return index
+
+    def test_matching_fields(self):
+        index = self.build_index(SimilarityIndex())
+
+        for query in self.spec_dicts:
+            expected = sorted(
+                (i, matching_fields(query, spec_dict)) for i, spec_dict in enumerate(self.spec_dicts)
+            )
+            assert sorted(index.query(query)) == [(i, score) for i, score in expected if score > 0]
+
+            # The top n have the best scores
+            scores = sorted((score for _, score in expected), reverse=True)
+            for n in 1, 5, 20:
+                assert [score for _, score in index.query(query, n=n)] == scores[:n]
+
+    def test_remove(self):
+        for index in SimilarityIndex(), LSHSimilarityIndex():
+            self.build_index(index)
+            for i, spec_dict in enumerate(self.spec_dicts):
+                if i % 2 == 0: index.remove(i, spec_dict)
+
+            assert len(index) == len(self.spec_dicts) // 2
+            for i, spec_dict in enumerate(self.spec_dicts):
+                assert all(key % 2 == 1 for key, _ in index.query(spec_dict, n=10))
+
+    def test_approximate(self):
+        index = self.build_index(LSHSimilarityIndex())
+        exact_index = self.build_index(SimilarityIndex())
+
+        for i, spec_dict in enumerate(self.spec_dicts):
+            best_score = exact_index.query(spec_dict, n=1)[0][1]
+            assert index.query(spec_dict, n=1)[0][1] == best_score
+
+    def test_data_stores(self):
+        path = tempfile.mktemp()
+        try:
+            for ds in DictDataStore(), FileDataStore(path):
+                for spec in self.specs[:-10]:
+                    ds[spec] = 1
+
+                assert ds.find_similar(self.specs[0], n=1) == [(self.specs[0], 8)]
+
+                # The index is kept up to date
+                spec = self.specs[-1]
+                assert ds.find_similar(spec, n=1)[0][0] != spec
+                ds[spec] = 1
+                assert ds.find_similar(spec, n=1)[0][0] == spec
+                ds.remove(spec)
+                assert ds.find_similar(spec, n=1)[0][0] != spec
+
+            # The index of file data stores is persisted
+            ds = FileDataStore(path)
+            ds.iterkeys = None
+            assert len(ds.get_similarity_index()) == len(set(self.specs[:-10]))
+            assert ds.find_similar(self.specs[0], n=1) == [(self.specs[0], 8)]
+
+            # Saving again what is indexed does not grow the journal
+            journal = ds.get_similarity_journal()
+            n_records = len(list(journal._iter_records()))
+            ds[self.specs[0]] = 2
+            ds.save_many([(spec, 2) for spec in self.specs[:5]])
+            assert len(list(journal._iter_records())) == n_records
+
+            # Neither when the index was not loaded
+            ds = FileDataStore(path)
+            for _ in xrange(10):
+                ds[self.specs[0]] = 3
+                ds.save_many([(spec, 3) for spec in self.specs[:5]])
+            assert ds.similarity_index is None
+            assert len(list(journal._iter_records())) == n_records
+        finally:
+            delete(path)
@@ -1,21 +1,28 @@
+import gc
+import json
 import os
+import pickle
 from tempfile import mktemp, mkdtemp
 import warnings
 from StringIO import StringIO
 import unittest
-from datetime import datetime
+from collections import OrderedDict
+from datetime import datetime, timedelta, tzinfo
 from random import Random
+from multiprocessing.pool import ThreadPool
 
-import re
 import shutil
 import yaml
+from bson import ObjectId
 
 from fito import Spec, SpecField, PrimitiveField
 from fito.specs.fields import NumericField, CollectionField, SpecCollection, BaseSpecField, \
-    KwargsField, ArgsField
-from fito.specs.base import InvalidSpecInstance
-from fito.specs.utils import general_append
+    KwargsField, ArgsField, Field, UnboundPrimitiveField
+from fito.specs.base import InvalidSpecInstance, FrozenSpecError
+from fito.specs.registry import registry, AmbiguousSpecName
+from fito.specs.utils import general_append, recursive_map
 from fito.specs import base as specs_base
+from fito.specs import json_encoding
 
 
 class SpecA(Spec):
@@ -55,6 +62,29 @@ class SpecWithDefault(Spec):
     a = SpecField(default=SpecA(10))
 
 
+class FrozenSpec(Spec):
+    frozen = True
+
+    field = PrimitiveField(0)
+    spec_a = SpecField(base_type=SpecA)
+    unbound = UnboundPrimitiveField(0)
+
+
+# Same shapes than above, using the generated fast paths
+compiled_classes = {
+    cls: type('Compiled' + cls.__name__, (cls,), {'compiled': True, '__module__': __name__})
+    for cls in [SpecA, AnotherSpec, SpecB, SpecC, SpecD, SpecWithDefault]
+}
+globals().update((cls.__name__, cls) for cls in compiled_classes.itervalues())
+
+# Same shapes than above, storing the fields in slots
+compact_classes = {
+    cls: type('Compact' + cls.__name__, (cls,), {'compact': True, '__module__': __name__})
+    for cls in [SpecA, AnotherSpec, SpecB, SpecC, SpecD, SpecWithDefault, FrozenSpec, compiled_classes[SpecA]]
+}
+globals().update((cls.__name__, cls) for cls in compact_classes.itervalues())
+
+
 def get_test_specs(only_lists=True, easy=False):
     if easy:
         warnings.warn("get_test_specs(easy=True)")
@@ -96,24 +126,13 @@ class TestSpec(unittest.TestCase):
         :param module_name: either "json" or "yaml"
         """
         for spec in self.instances:
-            try:
-                # Get the dumps serialization
-                spec_dumps = getattr(spec, module_name).dumps()
-
-                f = StringIO()
-                getattr(spec, module_name).dump(f)
-                # Get the dump serialization, they should be equivalent
-                spec_dump = f.getvalue()
-            except TypeError, e:
-                if len(e.args) == 0: raise e
-
-                message = e.args[0]
-                if not isinstance(message, basestring): raise e
+            # Get the dumps serialization
+            spec_dumps = getattr(spec, module_name).dumps()
 
-                is_datetime_error = re.match('^datetime*? is not JSON is not JSON serializable$', message) is not None
-
-                assert is_datetime_error == (not hasattr(specs_base, 'json_util'))
-                continue
+            f = StringIO()
+            getattr(spec, module_name).dump(f)
+            # Get the dump serialization, they should be equivalent
+            spec_dump = f.getvalue()
 
             # Hack: TODO do this better
             load_func = getattr(Spec, 'from_{}'.format(module_name))
@@ -171,6 +190,150 @@ class TestSpec(unittest.TestCase):
         spec.field1 = 10
         assert not hasattr(spec, '_key')
 
+    def test_digest(self):
+        for spec in self.instances:
+            assert spec.digest == specs_base.dict_digest(spec.to_dict())
+            assert spec.digest == spec.copy().digest
+
+        # Changing a subspec invalidates the digest of the specs that contain it
+        spec_a = SpecA(0)
+        spec_b = SpecB(spec_a=spec_a)
+        spec_c = SpecC([spec_b, SpecA(2)])
+        digests = [spec_a.digest, spec_b.digest, spec_c.digest]
+
+        spec_a.field1 = 1
+        assert not hasattr(spec_c, '_digest')
+        assert [spec_a.digest, spec_b.digest, spec_c.digest] != digests
+        assert spec_c.digest == specs_base.dict_digest(spec_c.to_dict())
+        assert spec_c == Spec.dict2spec(spec_c.to_dict())
+
+        spec_a.field1 = 0
+        assert [spec_a.digest, spec_b.digest, spec_c.digest] == digests
+
+    def test_frozen(self):
+        spec = FrozenSpec(1, spec_a=SpecA(0))
+        assert spec.is_frozen()
+        self.assertRaises(FrozenSpecError, setattr, spec, 'field', 2)
+        self.assertRaises(FrozenSpecError, delattr, spec, 'spec_a')
+        self.assertRaises(FrozenSpecError, spec.inplace_bind, 0)
+
+        # Attributes that are not fields can still be set
+        spec.something = 1
+        digest = spec.digest
+        assert spec.__dict__['_digest'] is digest
+
+        replaced = spec.replace(field=2)
+        assert replaced.is_frozen() and replaced.field == 2 and spec.field == 1
+        assert replaced.digest != digest
+        assert replaced == FrozenSpec(2, spec_a=SpecA(0))
+
+        bound = spec.bind(3)
+        assert bound.is_frozen() and bound.unbound == 3 and spec.unbound is FrozenSpec.unbound
+
+        assert spec == Spec.dict2spec(spec.to_dict())
+        assert Spec.dict2spec(spec.to_dict()).is_frozen()
+
+    def test_intern(self):
+        for spec in self.instances:
+            interned = Spec.dict2spec(spec.to_dict(), intern=True)
+            assert interned == spec
+            assert interned.intern() is interned
+            assert Spec.key2spec(spec.key, intern=True) is interned
+
+        specs = [SpecC([SpecB(spec_a=SpecA(0)), SpecA(i)]) for i in xrange(3)]
+        specs = [Spec.dict2spec(spec.to_dict(), intern=True) for spec in specs]
+        assert len(set(id(spec.spec_list[0]) for spec in specs)) == 1
+        assert specs[0].spec_list[0].spec_a is SpecB(spec_a=SpecA(0)).intern().spec_a
+
+        # The digest is still invalidated along subspecs
+        spec = SpecC([SpecB(spec_a=SpecA(100))]).intern()
+        digest = spec.digest
+        spec.spec_list[0].spec_a.field2 = 1
+        assert spec.digest != digest
+        assert SpecA(100).intern() is not spec.spec_list[0].spec_a
+
+        # The receiver is not modified, a copy with the interned subspecs is interned instead
+        spec = SpecB(spec_a=SpecA(0))
+        spec_a = spec.spec_a
+        interned = spec.intern()
+        assert spec.spec_a is spec_a and interned.spec_a is not spec_a
+        assert interned.spec_a is SpecA(0).intern()
+
+        # Non serialized fields are not part of the digest, specs with values there are not interned
+        verbose = SpecA(200, verbose=True)
+        assert verbose.intern() is verbose and SpecA(200).intern() is not verbose
+        spec = SpecB(spec_a=verbose)
+        assert spec.intern() is spec and spec.intern().spec_a.verbose
+
+    def test_dicts2specs(self):
+        dicts = [spec.to_dict() for spec in self.instances] * 2
+
+        for pool in None, ThreadPool(2):
+            specs = list(Spec.dicts2specs(iter(dicts), pool=pool, chunk_size=3))
+            assert specs == self.instances * 2
+
+            if pool is None:
+                # Equal subspecs are decoded once (within each chunk when using a pool)
+                spec_as = [spec.spec_a for spec in specs if isinstance(spec, SpecB)]
+                assert spec_as[0] is spec_as[2]
+
+            errors = []
+            specs = list(Spec.dicts2specs(
+                [{'type': 'SpecA'}] + dicts, pool=pool, on_error=lambda d, e: errors.append(d)
+            ))
+            assert specs == self.instances * 2
+            assert errors == [{'type': 'SpecA'}]
+
+            self.assertRaises(KeyError, list, Spec.dicts2specs([{'type': 'SpecA'}], pool=pool))
+
+    def test_trusted_decoding(self):
+        instances = self.instances + [
+            classes[type(spec)]._from_dict(spec.to_dict())
+            for classes in (compiled_classes, compact_classes) for spec in self.instances
+        ]
+        instances.append(FrozenSpec(1, spec_a=SpecA(0), unbound=2))
+
+        for spec in instances:
+            spec_dict = spec.to_dict()
+            trusted = Spec.dict2spec(spec_dict, trusted=True)
+            assert trusted == spec and type(trusted) is type(spec)
+            assert trusted.to_dict(include_all=True) == Spec.dict2spec(spec_dict).to_dict(include_all=True)
+            assert trusted.is_frozen() == spec.is_frozen()
+
+        assert list(Spec.dicts2specs([e.to_dict() for e in instances], trusted=True)) == instances
+
+        # The values are not validated
+        spec_dict = SpecB(spec_a=SpecA(0)).to_dict()
+        spec_dict['spec_a'] = AnotherSpec([]).to_dict()
+        self.assertRaises(InvalidSpecInstance, Spec.dict2spec, spec_dict)
+        assert isinstance(Spec.dict2spec(spec_dict, trusted=True).spec_a, AnotherSpec)
+
+        # But wrong arguments are still reported
+        spec_dict = {'type': 'SpecA', 'field1': 1, 'other': 2}
+        self.assertRaises(InvalidSpecInstance, Spec.dict2spec, spec_dict, trusted=True)
+        self.assertRaises(KeyError, Spec.dict2spec, {'type': 'SpecA'}, trusted=True)
+
+    def test_decode_collection(self):
+        for spec_c_cls, spec_d_cls in (SpecC, SpecD), (compiled_classes[SpecC], compiled_classes[SpecD]):
+            spec = spec_c_cls([SpecA(i) for i in xrange(10 ** 4)])
+            assert Spec.dict2spec(spec.to_dict()) == spec
+
+            spec = spec_d_cls(1, [SpecA(1), {'a': SpecA(2)}], x={'y': 'z'})
+            loaded = Spec.dict2spec(json.loads(json.dumps(spec.to_dict())))
+            assert loaded.the_args == (1, [SpecA(1), {'a': SpecA(2)}])
+            assert loaded.the_kwargs == {'x': {'y': 'z'}}
+
+            # Errors while loading the specs are not hidden anymore
+            bad_dict = {'type': spec_c_cls.get_type_path(), 'spec_list': [{'type': 'SpecA'}]}
+            self.assertRaises(KeyError, Spec.dict2spec, bad_dict)
+
+            # Plain dicts can have a type key
+            values = [{'type': 'car', 'wheels': 4}, {'type': 'fito.specs.base:get_import_path'}, {'type': 1, 'a': {'type': None}}]
+            spec = spec_d_cls(values, SpecA(1), x=values[0])
+            loaded = Spec.dict2spec(spec.to_dict())
+            assert loaded.the_args == (values, SpecA(1)) and loaded.the_kwargs == {'x': values[0]}
+            assert loaded == spec
+
     def test_hasheable(self):
         d = {}
         for i, spec in enumerate(self.instances):
@@ -184,6 +347,38 @@ class TestSpec(unittest.TestCase):
         for spec in self.instances:
             assert spec.to_dict() == spec.copy().to_dict()
 
+        # Copies are deep
+        spec = SpecC([SpecB(spec_a=SpecA(0))])
+        copy = spec.copy()
+        assert copy == spec and copy.spec_list[0] is not spec.spec_list[0]
+        copy.spec_list[0].spec_a.field1 = 1
+        copy.spec_list.append(SpecA(1))
+        assert spec == SpecC([SpecB(spec_a=SpecA(0))])
+
+        spec = SpecD(4, SpecA(1), a=SpecA(2))
+        assert spec.copy() == spec and spec.copy().the_kwargs['a'] is not spec.the_kwargs['a']
+
+        # Replaced copies share the subspecs but not the collections
+        spec = SpecB(spec_a=SpecA(0))
+        assert spec.replace(spec_a=SpecA(1)).spec_a != spec.spec_a
+
+        spec = SpecC([SpecB(spec_a=SpecA(0))])
+        replaced = spec.replace()
+        assert replaced.spec_list[0] is spec.spec_list[0] and replaced.spec_list is not spec.spec_list
+        replaced.spec_list.append(SpecA(1))
+        assert len(spec.spec_list) == 1
+
+    def test_vary(self):
+        spec = SpecB(spec_a=SpecA(0))
+        spec_as = [SpecA(i) for i in xrange(3)]
+        assert list(spec.vary(spec_a=spec_as)) == [SpecB(spec_a=spec_a) for spec_a in spec_as]
+
+        varied = list(SpecA(0).vary(field2=[1, 2], field1=[3, 4]))
+        assert [(e.field1, e.field2) for e in varied] == [(3, 1), (3, 2), (4, 1), (4, 2)]
+        assert all(e.func is general_append for e in varied)
+
+        self.assertRaises(InvalidSpecInstance, spec.vary, spec_a=[SpecA(0), 1])
+
     def test_replace(self):
         for spec in self.instances:
             for field_name, field_spec in spec.get_fields():
@@ -210,10 +405,70 @@ class TestSpec(unittest.TestCase):
         for spec in self.instances:
             assert spec.to_dict() == Spec.key2spec(spec.key).to_dict()
 
+    def test_json_encoding(self):
+        # fito doesn't patch the json module anymore
+        assert json.dumps.__module__ == 'json' and json.loads.__module__ == 'json'
+        self.assertRaises(TypeError, json.dumps, datetime(2017, 1, 1))
+
+        class UTCMinus3(tzinfo):
+            def utcoffset(self, dt): return timedelta(hours=-3)
+
+            def dst(self, dt): return timedelta(0)
+
+        spec = SpecA(1, datetime(2017, 1, 1, 12, 30, 15, 500000))
+        assert Spec.key2spec(spec.key) == spec
+        assert SpecA(1, datetime(2017, 1, 1, 9, 30, 15, 500000, tzinfo=UTCMinus3())).key == spec.key
+        assert Spec.from_json().loads(spec.json.dumps()) == spec
+
+        spec = SpecA(1, [SpecA, general_append])
+        assert Spec.key2dict(spec.key)['field2'] == ['import test_spec:SpecA', 'import fito.specs.utils:general_append']
+
+        # ObjectIds and the other ways of writing datetimes in extended json
+        oid = ObjectId('5a0c3bdf9c3a4a1c1e9b5b8e')
+        assert json_encoding.loads(json_encoding.dumps({'a': oid}))['a'] == oid
+        assert json_encoding.loads('{"$date": "2017-01-01T12:00:00Z"}') == datetime(2017, 1, 1, 12)
+        assert json_encoding.loads('{"$date": {"$numberLong": "1483272000000"}}') == datetime(2017, 1, 1, 12)
+
+    def test_recursive_map(self):
+        value = [[1], {'some': 3, 'stuff': (10, [20])}, tuple(xrange(1000))]
+        expected = [[2], {'some': 4, 'stuff': (11, [21])}, tuple(xrange(1, 1001))]
+        assert recursive_map(value, lambda x: x + 1 if isinstance(x, int) else x) == expected
+
+        class Incr(object):
+            def __call__(self, k, v):
+                return v + k if isinstance(v, int) else v
+
+        assert recursive_map([[1], {2: 3, 5: 10}], Incr()) == [[1], {2: 5, 5: 15}]
+        assert recursive_map(OrderedDict([('a', 1)]), lambda x: x + 1) == OrderedDict([('a', 2)])
+
+        # Collections that only hold identity types are copied
+        value = [[1, 2], {'a': 'b'}]
+        res = recursive_map(value, lambda x: 1 / 0 if isinstance(x, int) else x, identity_types=(int, str))
+        assert res == value and res[0] is not value[0] and res[1] is not value[1]
+        self.assertRaises(RuntimeError, recursive_map, [1], lambda: 1)
+
     def test_type2spec_class(self):
         assert Spec == Spec.type2spec_class('fito:Spec')
         assert Spec == Spec.type2spec_class('fito.specs.base:Spec')
 
+    def test_registry(self):
+        assert registry.get_by_path('test_spec:SpecA') is SpecA
+        assert Spec.type2spec_class('SpecA') is SpecA
+        assert Spec.type2spec_class('fito:Spec') is Spec
+        assert registry.get_by_path('fito:Spec') is Spec
+
+        first = type('Duplicated', (Spec,), {'__module__': 'first_module'})
+        assert Spec.type2spec_class('Duplicated') is first
+
+        second = type('Duplicated', (Spec,), {'__module__': 'second_module'})
+        self.assertRaises(AmbiguousSpecName, Spec.type2spec_class, 'Duplicated')
+        assert registry.get_by_path('first_module:Duplicated') is first
+        assert registry.get_by_path('second_module:Duplicated') is second
+
+        second.__module__ = 'third_module'
+        assert registry.get_by_path('second_module:Duplicated') is None
+        assert registry.get_by_path('third_module:Duplicated') is second
+
     def test_serialize(self):
         s = SpecA(0, verbose=True)
         assert 'verbose' not in s.to_dict()
@@ -221,6 +476,107 @@ class TestSpec(unittest.TestCase):
         assert Spec.dict2spec(s.to_dict()) == s
         assert Spec.dict2spec(s.to_dict(include_all=True)) == s
 
+    def test_field_table(self):
+        for spec in self.instances:
+            cls = type(spec)
+            fields = [(k, getattr(cls, k)) for k in dir(cls) if isinstance(getattr(cls, k), Field)]
+            assert list(cls.get_fields()) == fields
+
+        class SpecE(Spec):
+            a = PrimitiveField(0)
+
+        assert [k for k, _ in SpecE.get_fields()] == ['a']
+
+        # Fields set after the class was created must be picked up, also by subclasses
+        class SpecF(SpecE): pass
+
+        SpecE.b = PrimitiveField(1, default=2)
+        assert SpecF(1).b == 2
+        assert [k for k, _ in SpecF.get_bound_fields()] == ['a', 'b']
+
+        del SpecE.b
+        self.assertRaises(InvalidSpecInstance, SpecF, 1, 2)
+
+    def test_compiled(self):
+        for spec in self.instances:
+            cls = type(spec)
+            compiled_cls = compiled_classes[cls]
+            assert compiled_cls._compiled is not None
+
+            for include_all in True, False:
+                spec_dict = spec.to_dict(include_all=include_all)
+                compiled_spec = compiled_cls._from_dict(spec_dict)
+
+                compiled_spec_dict = compiled_spec.to_dict(include_all=include_all)
+                assert compiled_spec_dict.pop('type') != spec_dict.pop('type')
+                assert compiled_spec_dict == spec_dict
+
+        calls = [
+            (SpecA, (), {}),
+            (SpecA, (0, 1, 2), {}),
+            (SpecA, (), {'field1': 1, 'field2': 2, 'field3': 3}),
+            (SpecA, (), {'param': 0}),
+            (SpecA, ('a',), {}),
+            (AnotherSpec, (1,), {}),
+            (SpecB, (), {'spec_a': AnotherSpec([])}),
+            (SpecB, (1,), {}),
+            (SpecB, (), {'spec_a': 1}),
+            (SpecC, (), {'a': SpecA(1)}),
+            (SpecC, ([1],), {}),
+            (SpecD, (1, 2), {'a': 1, 'the_args': 3}),
+        ]
+        for cls, args, kwargs in calls:
+            try:
+                cls(*args, **kwargs)
+                expected = None
+            except Exception, e:
+                expected = type(e), e.args[0].replace(cls.__name__, '')
+
+            try:
+                compiled_classes[cls](*args, **kwargs)
+                received = None
+            except Exception, e:
+                received = type(e), e.args[0].replace('Compiled' + cls.__name__, '')
+
+            assert expected == received
+
+        # Loading builds the specs without the constructor, invalid values are still rejected
+        for cls, spec_dict in [(SpecA, {'field1': 'a'}), (SpecB, {'spec_a': AnotherSpec([]).to_dict()})]:
+            for klass in cls, compiled_classes[cls]:
+                self.assertRaises(InvalidSpecInstance, klass._from_dict, dict(spec_dict, type=klass.get_type_path()))
+
+    def test_compact(self):
+        for spec in self.instances + [compiled_classes[SpecA](1, 2)]:
+            compact_cls = compact_classes[type(spec)]
+            compact_spec = compact_cls._from_dict(spec.to_dict(include_all=True))
+            assert compact_spec == Spec.dict2spec(compact_spec.to_dict())
+            assert pickle.loads(pickle.dumps(compact_spec, 2)) == compact_spec
+
+            spec_dict = spec.to_dict()
+            compact_spec_dict = compact_spec.to_dict()
+            assert compact_spec_dict.pop('type') != spec_dict.pop('type')
+            assert compact_spec_dict == spec_dict
+
+        spec_a = compact_classes[SpecA](0)
+        assert spec_a.field2 is None and type(spec_a).field2 is SpecA.field2
+        assert hash(spec_a) == hash(spec_a.copy()) and spec_a.intern() is spec_a
+
+        # The instance dict is never allocated
+        assert not any(type(e) is dict for e in gc.get_referents(spec_a))
+
+        spec_b = SpecB(spec_a=spec_a)
+        digest = spec_b.digest
+        spec_a.field1 = 1
+        assert spec_b.digest != digest
+        assert spec_b == SpecB(spec_a=compact_classes[SpecA](1))
+
+        spec = compact_classes[FrozenSpec](1, spec_a=spec_a)
+        self.assertRaises(FrozenSpecError, setattr, spec, 'field', 2)
+        assert spec.unbound is FrozenSpec.unbound
+        bound = spec.bind(3)
+        assert bound.is_frozen() and bound.unbound == 3
+        assert pickle.loads(pickle.dumps(bound)).is_frozen()
+
     def test_empty_load(self):
         assert SpecWithDefault() == Spec.dict2spec({'type': 'SpecWithDefault'})
 
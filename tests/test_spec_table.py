@@ -0,0 +1,86 @@
+import tempfile
+import unittest
+
+from fito.data_store.dict_ds import DictDataStore
+from fito.data_store.file import FileDataStore
+from fito.specs.table import SpecTable
+from test_data_store import delete
+from test_spec import SpecA, SpecB
+
+
+class TestSpecTable(unittest.TestCase):
+    def setUp(self):
+        self.specs = [SpecB(spec_a=SpecA(i, j)) for i in xrange(4) for j in xrange(3)]
+        self.specs.append(SpecA(0, [1, 2]))
+
+    def test_columns(self):
+        table = SpecTable.from_specs(self.specs)
+        assert len(table) == len(self.specs)
+        assert table.ids == self.specs
+
+        # Subspecs are flattened into dotted paths, and fields that a row doesn't have are missing
+        assert table.column('spec_a.field1') == [spec.spec_a.field1 for spec in self.specs[:-1]] + [None]
+        assert table.column('field2', default=-1) == [-1] * 12 + [[1, 2]]
+        assert table.row(3) == {
+            'type': 'test_spec:SpecB', 'spec_a.type': 'test_spec:SpecA', 'spec_a.field1': 1, 'spec_a.field2': 0,
+            'spec_a.func': self.specs[3].spec_a.to_dict()['func']
+        }
+
+        # Values are dictionary encoded
+        assert len(table['spec_a.field2'].values) == 3
+        assert len(table['type'].values) == 2
+
+    def test_varying_fields(self):
+        table = SpecTable.from_specs(self.specs[:-1])
+        assert sorted(table.varying_fields()) == ['spec_a.field1', 'spec_a.field2']
+        assert sorted(table.constant_fields()) == ['spec_a.func', 'spec_a.type', 'type']
+
+        # Agrees with Spec.diff
+        for spec in self.specs[1:-1]:
+            diff = spec.diff(self.specs[0])
+            changed = {d.field + '.' + k for d in diff.subdiffs if d.field for k in d.changed_fields}
+            assert changed and changed <= set(table.varying_fields())
+
+        table = SpecTable.from_specs(self.specs)
+        assert 'type' in table.varying_fields()
+        assert 'field1' in table.varying_fields()
+
+    def test_group_by(self):
+        table = SpecTable.from_specs(self.specs)
+        groups = table.group_by('spec_a.field2')
+        assert groups.keys() == [(0,), (1,), (2,), (None,)]
+        assert groups[(1,)] == [1, 4, 7, 10]
+
+        groups = table.group_by('spec_a.field1', 'spec_a.field2')
+        assert len(groups) == 13
+        assert groups[(3, 2)] == [11]
+
+        assert table.where(**{'spec_a.field2': 1}) == [1, 4, 7, 10]
+        assert table.where(**{'spec_a.field2': 1, 'spec_a.field1': 2}) == [7]
+        assert table.where(field2=[1, 2]) == [12]
+        assert table.where(field2=5) == []
+
+        sub_table = table.take(table.where(**{'spec_a.field2': 1}))
+        assert sub_table.ids == [self.specs[i] for i in 1, 4, 7, 10]
+        assert sub_table.varying_fields() == ['spec_a.field1']
+
+    def test_data_stores(self):
+        path = tempfile.mktemp()
+        try:
+            for ds in DictDataStore(), FileDataStore(path):
+                for i, spec in enumerate(self.specs):
+                    ds[spec] = i * 10
+
+                table = SpecTable.from_data_store(ds, results='score')
+                assert len(table) == len(self.specs)
+
+                scores = table.column('score')
+                assert scores == [ds[id] for id in table.ids]
+                assert sorted(scores) == range(0, 10 * len(self.specs), 10)
+
+                totals = {
+                    values: sum(scores[i] for i in rows) for values, rows in table.group_by('spec_a.field1').iteritems()
+                }
+                assert max(totals, key=totals.get) == (3,)
+        finally:
+            delete(path)